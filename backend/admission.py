@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Any, List, Callable, Iterable, Generator, Optional
+
+# Admission control for agent turns.
+# Each turn is admitted against a global and a per-user concurrency limit; turns
+# that can't start yet wait in a bounded FIFO queue (and are told their position),
+# and once the queue is full new turns are shed immediately with a clear error.
+# Limits are per worker process.
+MAX_ACTIVE_TURNS = int(os.getenv("AGENT_MAX_ACTIVE_TURNS", "8"))
+MAX_ACTIVE_TURNS_PER_USER = int(os.getenv("AGENT_MAX_ACTIVE_TURNS_PER_USER", "2"))
+MAX_QUEUED_TURNS = int(os.getenv("AGENT_MAX_QUEUED_TURNS", "16"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "30"))
+# Per-turn work limits, enforced by the agent loop
+MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "8"))
+MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "12"))
+
+# How often a waiting turn re-reports its queue position
+_POSITION_INTERVAL_SECONDS = 5.0
+
+
+def client_key(headers, host: Optional[str]) -> str:
+    """
+    Identifies the "user" for per-user limits: an explicit X-Client-Id header,
+    else the first X-Forwarded-For hop (nginx), else the peer address.
+    """
+    explicit = headers.get("x-client-id")
+    if explicit:
+        return explicit
+    forwarded = headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return host or "anonymous"
+
+
+def _event(event_type: str, content: str, **data) -> str:
+    event = {"type": event_type, "content": content}
+    if data:
+        event["data"] = data
+    return json.dumps(event) + "\n"
+
+
+class _Ticket:
+    def __init__(self, user: str):
+        self.user = user
+        self.admitted = False
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Global + per-user semaphore with a bounded FIFO wait queue."""
+
+    def __init__(self, max_active: int, max_per_user: int, max_queued: int):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queue: List[_Ticket] = []
+        self._active = 0
+        self._per_user: Dict[str, int] = {}
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def _can_start(self, ticket: _Ticket) -> bool:
+        return self._active < self.max_active and self._per_user.get(ticket.user, 0) < self.max_per_user
+
+    def _dispatch(self):
+        """
+        Admit waiting tickets in arrival order. A user already at their own limit
+        is skipped rather than blocking everyone queued behind them.
+        """
+        for ticket in list(self._queue):
+            if self._active >= self.max_active:
+                break
+            if self._can_start(ticket):
+                self._queue.remove(ticket)
+                self._start(ticket)
+        self._cond.notify_all()
+
+    def _start(self, ticket: _Ticket):
+        ticket.admitted = True
+        self._active += 1
+        self._per_user[ticket.user] = self._per_user.get(ticket.user, 0) + 1
+        self.admitted += 1
+
+    def _enqueue(self, user: str) -> Optional[_Ticket]:
+        """A ticket (admitted or queued), or None if the queue is full."""
+        ticket = _Ticket(user)
+        with self._cond:
+            # Waiting tickets of users at their own limit don't hold this one back
+            self._queue.append(ticket)
+            self._dispatch()
+            if not ticket.admitted and len(self._queue) > self.max_queued:
+                self._queue.remove(ticket)
+                self.shed += 1
+                return None
+            return ticket
+
+    def _leave(self, ticket: _Ticket):
+        with self._cond:
+            if ticket.admitted:
+                self._active -= 1
+                remaining = self._per_user.get(ticket.user, 1) - 1
+                if remaining:
+                    self._per_user[ticket.user] = remaining
+                else:
+                    self._per_user.pop(ticket.user, None)
+            elif ticket in self._queue:
+                self._queue.remove(ticket)
+            self._dispatch()
+
+    def run(self, user: str, stream: Callable[[], Iterable[str]]) -> Generator[str, None, None]:
+        """
+        Yields queue-position status events until the turn is admitted, then the
+        turn's own events. Shed or timed-out turns get a single error event.
+        """
+        ticket = self._enqueue(user)
+        if ticket is None:
+            yield _event("error", "The assistant is at capacity right now. Please try again in a minute.",
+                         reason="overloaded")
+            return
+        try:
+            deadline = ticket.enqueued_at + QUEUE_TIMEOUT_SECONDS
+            last_position, last_report = None, 0.0
+            while True:
+                with self._cond:
+                    if ticket.admitted:
+                        break
+                    position = self._queue.index(ticket) + 1
+                now = time.monotonic()
+                if now >= deadline:
+                    with self._cond:
+                        admitted = ticket.admitted
+                        if not admitted:
+                            self.timed_out += 1
+                    if not admitted:
+                        yield _event("error", "Timed out waiting for a free slot. Please try again.",
+                                     reason="queue_timeout")
+                        return
+                    break
+                if position != last_position or now - last_report >= _POSITION_INTERVAL_SECONDS:
+                    yield _event("status", f"Waiting in queue (position {position})...", queue_position=position)
+                    last_position, last_report = position, now
+                with self._cond:
+                    if not ticket.admitted:
+                        self._cond.wait(timeout=min(1.0, deadline - now))
+            yield from stream()
+        finally:
+            self._leave(ticket)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._queue),
+                "active_users": len(self._per_user),
+                "admitted_total": self.admitted,
+                "shed_total": self.shed,
+                "timed_out_total": self.timed_out,
+                "limits": {
+                    "max_active": self.max_active,
+                    "max_active_per_user": self.max_per_user,
+                    "max_queued": self.max_queued,
+                    "queue_timeout_seconds": QUEUE_TIMEOUT_SECONDS,
+                    "max_iterations": MAX_ITERATIONS,
+                    "max_tool_calls": MAX_TOOL_CALLS,
+                },
+            }
+
+
+CONTROLLER = AdmissionController(MAX_ACTIVE_TURNS, MAX_ACTIVE_TURNS_PER_USER, MAX_QUEUED_TURNS)
@@ -1,9 +1,17 @@
 import os
 import json
-from typing import List, Dict, Any, Generator
+import time
+from typing import List, Dict, Any, Generator, Optional
 from openai import OpenAI
 from dotenv import load_dotenv
 from skills_google import AVAILABLE_TOOLS, execute_tool_call
+import model_router
+import memory
+import admission
+import intent_router
+import answer_cache
+import mutation_queue
+import token_ledger
 
 load_dotenv()
 
@@ -17,53 +25,149 @@ Your demeanor is professional, efficient, and slightly mysterious (like a "Time
 You have access to tools to manage the user's calendar.
 
 Capabilities:
-1. You ALWAYS check the current date/time first if the user request involves relative time (tomorrow, next week, specific day of the week).
+1. If the user request involves relative dates (tomorrow, next week, "the Tuesday after next"), call 'resolve_dates' once with all of them instead of computing dates yourself; use 'get_current_datetime' when you need the current time.
 2. You confirm actions clearly.
 3. If a user asks about "next Sunday" or "this weekend", use 'list_events_range' or 'search_events' to see the relevant days at once instead of calling 'list_events' repeatedly.
 4. You can INVITE people to events by using the 'attendees' parameter (a list of emails) in 'schedule_event' or 'update_event'. 
 5. You can set granular DURATIONS for events using 'duration_minutes' (e.g., 15, 30, 45). Default is 60.
 6. If a tool fails, explain why and ask for clarification.
+7. 'schedule_event' and 'update_event' check for overlapping events themselves, so you do not need to list events first. If they report a conflict, tell the user and only retry with 'allow_conflicts' if they confirm.
+8. Events are referenced by the short code in [brackets] in skill results; pass that code as 'event_id'. Times in results are local (CST).
+9. For questions about how time is spent (hours of meetings per week, busiest days or hours, time with a person), call 'analyze_time' once over the whole period rather than listing events and adding them up.
+10. To find past or future events by keyword or person ("when did I last meet Priya?", "when is my next dentist appointment?"), call 'search_events' with 'query' and/or 'attendee'; use a negative 'days_range' for the past.
 
 Style:
 - Be concise.
 - Use "Time is of the essence" or similar subtle time-related metaphors occasionally.
 """
 
-def run_agent_stream(message_history: List[Dict[str, str]]) -> Generator[str, None, None]:
+def _complete(messages: List[Any], tier: str, stats: model_router.TierStats):
+    """Runs one chat completion on the given tier and records its latency/tokens."""
+    model = model_router.model_for(tier)
+    started = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=AVAILABLE_TOOLS,
+        tool_choice="auto"
+    )
+    stats.record(tier, model, time.perf_counter() - started, getattr(response, "usage", None))
+    return response
+
+def run_agent_stream(message_history: List[Dict[str, str]], session_id: Optional[int] = None,
+                     turn_id: Optional[str] = None, user: Optional[str] = None) -> Generator[str, None, None]:
     """
     Runs the agent loop. Yields chunks of data to the frontend.
     Data format yielded: JSON string labeled with type.
     e.g., {"type": "thought", "content": "..."} or {"type": "answer", "content": "..."}
+    session_id, if given, is the chat session that hears about calendar writes
+    that fail after being acknowledged (write-behind mode); token usage is
+    recorded against session_id/turn_id/user and checked against their budgets.
     """
-    
-    # Prepend System Prompt
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + message_history
+    # Formulaic read requests are answered without the LLM
+    fast_path = intent_router.try_answer(message_history)
+    if fast_path is not None:
+        yield from fast_path
+        return
+
+    # Repeated read-only questions replay an earlier turn while the calendar is unchanged
+    cache_key = answer_cache.key_for(message_history)
+    cached = answer_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        yield from answer_cache.replay(cached)
+        return
+
+    # Token budgets only apply from here on; the answers above cost no tokens
+    budget = token_ledger.check(session_id, user)
+    if budget.refusal:
+        yield json.dumps({"type": "error", "content": budget.refusal}) + "\n"
+        return
+    if budget.compact:
+        message_history = memory.trim_history(message_history, token_ledger.TOKEN_COMPACT_KEEP_MESSAGES)
+        yield json.dumps({"type": "status", "content": "Long conversation: sending only the most recent messages"}) + "\n"
+
+    # Per-turn model usage, reported to the client at the end of the turn
+    turn_stats = model_router.TierStats()
+    try:
+        events = _agent_loop(message_history, turn_stats, session_id)
+        if cache_key:
+            events = answer_cache.recording(cache_key, events)
+        yield from events
+        yield json.dumps({
+            "type": "metrics",
+            "content": "Model usage",
+            "data": turn_stats.to_dict()
+        }) + "\n"
+    finally:
+        model_router.GLOBAL_STATS.merge(turn_stats)
+        token_ledger.record_turn(session_id, turn_id, user, turn_stats)
+
+def _build_prompt(message_history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    System prompt + (optional) recalled memory + recent history.
+    With memory enabled only a fixed-size tail of the conversation is sent;
+    older context comes back through retrieval instead.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if not memory.MEMORY_ENABLED:
+        return messages + message_history
+
+    history = memory.trim_history(message_history)
+    try:
+        note = memory.recall(history)
+    except Exception as e:
+        print(f"Memory recall failed: {e}")
+        note = None
+    if note:
+        messages.append({"role": "system", "content": note})
+    return messages + history
+
+def _agent_loop(message_history: List[Dict[str, str]], turn_stats: model_router.TierStats,
+                session_id: Optional[int] = None) -> Generator[str, None, None]:
+    # Prepend System Prompt (and any recalled memory)
+    messages = _build_prompt(message_history)
+    last_tool_failed = False
+    after_tools = False
+    tool_call_count = 0
 
-    while True:
+    for _ in range(admission.MAX_ITERATIONS):
         # 1. Ask LLM
         # We don't stream the LLM response *internally* here for simplicity of logic in v1,
         # but we stream the *process* to the frontend.
         
         # Yield status
         yield json.dumps({"type": "status", "content": "Thinking..."}) + "\n"
+
+        # Tool routing runs on the fast tier; answers, tool failures and ambiguous requests go to the strong tier
+        tier = model_router.choose_tier(message_history, last_tool_failed, after_tools)
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-5-mini",
-                messages=messages,
-                tools=AVAILABLE_TOOLS,
-                tool_choice="auto"
-            )
+            response = _complete(messages, tier, turn_stats)
+            response_message = response.choices[0].message
+
+            if model_router.should_escalate(tier, response_message):
+                # Final answers (or garbled tool calls) are redone by the stronger model
+                turn_stats.record_escalation()
+                tier = model_router.STRONG_TIER
+                yield json.dumps({"type": "status", "content": "Escalating to a stronger model..."}) + "\n"
+                response = _complete(messages, tier, turn_stats)
+                response_message = response.choices[0].message
         except Exception as e:
             yield json.dumps({"type": "error", "content": str(e)}) + "\n"
             return
-
-        response_message = response.choices[0].message
         
         # 2. Check if tool call
         tool_calls = response_message.tool_calls
         
+        if tool_calls and tool_call_count + len(tool_calls) > admission.MAX_TOOL_CALLS:
+            yield json.dumps({
+                "type": "error",
+                "content": f"Stopped: this request needed more than {admission.MAX_TOOL_CALLS} skill calls."
+            }) + "\n"
+            return
+
         if tool_calls:
+            tool_call_count += len(tool_calls)
             # Yield thought/action to UI
             # IMPORTANT: We must send this to the frontend explicitly so it can be added to history
             assistant_msg = response_message.model_dump()
@@ -78,6 +182,8 @@ def run_agent_stream(message_history: List[Dict[str, str]]) -> Generator[str, No
             }) + "\n"
 
             messages.append(response_message) # Add assistant's "intent" to history
+            last_tool_failed = False
+            after_tools = True
             
             for tool_call in tool_calls:
                 function_name = tool_call.function.name
@@ -90,7 +196,10 @@ def run_agent_stream(message_history: List[Dict[str, str]]) -> Generator[str, No
                 }) + "\n"
                 
                 # Execute Tool
-                function_response = execute_tool_call(function_name, function_args)
+                with mutation_queue.reporting_to(session_id):
+                    function_response = execute_tool_call(function_name, function_args)
+                if model_router.is_tool_failure(function_response):
+                    last_tool_failed = True
                 
                 yield json.dumps({
                     "type": "log",
@@ -121,4 +230,10 @@ def run_agent_stream(message_history: List[Dict[str, str]]) -> Generator[str, No
             # 3. Final Answer
             final_content = response_message.content
             yield json.dumps({"type": "answer", "content": final_content}) + "\n"
-            break
+            return
+
+    # Runaway tool loop: out of iterations without a final answer
+    yield json.dumps({
+        "type": "error",
+        "content": f"Stopped after {admission.MAX_ITERATIONS} steps without finishing. Please try a more specific request."
+    }) + "\n"
@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Generator
+import calendar_cache
+import intent_router
+
+# Replay cache for whole agent turns that only read the calendar.
+# Key: normalized user message + today's date (CST) + calendar version stamp, so
+# any mutation (here or in another worker) or upstream change seen by a fetch
+# makes old entries unreachable. Entries also expire with the calendar cache TTL,
+# so a hit is never staler than a calendar-cache read would be.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(calendar_cache.CALENDAR_CACHE_TTL)))
+
+# Calendar reads. resolve_dates is allowed alongside them (the key is per-day);
+# get_current_datetime is not, since a replay would report a stale time.
+CALENDAR_READ_TOOLS = {"list_events", "list_events_range", "search_events", "analyze_time"}
+READ_TOOLS = CALENDAR_READ_TOOLS | {"resolve_dates"}
+# Per-turn events that must not be replayed
+_SKIPPED_EVENTS = {"metrics", "status"}
+# Follow-ups depend on earlier messages, which are not part of the key
+_FOLLOW_UP_RE = re.compile(r"^(?:and|also|then|so|what about|how about|same|it|that|this one|those|them|instead)\b")
+
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+
+_entries: "OrderedDict[Tuple, Tuple[float, List[str]]]" = OrderedDict()
+_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def key_for(message_history: List[Dict[str, Any]]) -> Optional[Tuple]:
+    """Cache key for the turn answering the last user message, or None if not cacheable."""
+    if not ANSWER_CACHE_ENABLED or not message_history:
+        return None
+    last = message_history[-1]
+    if not isinstance(last, dict) or last.get("role") != "user" or not last.get("content"):
+        return None
+    normalized = intent_router.normalize(last["content"])
+    if not normalized or _FOLLOW_UP_RE.match(normalized):
+        return None
+    return _stamped(normalized)
+
+
+def _stamped(normalized: str) -> Optional[Tuple]:
+    today = datetime.datetime.now(CST).strftime("%Y-%m-%d")
+    try:
+        stamp = calendar_cache.version()
+    except Exception as e:
+        print(f"Answer cache disabled for this turn: {e}")
+        return None
+    return normalized, today, stamp
+
+
+def get(key: Tuple) -> Optional[List[str]]:
+    global hits, misses
+    with _lock:
+        entry = _entries.get(key)
+        if entry and time.time() - entry[0] <= ANSWER_CACHE_TTL:
+            _entries.move_to_end(key)
+            hits += 1
+            return entry[1]
+        if entry:
+            del _entries[key]
+        misses += 1
+        return None
+
+
+def _cacheable(lines: List[str]) -> bool:
+    """Only complete, error-free turns whose skill calls were all calendar reads."""
+    tools = set()
+    answered = False
+    for line in lines:
+        event = json.loads(line)
+        if event.get("type") == "error":
+            return False
+        if event.get("type") == "answer":
+            answered = True
+        if event.get("type") == "history_append":
+            for call in (event.get("data") or {}).get("tool_calls") or []:
+                tools.add(call["function"]["name"])
+    return answered and bool(tools & CALENDAR_READ_TOOLS) and tools <= READ_TOOLS
+
+
+def put(key: Tuple, lines: List[str]):
+    if not _cacheable(lines):
+        return
+    with _lock:
+        _entries[key] = (time.time(), lines)
+        _entries.move_to_end(key)
+        while len(_entries) > ANSWER_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+
+def recording(key: Optional[Tuple], events: Iterable[str]) -> Generator[str, None, None]:
+    """Passes a turn's events through and stores them under `key` if the turn qualifies."""
+    kept = []
+    for line in events:
+        if json.loads(line).get("type") not in _SKIPPED_EVENTS:
+            kept.append(line)
+        yield line
+    if key is None:
+        return
+    # Re-stamped now that the turn is done: if the calendar changed (or the day
+    # rolled over) while it ran, the answer may predate the change; don't keep it.
+    if _stamped(key[0]) == key:
+        put(key, kept)
+
+
+def replay(lines: List[str]) -> Generator[str, None, None]:
+    yield json.dumps({"type": "status", "content": "Answered from cache"}) + "\n"
+    yield from lines
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {"enabled": ANSWER_CACHE_ENABLED, "entries": len(_entries), "hits": hits, "misses": misses}
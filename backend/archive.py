@@ -0,0 +1,313 @@
+import os
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterator
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal, ChatSession, ChatMessage, ArchivedSession, incremental_vacuum, reserve_ids
+import memory
+import process_sync
+
+# Retention policy: sessions untouched for ARCHIVE_AFTER_DAYS leave the hot database
+# and are appended to a gzip'd NDJSON file per month (of last activity).
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(6 * 3600)))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "2000"))
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+
+# Archive files and the maintenance pass are shared by all worker processes
+ARCHIVE_FILE_LOCK = "chat-archive-files"
+MAINTENANCE_LOCK = "chat-maintenance"
+_stop = threading.Event()
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _archive_file_for(session: ChatSession) -> str:
+    month = (session.updated_at or session.created_at or datetime.utcnow()).strftime("%Y-%m")
+    return f"chats-{month}.ndjson.gz"
+
+
+def _serialize(session: ChatSession) -> Dict[str, Any]:
+    return {
+        "id": session.id,
+        "title": session.title,
+        "created_at": _iso(session.created_at),
+        "updated_at": _iso(session.updated_at),
+        "messages": [
+            {
+                "id": m.id,
+                "role": m.role,
+                "content": m.content,
+                "tool_call_id": m.tool_call_id,
+                "tool_calls": m.tool_calls,
+                "name": m.name,
+                "timestamp": _iso(m.timestamp),
+            }
+            for m in sorted(session.messages, key=lambda m: m.id)
+        ],
+    }
+
+
+def _append_records(filename: str, records: List[Dict[str, Any]]):
+    """Append records as a new gzip member (concatenated members are valid gzip)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, filename)
+    with process_sync.file_lock(ARCHIVE_FILE_LOCK):
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for record in records:
+                    gz.write((json.dumps(record) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def _read_record(filename: str, session_id: int) -> Optional[Dict[str, Any]]:
+    """Latest record for a session in an archive file (a session may be archived more than once)."""
+    path = os.path.join(ARCHIVE_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    found = None
+    needle = f'{{"id": {session_id},'
+    with process_sync.file_lock(ARCHIVE_FILE_LOCK), gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            # Cheap prefix test before paying for json.loads
+            if line.startswith(needle):
+                found = json.loads(line)
+    return found
+
+
+class _Bounded:
+    """Read-only view of the first `size` bytes of a file."""
+
+    def __init__(self, raw, size: int):
+        self.raw = raw
+        self.remaining = size
+
+    def read(self, n: int = -1) -> bytes:
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.raw.read(n)
+        self.remaining -= len(data)
+        return data
+
+
+def _record_id(line: str) -> Optional[int]:
+    # Records are written by _serialize, so "id" is always the first key
+    if not line.startswith('{"id": '):
+        return None
+    return int(line[7:line.index(",", 7)])
+
+
+def iter_archived_records(db: Session) -> Iterator[Dict[str, Any]]:
+    """
+    Latest archive record of every archived session, one at a time. Each file
+    is read twice (find the last copy of each record, then emit it), so memory
+    stays bounded by a single session rather than a whole file.
+    """
+    files = [row[0] for row in db.query(ArchivedSession.archive_file).distinct().order_by(ArchivedSession.archive_file)]
+    for filename in files:
+        wanted = {row[0] for row in db.query(ArchivedSession.id).filter(ArchivedSession.archive_file == filename)}
+        path = os.path.join(ARCHIVE_DIR, filename)
+        if not os.path.exists(path):
+            continue
+        # Files are append-only: reading up to the size seen under the lock
+        # never hits a half-written member, and the lock isn't held while
+        # the consumer (e.g. a slow download) works through the records.
+        with process_sync.file_lock(ARCHIVE_FILE_LOCK):
+            size = os.path.getsize(path)
+        latest: Dict[int, int] = {}
+        with open(path, "rb") as raw, gzip.open(_Bounded(raw, size), "rt", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                record_id = _record_id(line)
+                if record_id in wanted:
+                    latest[record_id] = line_no
+        keep = set(latest.values())
+        with open(path, "rb") as raw, gzip.open(_Bounded(raw, size), "rt", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if line_no in keep:
+                    yield json.loads(line)
+
+
+def archive_inactive_sessions(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                              batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move sessions inactive for `older_than_days` into monthly archive files.
+    The file is written (and fsync'd) before the rows are deleted, so a crash
+    can at worst leave a duplicate archive record, never lose a session.
+    Returns the number of sessions archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        # Chat tables are AUTOINCREMENT, so archived ids are never reused by new rows
+        sessions = db.query(ChatSession).filter(
+            ChatSession.updated_at < cutoff
+        ).order_by(ChatSession.updated_at).limit(batch_size).all()
+        if not sessions:
+            return total
+
+        by_file: Dict[str, List[ChatSession]] = {}
+        for session in sessions:
+            by_file.setdefault(_archive_file_for(session), []).append(session)
+
+        for filename, group in by_file.items():
+            _append_records(filename, [_serialize(s) for s in group])
+            for session in group:
+                db.merge(ArchivedSession(
+                    id=session.id,
+                    title=session.title,
+                    created_at=session.created_at,
+                    updated_at=session.updated_at,
+                    message_count=len(session.messages),
+                    archive_file=filename,
+                    archived_at=datetime.utcnow(),
+                ))
+                db.delete(session)
+        db.commit()
+        total += len(sessions)
+
+
+def rehydrate_session(db: Session, session_id: int) -> bool:
+    """Restore an archived session (with its original ids) into the hot database."""
+    stub = db.query(ArchivedSession).filter(ArchivedSession.id == session_id).first()
+    if not stub:
+        return False
+    record = _read_record(stub.archive_file, session_id)
+    if not record:
+        print(f"Archive record for session {session_id} missing from {stub.archive_file}")
+        return False
+
+    # Opening it counts as activity, so the next pass doesn't archive it straight back
+    session = ChatSession(
+        id=record["id"],
+        title=stub.title,
+        created_at=_parse(record["created_at"]),
+        updated_at=datetime.utcnow(),
+    )
+    db.add(session)
+    db.add_all([
+        ChatMessage(
+            id=m["id"],
+            session_id=record["id"],
+            role=m["role"],
+            content=m["content"],
+            tool_call_id=m["tool_call_id"],
+            tool_calls=m["tool_calls"],
+            name=m["name"],
+            timestamp=_parse(m["timestamp"]),
+        )
+        for m in record["messages"]
+    ])
+    db.delete(stub)
+    db.commit()
+    try:
+        memory.index_restored(session_id)
+    except Exception as e:
+        print(f"Could not index restored session {session_id} for recall: {e}")
+    return True
+
+
+def ensure_hot(db: Session, session_id: int) -> bool:
+    """True if the session is in the hot database, rehydrating it from the archive if needed."""
+    if db.query(ChatSession.id).filter(ChatSession.id == session_id).first():
+        return True
+    try:
+        return rehydrate_session(db, session_id)
+    except IntegrityError:
+        # Another worker rehydrated it concurrently
+        db.rollback()
+        return db.query(ChatSession.id).filter(ChatSession.id == session_id).first() is not None
+
+
+def reserve_archived_ids():
+    """
+    After the chat tables were rebuilt as AUTOINCREMENT, keep new rows clear of
+    ids that only live in archive files (archived before the rebuild). One-off:
+    reads every archive record once.
+    """
+    db = SessionLocal()
+    try:
+        session_floor = db.query(func.max(ArchivedSession.id)).scalar() or 0
+        message_floor = 0
+        for record in iter_archived_records(db):
+            message_floor = max([message_floor] + [m["id"] for m in record["messages"]])
+    finally:
+        db.close()
+    reserve_ids(ChatSession.__tablename__, session_floor)
+    reserve_ids(ChatMessage.__tablename__, message_floor)
+
+
+def get_archived_sessions(db: Session, limit: int = 50) -> List[ArchivedSession]:
+    return db.query(ArchivedSession).order_by(ArchivedSession.updated_at.desc()).limit(limit).all()
+
+
+def delete_archived_session(db: Session, session_id: int) -> bool:
+    """Drop the stub; the record becomes unreachable and is not rehydrated again."""
+    stub = db.query(ArchivedSession).filter(ArchivedSession.id == session_id).first()
+    if not stub:
+        return False
+    db.delete(stub)
+    db.commit()
+    return True
+
+
+def archived_session_to_dict(stub: ArchivedSession) -> Dict[str, Any]:
+    return {
+        "id": stub.id,
+        "title": stub.title,
+        "created_at": _iso(stub.created_at),
+        "updated_at": _iso(stub.updated_at),
+        "message_count": stub.message_count,
+        "archived": True,
+    }
+
+
+def run_maintenance() -> Dict[str, int]:
+    """
+    One archival pass followed by an incremental VACUUM step. Every worker runs
+    the background loop; whichever gets the lock does the pass, the rest skip.
+    """
+    with process_sync.file_lock(MAINTENANCE_LOCK, blocking=False) as acquired:
+        if not acquired:
+            return {"archived": 0, "free_pages": -1, "skipped": 1}
+        db = SessionLocal()
+        try:
+            archived = archive_inactive_sessions(db)
+        finally:
+            db.close()
+        free_pages = incremental_vacuum(VACUUM_PAGES)
+        return {"archived": archived, "free_pages": free_pages}
+
+
+def _loop():
+    while not _stop.wait(ARCHIVE_INTERVAL_SECONDS):
+        try:
+            result = run_maintenance()
+            if result["archived"]:
+                print(f"✓ Archived {result['archived']} inactive chat sessions")
+        except Exception as e:
+            print(f"Archive maintenance failed: {e}")
+
+
+def start_background_archiver():
+    """Start the periodic archival/VACUUM thread (no-op if disabled)."""
+    if not ARCHIVE_ENABLED:
+        return
+    _stop.clear()
+    threading.Thread(target=_loop, daemon=True, name="chat-archiver").start()
+
+
+def stop_background_archiver():
+    _stop.set()
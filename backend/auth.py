@@ -4,6 +4,7 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import RedirectResponse, JSONResponse
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
+import process_sync
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -11,11 +12,27 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 CREDENTIALS_FILE = "credentials.json"
 TOKEN_FILE = "token.json"
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+# Serialises token.json writes/refreshes across threads and worker processes
+TOKEN_LOCK = "google-token"
 
 # Use environment variables for redirects, default to localhost for development
 REDIRECT_URI = os.getenv("REDIRECT_URI", "http://localhost:8000/auth/callback")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
+def load_credentials():
+    """Credentials from token.json, or None if missing or mid-rewrite."""
+    if not os.path.exists(TOKEN_FILE):
+        return None
+    try:
+        return Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    except ValueError:
+        return None
+
+def save_credentials(credentials):
+    """Atomically replace token.json under the cross-process token lock."""
+    with process_sync.file_lock(TOKEN_LOCK):
+        process_sync.atomic_write(TOKEN_FILE, credentials.to_json())
+
 @router.get("/login")
 def login():
     """
@@ -56,8 +73,7 @@ def callback(code: str):
         credentials = flow.credentials
         
         # Save credentials
-        with open(TOKEN_FILE, "w") as token:
-            token.write(credentials.to_json())
+        save_credentials(credentials)
             
         # Redirect back to the frontend app
         return RedirectResponse(FRONTEND_URL)
@@ -74,7 +90,11 @@ def status():
         return {"authenticated": False}
         
     try:
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-        return {"authenticated": creds.valid}
+        creds = load_credentials()
+        if creds is None:
+            # Another worker may be rewriting the file in place
+            with process_sync.file_lock(TOKEN_LOCK):
+                creds = load_credentials()
+        return {"authenticated": bool(creds and creds.valid)}
     except Exception:
         return {"authenticated": False}
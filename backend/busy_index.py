@@ -0,0 +1,71 @@
+import bisect
+import datetime
+from typing import List, Tuple, Any, Callable
+
+Interval = Tuple[datetime.datetime, datetime.datetime, Any]
+
+
+class IntervalIndex:
+    """
+    Interval index over busy periods.
+    Intervals are sorted by start; a running maximum of end times lets an
+    overlap query bisect to the last candidate and stop scanning as soon as no
+    earlier interval can still reach the query start, i.e. O(log n + k).
+    Single events can be inserted/removed in place; only the running maximum
+    after the first touched position is recomputed.
+    """
+
+    def __init__(self, intervals: List[Interval]):
+        ordered = sorted(intervals, key=lambda iv: (iv[0], iv[1]))
+        self.starts = [iv[0] for iv in ordered]
+        self.ends = [iv[1] for iv in ordered]
+        self.payloads = [iv[2] for iv in ordered]
+        self.max_end = []
+        self._refresh_max_end(0)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _refresh_max_end(self, first: int):
+        del self.max_end[first:]
+        running = self.max_end[-1] if self.max_end else None
+        for end in self.ends[first:]:
+            running = end if running is None or end > running else running
+            self.max_end.append(running)
+
+    def insert(self, intervals: List[Interval]):
+        """Add intervals, keeping start order."""
+        if not intervals:
+            return
+        first = len(self.starts)
+        for start, end, payload in intervals:
+            i = bisect.bisect_right(self.starts, start)
+            self.starts.insert(i, start)
+            self.ends.insert(i, end)
+            self.payloads.insert(i, payload)
+            first = min(first, i)
+        self._refresh_max_end(first)
+
+    def remove(self, match: Callable[[Any], bool]) -> int:
+        """Drop intervals whose payload matches; returns how many were removed."""
+        keep = [i for i, payload in enumerate(self.payloads) if not match(payload)]
+        removed = len(self.payloads) - len(keep)
+        if removed:
+            first = next((n for n, i in enumerate(keep) if n != i), len(keep))
+            self.starts = [self.starts[i] for i in keep]
+            self.ends = [self.ends[i] for i in keep]
+            self.payloads = [self.payloads[i] for i in keep]
+            self._refresh_max_end(first)
+        return removed
+
+    def overlapping(self, start: datetime.datetime, end: datetime.datetime) -> List[Any]:
+        """Payloads of intervals overlapping [start, end), ordered by start."""
+        hits = []
+        # Everything starting at/after `end` cannot overlap
+        i = bisect.bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] > start:
+            if self.ends[i] > start:
+                hits.append(self.payloads[i])
+            i -= 1
+        hits.reverse()
+        return hits
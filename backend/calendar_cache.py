@@ -0,0 +1,565 @@
+import os
+import re
+import time
+import datetime
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from dateutil import tz
+from dateutil.rrule import rrulestr, rruleset
+from dateutil.parser import isoparse
+from busy_index import IntervalIndex
+import event_index
+import process_sync
+
+# Local cache + recurrence expansion for calendar reads.
+# Instead of asking Google to explode every recurring series (singleEvents=True),
+# we fetch masters, exceptions and one-off events once per window, keep them, and
+# expand RRULEs locally. Later reads inside an already-fetched window are answered
+# without an upstream call until the TTL expires or a mutation invalidates the cache.
+CALENDAR_CACHE_TTL = int(os.getenv("CALENDAR_CACHE_TTL", "300"))
+CALENDAR_ID = "primary"
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+
+_lock = threading.RLock()
+_events: Dict[str, Dict[str, Any]] = {}  # raw events by id (one-offs, masters, exceptions)
+_windows: List[Tuple[datetime.datetime, datetime.datetime]] = []  # covered [start, end) ranges
+_fetched_at = 0.0
+# Bumped whenever the whole cache is dropped; a fetch made meanwhile is discarded
+_epoch = 0
+# Bumped whenever windows are (re)filled or dropped; the busy index is rebuilt
+# lazily then. Writes made here patch it in place instead (apply_change).
+_generation = 0
+_busy: Optional[IntervalIndex] = None
+_busy_generation = -1
+# Events that can start this long before a query window are still considered
+BUSY_LOOKBACK = datetime.timedelta(days=1)
+# With several workers each keeps its own copy; a shared version counter tells
+# the others to drop theirs after a mutation made through any worker.
+SHARED_VERSION_NAME = "calendar"
+_shared_version = 0
+# Content version: bumped on local mutations and whenever a (re)fetch returns an
+# event that differs from the copy seen before (edits made outside the app).
+# Unlike _generation it does not move when unchanged data is merely re-fetched.
+_data_version = 0
+_seen_etags: Dict[str, str] = {}
+# While a push notification channel is live (see calendar_watch), upstream edits
+# arrive as notifications, so the TTL only acts as a long safety net.
+CALENDAR_CACHE_PUSH_TTL = int(os.getenv("CALENDAR_CACHE_PUSH_TTL", "3600"))
+_push_active_until = 0.0
+# Time of the oldest data in the cache; an incremental resync asks for changes since then
+_synced_at = 0.0
+RESYNC_SKEW_SECONDS = 60
+# A window fetch that keeps racing writes is served uncached after this many tries
+FETCH_ATTEMPTS = 3
+
+
+def _clear():
+    global _fetched_at, _generation, _epoch
+    _events.clear()
+    _windows.clear()
+    _fetched_at = 0.0
+    _generation += 1
+    _epoch += 1
+
+
+def invalidate(upstream_changed: bool = False):
+    """
+    Drop everything; the next read goes upstream. upstream_changed: edits made
+    outside the app may have been missed anywhere, so the search index has to
+    refetch its ranges too.
+    """
+    global _data_version
+    with _lock:
+        _clear()
+        _data_version += 1
+    if upstream_changed:
+        event_index.mark_stale()
+    if process_sync.MULTI_WORKER:
+        process_sync.bump_version(SHARED_VERSION_NAME)
+
+
+def _check_shared_version():
+    global _shared_version
+    if not process_sync.MULTI_WORKER:
+        return
+    version = process_sync.get_version(SHARED_VERSION_NAME)
+    if version != _shared_version:
+        _clear()
+        event_index.mark_stale()
+        _shared_version = version
+
+
+def version() -> Tuple[int, int]:
+    """
+    Stamp that changes whenever calendar data may have changed (mutation here,
+    in another worker, or upstream edits seen by a fetch). Used to key caches
+    of derived answers.
+    """
+    with _lock:
+        _check_shared_version()
+        return _shared_version, _data_version
+
+
+def set_push_active(until: float):
+    """Called by calendar_watch with the expiry of the live channel (0 when there is none)."""
+    global _push_active_until
+    _push_active_until = until
+    event_index.set_push_active(until)
+
+
+def _ttl() -> int:
+    return CALENDAR_CACHE_PUSH_TTL if time.time() < _push_active_until else CALENDAR_CACHE_TTL
+
+
+def _expired() -> bool:
+    return time.time() - _fetched_at > _ttl()
+
+
+def _covered(start: datetime.datetime, end: datetime.datetime) -> bool:
+    return any(w_start <= start and end <= w_end for w_start, w_end in _windows)
+
+
+def _add_window(start: datetime.datetime, end: datetime.datetime):
+    """Insert a window and merge overlapping/adjacent ones."""
+    merged = []
+    for w_start, w_end in sorted(_windows + [(start, end)]):
+        if merged and w_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], w_end))
+        else:
+            merged.append((w_start, w_end))
+    _windows[:] = merged
+
+
+def _parse_time(value: Dict[str, Any]) -> datetime.datetime:
+    """Event start/end -> aware datetime. All-day dates are midnight CST."""
+    if "dateTime" in value:
+        return isoparse(value["dateTime"])
+    return datetime.datetime.strptime(value["date"], "%Y-%m-%d").replace(tzinfo=CST)
+
+
+def event_start(event: Dict[str, Any]) -> datetime.datetime:
+    return _parse_time(event["start"])
+
+
+def event_end(event: Dict[str, Any]) -> datetime.datetime:
+    return _parse_time(event.get("end") or event["start"])
+
+
+def overlaps(event: Dict[str, Any], start: datetime.datetime, end: datetime.datetime) -> bool:
+    """Whether an event (instance) intersects [start, end)."""
+    return event_start(event) < end and event_end(event) > start
+
+
+def is_busy(event: Dict[str, Any]) -> bool:
+    """Free/busy semantics: all-day, transparent and declined events don't block time."""
+    if "date" in event["start"] or event.get("transparency") == "transparent":
+        return False
+    for attendee in event.get("attendees", []):
+        if attendee.get("self") and attendee.get("responseStatus") == "declined":
+            return False
+    return True
+
+
+def _list(service, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+          **extra) -> List[Dict[str, Any]]:
+    """One-offs, recurring masters and exceptions (incl. cancelled ones) in a window (or anywhere), all pages."""
+    if start is not None:
+        extra["timeMin"] = start.isoformat()
+    if end is not None:
+        extra["timeMax"] = end.isoformat()
+    items = []
+    page_token = None
+    while True:
+        result = service.events().list(
+            calendarId=CALENDAR_ID,
+            singleEvents=False,
+            showDeleted=True,
+            maxResults=2500,
+            pageToken=page_token,
+            **extra
+        ).execute()
+        items.extend(result.get("items", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return items
+
+
+def _store(items: List[Dict[str, Any]], new_is_change: bool = False) -> bool:
+    """
+    Merge fetched events into the cache; True if any of them changed since it
+    was last seen. Filling a new window only shows events for the first time,
+    which changes nothing a derived cache could hold; a resync passes
+    new_is_change, since everything it returns was created or edited upstream.
+    """
+    global _data_version
+    changed = False
+    for event in items:
+        _events[event["id"]] = event
+        etag = event.get("etag") or event.get("updated", "")
+        seen = _seen_etags.get(event["id"])
+        if seen != etag:
+            _seen_etags[event["id"]] = etag
+            if seen is not None or new_is_change:
+                changed = True
+    if changed:
+        _data_version += 1
+    event_index.add(items)
+    return changed
+
+
+def _in_windows(event: Dict[str, Any]) -> bool:
+    """Whether a changed event still belongs in the cache (series and cancellations always do)."""
+    if event.get("status") == "cancelled" or event.get("recurrence") or "start" not in event:
+        return True
+    return any(overlaps(event, w_start, w_end) for w_start, w_end in _windows)
+
+
+def resync(service) -> int:
+    """
+    Incremental refresh after a push notification: list every event updated
+    since the cache was filled (updatedMin, no time bounds, so an event moved
+    out of a cached window is seen too), merge those in the cached windows and
+    evict the ones that left them. Returns the number of changed events.
+    """
+    global _generation, _synced_at, _data_version
+    with _lock:
+        _check_shared_version()
+        windows = list(_windows)
+        since = _synced_at
+    started = time.time()
+    changed = 0
+    if windows:
+        updated_min = datetime.datetime.fromtimestamp(since - RESYNC_SKEW_SECONDS, datetime.timezone.utc)
+        items = _list(service, updatedMin=updated_min.isoformat())
+        with _lock:
+            # If the cache was cleared or refetched meanwhile, that data is at least as new
+            if _windows == windows:
+                kept = [e for e in items if _in_windows(e)]
+                moved_out = [e for e in items if not _in_windows(e)]
+                evicted = [e for e in moved_out if _events.pop(e["id"], None) is not None]
+                event_index.add(moved_out)
+                stored = _store(kept, new_is_change=True)
+                if evicted and not stored:
+                    _data_version += 1
+                if stored or evicted:
+                    _generation += 1
+                    changed = len(kept) + len(evicted)
+                _synced_at = started
+            else:
+                # The search index still needs the changes, wherever they are
+                event_index.add(items)
+    else:
+        # Nothing cached here to diff against, but derived caches (answer_cache)
+        # key on the version and the search index can't tell what changed
+        with _lock:
+            _data_version += 1
+        event_index.mark_stale()
+    _publish_change()
+    return changed
+
+
+def note_queued_write():
+    """A write-behind write was journaled: cached events are still what Google has, but answers derived from them are stale."""
+    global _data_version
+    with _lock:
+        _data_version += 1
+    _publish_change()
+
+
+def _publish_change():
+    """Make other workers drop their copies, without dropping the one just resynced here."""
+    global _shared_version
+    if not process_sync.MULTI_WORKER:
+        return
+    before = process_sync.get_version(SHARED_VERSION_NAME)
+    process_sync.bump_version(SHARED_VERSION_NAME)
+    after = process_sync.get_version(SHARED_VERSION_NAME)
+    with _lock:
+        # Adopt the new version only if no other worker bumped in between
+        if after == before + 1 and _shared_version == before:
+            _shared_version = after
+
+
+def _master_tz(master: Dict[str, Any]):
+    zone = master["start"].get("timeZone")
+    return tz.gettz(zone) if zone else None
+
+
+def _fix_until(line: str, all_day: bool) -> str:
+    """Google may send a date-only UNTIL; dateutil needs UTC when DTSTART is aware."""
+    if all_day:
+        return line
+    return re.sub(r"UNTIL=(\d{8})(?=;|$)", r"UNTIL=\1T235959Z", line)
+
+
+def _parse_date_list(line: str, zone, all_day: bool) -> List[datetime.datetime]:
+    """EXDATE/RDATE values, honouring an optional TZID parameter."""
+    params, _, values = line.partition(":")
+    match = re.search(r"TZID=([^;:]+)", params)
+    if match:
+        zone = tz.gettz(match.group(1))
+    out = []
+    for value in values.split(","):
+        value = value.strip()
+        if not value:
+            continue
+        if len(value) == 8:
+            dt = datetime.datetime.strptime(value, "%Y%m%d")
+        else:
+            dt = datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+            if value.endswith("Z"):
+                dt = dt.replace(tzinfo=datetime.timezone.utc)
+        if not all_day and dt.tzinfo is None:
+            dt = dt.replace(tzinfo=zone or CST)
+        out.append(dt)
+    return out
+
+
+def _occurrences(master: Dict[str, Any], start: datetime.datetime, end: datetime.datetime) -> List[datetime.datetime]:
+    """Start times of a master's occurrences that overlap [start, end)."""
+    all_day = "date" in master["start"]
+    duration = event_end(master) - event_start(master)
+    if all_day:
+        dtstart = datetime.datetime.strptime(master["start"]["date"], "%Y-%m-%d")
+        window_start = start.astimezone(CST).replace(tzinfo=None) - duration
+        window_end = end.astimezone(CST).replace(tzinfo=None)
+    else:
+        zone = _master_tz(master)
+        dtstart = isoparse(master["start"]["dateTime"])
+        if zone:
+            dtstart = dtstart.astimezone(zone)
+        window_start = start - duration
+        window_end = end
+
+    rules = rruleset()
+    zone = None if all_day else dtstart.tzinfo
+    for line in master.get("recurrence", []):
+        if line.startswith("RRULE"):
+            rules.rrule(rrulestr(_fix_until(line, all_day), dtstart=dtstart))
+        elif line.startswith("EXDATE"):
+            for dt in _parse_date_list(line, zone, all_day):
+                rules.exdate(dt)
+        elif line.startswith("RDATE"):
+            for dt in _parse_date_list(line, zone, all_day):
+                rules.rdate(dt)
+
+    occurrences = [o for o in rules.between(window_start, window_end, inc=True) if o < window_end]
+    if all_day:
+        return [o.replace(tzinfo=CST) for o in occurrences]
+    return occurrences
+
+
+def _instance_id(master: Dict[str, Any], occurrence: datetime.datetime) -> str:
+    """Same id format Google uses for instances, so update/delete by id keep working."""
+    if "date" in master["start"]:
+        return f"{master['id']}_{occurrence.strftime('%Y%m%d')}"
+    return f"{master['id']}_{occurrence.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def _expand(master: Dict[str, Any], start: datetime.datetime, end: datetime.datetime,
+            overridden: set) -> List[Dict[str, Any]]:
+    all_day = "date" in master["start"]
+    duration = event_end(master) - event_start(master)
+    instances = []
+    for occurrence in _occurrences(master, start, end):
+        instance_id = _instance_id(master, occurrence)
+        if instance_id in overridden:
+            continue
+        instance = {k: v for k, v in master.items() if k != "recurrence"}
+        instance["id"] = instance_id
+        instance["recurringEventId"] = master["id"]
+        if all_day:
+            instance["start"] = {"date": occurrence.strftime("%Y-%m-%d")}
+            instance["end"] = {"date": (occurrence + duration).strftime("%Y-%m-%d")}
+        else:
+            instance["start"] = {"dateTime": occurrence.isoformat(), **_zone_field(master["start"])}
+            instance["end"] = {"dateTime": (occurrence + duration).isoformat(), **_zone_field(master["end"])}
+        instance["originalStartTime"] = dict(instance["start"])
+        instances.append(instance)
+    return instances
+
+
+def _zone_field(value: Dict[str, Any]) -> Dict[str, str]:
+    return {"timeZone": value["timeZone"]} if value.get("timeZone") else {}
+
+
+def _exception_key(event: Dict[str, Any]) -> Optional[str]:
+    """Instance id an exception replaces (modified or cancelled occurrence)."""
+    original = event.get("originalStartTime")
+    master_id = event.get("recurringEventId")
+    if not original or not master_id:
+        return None
+    if "date" in original:
+        return f"{master_id}_{original['date'].replace('-', '')}"
+    utc = isoparse(original["dateTime"]).astimezone(datetime.timezone.utc)
+    return f"{master_id}_{utc.strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def cached_event(event_id: str) -> Optional[Dict[str, Any]]:
+    """A one-off event or recurring master as last fetched, if the cache still holds it."""
+    with _lock:
+        _check_shared_version()
+        if _expired():
+            return None
+        event = _events.get(event_id)
+    return None if event is None or event.get("status") == "cancelled" else event
+
+
+def events_between(service, start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+    """
+    All event instances overlapping [start, end), sorted by start time, in the
+    same shape `events.list(singleEvents=True)` would return.
+    A missing window is listed without holding the lock and merged afterwards,
+    unless the cache was dropped or written to meanwhile (then it is listed again).
+    """
+    global _fetched_at, _synced_at, _generation
+    for _ in range(FETCH_ATTEMPTS):
+        with _lock:
+            _check_shared_version()
+            if _windows and _expired():
+                _clear()
+            if _covered(start, end):
+                raw = list(_events.values())
+                break
+            stamp = (_epoch, _data_version)
+        # Widen to whole CST days so neighbouring queries reuse the fetch
+        fetch_start = start.astimezone(CST).replace(hour=0, minute=0, second=0, microsecond=0)
+        fetch_end = end.astimezone(CST).replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        started = time.time()
+        items = _list(service, fetch_start, fetch_end)
+        with _lock:
+            if (_epoch, _data_version) != stamp:
+                continue
+            if not _windows:
+                _fetched_at = _synced_at = started
+            _store(items)
+            _add_window(fetch_start, fetch_end)
+            event_index.mark_covered(fetch_start, fetch_end)
+            _generation += 1
+            raw = list(_events.values())
+            break
+    else:
+        # Fresh from upstream, just not safe to merge; the next read tries again
+        raw = items
+    return _instances(raw, start, end)
+
+
+def _instances(raw: List[Dict[str, Any]], start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+    overridden = {key for key in (_exception_key(e) for e in raw) if key}
+    instances = []
+    for event in raw:
+        if event.get("status") == "cancelled":
+            continue
+        if event.get("recurrence"):
+            instances.extend(_expand(event, start, end, overridden))
+        elif overlaps(event, start, end):
+            instances.append(event)
+    instances.sort(key=event_start)
+    return instances
+
+
+def search(service, start: datetime.datetime, end: datetime.datetime,
+           query: str = "", attendee: str = "") -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    (score, instance) pairs in [start, end) matching a query and/or attendee,
+    sorted by start time, via the local event index. Parts of the range the
+    index hasn't seen recently (past months, far future) are listed first, all
+    pages, without filling the window cache.
+    """
+    with _lock:
+        _check_shared_version()
+    for gap_start, gap_end in event_index.missing(start, end):
+        # Whole CST days, so searches relative to "now" don't leave slivers to refetch
+        gap_start = gap_start.astimezone(CST).replace(hour=0, minute=0, second=0, microsecond=0)
+        gap_end = gap_end.astimezone(CST).replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        event_index.add(_list(service, gap_start, gap_end))
+        event_index.mark_covered(gap_start, gap_end)
+    scores, raw = event_index.match(query, attendee)
+    # Modified occurrences of a matching series only show up if they match themselves
+    unmatched = {e["id"] for e in raw if e["id"] not in scores}
+    return [
+        (scores.get(e["id"]) or scores.get(e.get("recurringEventId"), 0.0), e)
+        for e in _instances(raw, start, end) if e["id"] not in unmatched
+    ]
+
+
+def _busy_intervals(events: List[Dict[str, Any]], raw: List[Dict[str, Any]]) -> list:
+    """(start, end, instance) busy periods of `events` inside the cached windows."""
+    overridden = {key for key in (_exception_key(e) for e in raw) if key}
+    intervals = {}
+    for event in events:
+        if event.get("status") == "cancelled":
+            continue
+        for w_start, w_end in _windows:
+            if event.get("recurrence"):
+                instances = _expand(event, w_start, w_end, overridden)
+            else:
+                instances = [event] if overlaps(event, w_start, w_end) else []
+            for instance in instances:
+                if is_busy(instance):
+                    # Windows are disjoint, but an event crossing a boundary shows up in both
+                    intervals[(instance["id"], event_start(instance))] = (event_start(instance), event_end(instance), instance)
+    return list(intervals.values())
+
+
+def apply_change(event_id: str, event: Optional[Dict[str, Any]] = None):
+    """
+    Record a write made through this app (event as Google returned it, or None
+    once deleted) instead of dropping the whole cache: the cached copy is
+    replaced and only that event's periods in the busy index are swapped.
+    A change the cache can't follow locally (an occurrence it never held
+    on its own) falls back to invalidate().
+    """
+    global _data_version
+    with _lock:
+        _check_shared_version()
+        if event is None and event_id not in _events:
+            local = False
+        else:
+            local = True
+            previous = _events.pop(event_id, None)
+            if event is not None and _in_windows(event):
+                _events[event_id] = event
+                _seen_etags[event_id] = event.get("etag") or event.get("updated", "")
+            _data_version += 1
+            if _busy is not None and _busy_generation == _generation:
+                replaced = {event_id} | {key for key in (_exception_key(e) for e in (previous, event) if e) if key}
+                # Occurrences expanded from a changed master go too; its stored exceptions stay
+                _busy.remove(lambda p: p["id"] in replaced or (
+                    p.get("recurringEventId") == event_id and p["id"] not in _events))
+                if event_id in _events:
+                    _busy.insert(_busy_intervals([event], list(_events.values())))
+    if event is None:
+        event_index.remove(event_id)
+    else:
+        event_index.add([event])
+    if not local:
+        invalidate()
+        return
+    _publish_change()
+
+
+def find_conflicts(service, start: datetime.datetime, end: datetime.datetime,
+                   exclude_ids: Optional[set] = None) -> List[Dict[str, Any]]:
+    """
+    Busy events overlapping [start, end), via an interval index built from the
+    cached windows (fetching the surrounding days first if needed). The index
+    is rebuilt only when windows are (re)fetched; writes made here update it
+    in place through apply_change().
+    """
+    global _busy, _busy_generation
+    events = events_between(service, start - BUSY_LOOKBACK, end)
+    with _lock:
+        if _covered(start - BUSY_LOOKBACK, end):
+            if _busy_generation != _generation:
+                raw = list(_events.values())
+                _busy = IntervalIndex(_busy_intervals(raw, raw))
+                _busy_generation = _generation
+            # Queried under the lock: apply_change() edits the index in place
+            hits = _busy.overlapping(start, end)
+        else:
+            # Served uncached (the fetch kept racing writes, or the cache was
+            # dropped since): check the events that were just listed instead
+            hits = [e for e in events if is_busy(e) and overlaps(e, start, end)]
+    exclude_ids = exclude_ids or set()
+    return [e for e in hits if e["id"] not in exclude_ids]
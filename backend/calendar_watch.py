@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import uuid
+import secrets
+import argparse
+import threading
+from typing import Dict, Any, Optional, Mapping
+import calendar_cache
+import process_sync
+
+# Push invalidation through Google Calendar watch channels (events.watch).
+# Google POSTs to CALENDAR_WEBHOOK_URL whenever the primary calendar changes;
+# each ping triggers an incremental resync of the calendar cache. Channels
+# expire, so a background loop renews them ahead of time. Channel state is kept
+# in a small JSON file shared by all workers. Without CALENDAR_WEBHOOK_URL (it
+# must be public HTTPS) everything here is inactive and the cache relies on its TTL.
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL", "")
+CALENDAR_WATCH_TTL_SECONDS = int(os.getenv("CALENDAR_WATCH_TTL_SECONDS", str(7 * 24 * 3600)))
+CALENDAR_WATCH_RENEW_BEFORE = int(os.getenv("CALENDAR_WATCH_RENEW_BEFORE", "3600"))
+CALENDAR_WATCH_CHECK_SECONDS = int(os.getenv("CALENDAR_WATCH_CHECK_SECONDS", "600"))
+WATCH_STATE_FILE = os.getenv("CALENDAR_WATCH_STATE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendar_watch.json"))
+WATCH_LOCK = "calendar-watch"
+# Resource id used by channels created with `python calendar_watch.py local-channel`
+LOCAL_RESOURCE_ID = "local"
+
+_stop = threading.Event()
+_resync_running = threading.Lock()
+_resync_pending = threading.Event()
+notifications = 0
+
+
+def load_state() -> Optional[Dict[str, Any]]:
+    if not os.path.exists(WATCH_STATE_FILE):
+        return None
+    try:
+        with open(WATCH_STATE_FILE) as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def _save_state(state: Optional[Dict[str, Any]]):
+    if state is None:
+        if os.path.exists(WATCH_STATE_FILE):
+            os.remove(WATCH_STATE_FILE)
+    else:
+        process_sync.atomic_write(WATCH_STATE_FILE, json.dumps(state))
+    _publish(state)
+
+
+def _publish(state: Optional[Dict[str, Any]]):
+    """Tell the calendar cache how long pushes are guaranteed to arrive."""
+    calendar_cache.set_push_active(state["expiration"] if state else 0.0)
+
+
+def _create_channel(service) -> Dict[str, Any]:
+    token = secrets.token_urlsafe(24)
+    channel = service.events().watch(
+        calendarId=calendar_cache.CALENDAR_ID,
+        body={
+            "id": uuid.uuid4().hex,
+            "type": "web_hook",
+            "address": CALENDAR_WEBHOOK_URL,
+            "token": token,
+            "params": {"ttl": str(CALENDAR_WATCH_TTL_SECONDS)},
+        },
+    ).execute()
+    return {
+        "channel_id": channel["id"],
+        "resource_id": channel["resourceId"],
+        "token": token,
+        # Google reports expiration in milliseconds since the epoch
+        "expiration": int(channel.get("expiration", (time.time() + CALENDAR_WATCH_TTL_SECONDS) * 1000)) / 1000,
+        "created_at": time.time(),
+    }
+
+
+def _stop_channel(service, state: Dict[str, Any]):
+    if state.get("resource_id") == LOCAL_RESOURCE_ID:
+        return
+    try:
+        service.channels().stop(body={"id": state["channel_id"], "resourceId": state["resource_id"]}).execute()
+    except Exception as e:
+        # It expires on its own; pings for it are rejected meanwhile
+        print(f"Could not stop calendar watch channel {state['channel_id']}: {e}")
+
+
+def ensure_channel(service, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Create the watch channel, or replace it when it is close to expiry.
+    The new channel is opened before the old one is stopped, so no change
+    goes unnoticed during renewal.
+    """
+    if not CALENDAR_WEBHOOK_URL:
+        return None
+    with process_sync.file_lock(WATCH_LOCK):
+        state = load_state()
+        if state and not force and state["expiration"] - time.time() > CALENDAR_WATCH_RENEW_BEFORE:
+            _publish(state)
+            return state
+        new_state = _create_channel(service)
+        _save_state(new_state)
+        if state:
+            _stop_channel(service, state)
+        print(f"✓ Calendar watch channel {new_state['channel_id']} active until {time.ctime(new_state['expiration'])}")
+    # Changes made before the channel existed were never pushed
+    calendar_cache.invalidate(upstream_changed=True)
+    return new_state
+
+
+def stop_channel(service):
+    with process_sync.file_lock(WATCH_LOCK):
+        state = load_state()
+        if state:
+            _stop_channel(service, state)
+        _save_state(None)
+
+
+def handle_notification(headers: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Validate a push notification and schedule a resync. Returns a small result
+    dict; raises PermissionError for pings from unknown channels or bad tokens.
+    """
+    global notifications
+    state = load_state()
+    channel_id = headers.get("x-goog-channel-id")
+    if not state or channel_id != state["channel_id"]:
+        raise PermissionError("Unknown channel")
+    if not secrets.compare_digest(headers.get("x-goog-channel-token", ""), state["token"]):
+        raise PermissionError("Bad channel token")
+    resource_state = headers.get("x-goog-resource-state", "")
+    if resource_state == "sync":
+        # Handshake sent once when the channel is created
+        return {"status": "sync"}
+    notifications += 1
+    _schedule_resync()
+    return {"status": "resync", "message_number": headers.get("x-goog-message-number")}
+
+
+def _schedule_resync():
+    """Coalesce bursts of pings: at most one resync runs, and one more follows if pinged meanwhile."""
+    _resync_pending.set()
+    if _resync_running.acquire(blocking=False):
+        threading.Thread(target=_resync_loop, daemon=True, name="calendar-resync").start()
+
+
+def _resync_loop():
+    while True:
+        try:
+            while _resync_pending.is_set():
+                _resync_pending.clear()
+                _resync()
+        finally:
+            _resync_running.release()
+        # A ping that arrived just before the release found the lock still taken
+        if not (_resync_pending.is_set() and _resync_running.acquire(blocking=False)):
+            return
+
+
+def _resync():
+    import skills_google
+    try:
+        changed = calendar_cache.resync(skills_google._get_calendar_service())
+        if changed:
+            print(f"✓ Calendar resync after push: {changed} changed events")
+    except Exception as e:
+        print(f"Calendar resync failed, dropping cache: {e}")
+        calendar_cache.invalidate(upstream_changed=True)
+
+
+def _loop():
+    import skills_google
+    while True:
+        try:
+            state = load_state()
+            _publish(state)
+            if CALENDAR_WEBHOOK_URL and (not state or state["expiration"] - time.time() <= CALENDAR_WATCH_RENEW_BEFORE):
+                # One worker renews; the others pick up the new state file next round
+                with process_sync.file_lock(WATCH_LOCK + "-renewer", blocking=False) as acquired:
+                    if acquired:
+                        ensure_channel(skills_google._get_calendar_service())
+        except Exception as e:
+            print(f"Calendar watch renewal failed: {e}")
+        if _stop.wait(CALENDAR_WATCH_CHECK_SECONDS):
+            return
+
+
+def start_background_watcher():
+    """Renew the watch channel periodically (no-op without CALENDAR_WEBHOOK_URL)."""
+    _publish(load_state())
+    if not CALENDAR_WEBHOOK_URL:
+        return
+    _stop.clear()
+    threading.Thread(target=_loop, daemon=True, name="calendar-watch").start()
+
+
+def status() -> Dict[str, Any]:
+    state = load_state()
+    return {
+        "enabled": bool(CALENDAR_WEBHOOK_URL),
+        "channel_id": state["channel_id"] if state else None,
+        "expires_at": state["expiration"] if state else None,
+        "local": bool(state and state.get("resource_id") == LOCAL_RESOURCE_ID),
+        "notifications": notifications,
+    }
+
+
+# ===== Local stand-in notifier (development/tests) =====
+
+def create_local_channel(ttl_seconds: int = CALENDAR_WATCH_TTL_SECONDS) -> Dict[str, Any]:
+    """A channel Google knows nothing about, so pings can be simulated with `notify`."""
+    state = {
+        "channel_id": f"local-{uuid.uuid4().hex}",
+        "resource_id": LOCAL_RESOURCE_ID,
+        "token": secrets.token_urlsafe(24),
+        "expiration": time.time() + ttl_seconds,
+        "created_at": time.time(),
+    }
+    with process_sync.file_lock(WATCH_LOCK):
+        _save_state(state)
+    return state
+
+
+def send_notification(base_url: str, resource_state: str = "exists", message_number: int = 1):
+    """POST a notification shaped like Google's to the receiver route."""
+    import httpx
+    state = load_state()
+    if not state:
+        raise RuntimeError("No watch channel; run `python calendar_watch.py local-channel` first")
+    headers = {
+        "X-Goog-Channel-ID": state["channel_id"],
+        "X-Goog-Channel-Token": state["token"],
+        "X-Goog-Resource-ID": state["resource_id"],
+        "X-Goog-Resource-State": resource_state,
+        "X-Goog-Message-Number": str(message_number),
+    }
+    return httpx.post(base_url.rstrip("/") + "/calendar/notifications", headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calendar watch channel tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show the current channel")
+    commands.add_parser("local-channel", help="create a local stand-in channel for testing")
+    notify = commands.add_parser("notify", help="send a stand-in push notification")
+    notify.add_argument("--url", default="http://localhost:8000", help="backend base URL")
+    notify.add_argument("--state", default="exists", choices=["sync", "exists", "not_exists"])
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print(json.dumps(status(), indent=2))
+    elif args.command == "local-channel":
+        state = create_local_channel()
+        print(f"✓ Local channel {state['channel_id']} written to {WATCH_STATE_FILE}")
+    else:
+        response = send_notification(args.url, args.state)
+        print(f"{response.status_code} {response.text}")
+        sys.exit(0 if response.is_success else 1)
+
+
+if __name__ == "__main__":
+    main()
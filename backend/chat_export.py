@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import zlib
+import argparse
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+from database import SessionLocal, ChatSession, ChatMessage
+import archive
+import memory
+
+# Streaming bulk export/import of chat sessions.
+# The export is flat NDJSON: a header line, then one line per session, then one
+# line per message (ordered by id), followed by archived sessions if requested.
+# Rows are read with yield_per and written in large chunks, so memory use does
+# not grow with the size of the database. The importer batches rows into large
+# transactions using executemany.
+EXPORT_FORMAT = "mahakaal-chat-export"
+EXPORT_VERSION = 1
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_CHUNK_BYTES = 256 * 1024
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+_SESSION_COLUMNS = (ChatSession.id, ChatSession.title, ChatSession.created_at, ChatSession.updated_at)
+_MESSAGE_COLUMNS = (
+    ChatMessage.id, ChatMessage.session_id, ChatMessage.role, ChatMessage.content,
+    ChatMessage.tool_call_id, ChatMessage.tool_calls, ChatMessage.name, ChatMessage.timestamp,
+)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _session_line(row) -> str:
+    return _line({
+        "type": "session", "id": row.id, "title": row.title,
+        "created_at": _iso(row.created_at), "updated_at": _iso(row.updated_at),
+    })
+
+
+def _message_line(row) -> str:
+    return _line({
+        "type": "message", "id": row.id, "session_id": row.session_id, "role": row.role,
+        "content": row.content, "tool_call_id": row.tool_call_id, "tool_calls": row.tool_calls,
+        "name": row.name, "timestamp": _iso(row.timestamp),
+    })
+
+
+def export_lines(db: Session, include_archived: bool = False) -> Iterator[str]:
+    """NDJSON lines for every session and message, read in yield_per batches."""
+    yield _line({"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+                 "exported_at": datetime.utcnow().isoformat()})
+    sessions = db.execute(
+        select(*_SESSION_COLUMNS).order_by(ChatSession.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in sessions:
+        yield _session_line(row)
+    messages = db.execute(
+        select(*_MESSAGE_COLUMNS).order_by(ChatMessage.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in messages:
+        yield _message_line(row)
+
+    if include_archived:
+        for record in archive.iter_archived_records(db):
+            yield _line({
+                "type": "session", "id": record["id"], "title": record["title"],
+                "created_at": record["created_at"], "updated_at": record["updated_at"],
+            })
+            for message in record["messages"]:
+                yield _line({"type": "message", "session_id": record["id"], **message})
+
+
+def export_chunks(include_archived: bool = False, compress: bool = False) -> Iterator[bytes]:
+    """
+    The export as byte chunks of roughly EXPORT_CHUNK_BYTES, gzip-compressed if
+    asked. Opens its own DB session so it can outlive the request handler.
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    db = SessionLocal()
+    try:
+        buffer: List[bytes] = []
+        size = 0
+        for line in export_lines(db, include_archived):
+            data = line.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= EXPORT_CHUNK_BYTES:
+                chunk = b"".join(buffer)
+                buffer, size = [], 0
+                chunk = gz.compress(chunk) if gz else chunk
+                if chunk:
+                    yield chunk
+        chunk = b"".join(buffer)
+        if gz:
+            chunk = gz.compress(chunk) + gz.flush()
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+class LineDecoder:
+    """
+    Incremental byte-stream -> lines splitter that transparently gunzips the
+    stream (including multi-member gzip) when it starts with the gzip magic.
+    """
+
+    def __init__(self):
+        self.decompressor = None
+        self.started = False
+        self.pending = b""
+
+    def _inflate(self, chunk: bytes) -> bytes:
+        data = self.decompressor.decompress(chunk)
+        while self.decompressor.eof and self.decompressor.unused_data:
+            rest = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(31)
+            data += self.decompressor.decompress(rest)
+        return data
+
+    def feed(self, chunk: bytes) -> List[str]:
+        if not chunk:
+            return []
+        if not self.started:
+            self.started = True
+            if chunk[:2] == b"\x1f\x8b":
+                self.decompressor = zlib.decompressobj(31)
+        if self.decompressor is not None:
+            chunk = self._inflate(chunk)
+        lines = (self.pending + chunk).split(b"\n")
+        self.pending = lines.pop()
+        return [line.decode("utf-8") for line in lines if line.strip()]
+
+    def close(self) -> List[str]:
+        rest, self.pending = self.pending, b""
+        return [rest.decode("utf-8")] if rest.strip() else []
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    decoder = LineDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+class Importer:
+    """
+    Inserts exported records in batches of IMPORT_BATCH_SIZE, one transaction
+    per batch. By default sessions and messages get new ids (safe to merge into
+    a non-empty database); preserve_ids=True keeps the exported ids for a
+    restore into an empty one.
+    """
+
+    def __init__(self, preserve_ids: bool = False):
+        self.preserve_ids = preserve_ids
+        self.session_ids: Dict[int, int] = {}  # exported id -> new id
+        self.sessions: List[Dict[str, Any]] = []
+        self.messages: List[Dict[str, Any]] = []
+        self.imported_sessions = 0
+        self.imported_messages = 0
+        self.skipped = 0
+
+    def add(self, record: Dict[str, Any]):
+        kind = record.get("type")
+        if kind == "header":
+            if record.get("format") != EXPORT_FORMAT or record.get("version", 0) > EXPORT_VERSION:
+                raise ValueError(f"Unsupported export format: {record.get('format')} v{record.get('version')}")
+        elif kind == "session":
+            self.sessions.append(record)
+        elif kind == "message":
+            self.messages.append(record)
+        else:
+            self.skipped += 1
+        if len(self.sessions) + len(self.messages) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def finish(self) -> Dict[str, int]:
+        """
+        Write the last batch. Ids kept from the export can sit below the memory
+        index watermark, where a sync never looks, so the index is rebuilt.
+        """
+        self.flush()
+        if self.preserve_ids and self.imported_messages:
+            memory.INDEX.rebuild()
+        return self.summary()
+
+    def flush(self):
+        if not self.sessions and not self.messages:
+            return
+        db = SessionLocal()
+        try:
+            if self.sessions:
+                self._insert_sessions(db)
+            if self.messages:
+                self._insert_messages(db)
+            db.commit()
+        finally:
+            db.close()
+        self.sessions, self.messages = [], []
+
+    def _insert_sessions(self, db: Session):
+        # Missing times get what the column default would give (executemany bypasses it)
+        now = datetime.utcnow()
+        rows = [
+            {
+                "title": s["title"],
+                "created_at": _parse(s.get("created_at")) or now,
+                "updated_at": _parse(s.get("updated_at")) or now,
+                **({"id": s["id"]} if self.preserve_ids else {}),
+            }
+            for s in self.sessions
+        ]
+        if self.preserve_ids:
+            db.execute(insert(ChatSession), rows)
+            self.session_ids.update((s["id"], s["id"]) for s in self.sessions)
+        else:
+            # Sessions are few compared to messages; insert one by one to learn the new ids
+            for session, row in zip(self.sessions, rows):
+                new_id = db.execute(insert(ChatSession).values(**row)).inserted_primary_key[0]
+                self.session_ids[session["id"]] = new_id
+        self.imported_sessions += len(rows)
+
+    def _insert_messages(self, db: Session):
+        now = datetime.utcnow()
+        rows = []
+        for m in self.messages:
+            session_id = self.session_ids.get(m["session_id"])
+            if session_id is None:
+                self.skipped += 1  # message of a session missing from the export
+                continue
+            row = {
+                "session_id": session_id,
+                "role": m["role"],
+                "content": m.get("content"),
+                "tool_call_id": m.get("tool_call_id"),
+                "tool_calls": m.get("tool_calls"),
+                "name": m.get("name"),
+                "timestamp": _parse(m.get("timestamp")) or now,
+            }
+            if self.preserve_ids:
+                row["id"] = m["id"]
+            rows.append(row)
+        if rows:
+            db.execute(insert(ChatMessage), rows)
+        self.imported_messages += len(rows)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "sessions": self.imported_sessions,
+            "messages": self.imported_messages,
+            "skipped": self.skipped,
+        }
+
+
+def import_lines(lines: Iterable[str], preserve_ids: bool = False) -> Dict[str, int]:
+    importer = Importer(preserve_ids=preserve_ids)
+    for line in lines:
+        importer.add(json.loads(line))
+    return importer.finish()
+
+
+def _read_file(path: str) -> Iterator[bytes]:
+    source = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = source.read(EXPORT_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream chat sessions to/from NDJSON (optionally gzip'd).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="write all sessions and messages")
+    export_cmd.add_argument("-o", "--output", default="-", help="output file ('-' for stdout)")
+    export_cmd.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    export_cmd.add_argument("--include-archived", action="store_true", help="also export archived sessions")
+    import_cmd = commands.add_parser("import", help="load an export (plain or gzip'd)")
+    import_cmd.add_argument("input", help="export file ('-' for stdin)")
+    import_cmd.add_argument("--preserve-ids", action="store_true", help="keep exported ids (restore into an empty database)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in export_chunks(args.include_archived, args.gzip):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    else:
+        from database import init_db
+        init_db()
+        result = import_lines(iter_lines(_read_file(args.input)), preserve_ids=args.preserve_ids)
+        print(f"✓ Imported {result['sessions']} sessions and {result['messages']} messages"
+              f" ({result['skipped']} records skipped)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
-from database import ChatSession, ChatMessage
-from typing import List, Dict, Any, Optional
+from database import ChatSession, ChatMessage, retry_on_locked
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import re
+import hashlib
 from datetime import datetime
 
+@retry_on_locked
 def create_chat_session(db: Session, title: str = None) -> ChatSession:
     """Create a new chat session"""
     if not title:
@@ -15,6 +19,7 @@ def create_chat_session(db: Session, title: str = None) -> ChatSession:
     db.refresh(session)
     return session
 
+@retry_on_locked
 def save_message(
     db: Session, 
     session_id: int, 
@@ -34,14 +39,14 @@ def save_message(
         name=name
     )
     db.add(message)
-    db.commit()
-    db.refresh(message)
     
-    # Update session's updated_at timestamp
+    # Update session's updated_at timestamp (same transaction, so a retry
+    # after a lock timeout never saves the message twice)
     session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
     if session:
         session.updated_at = datetime.utcnow()
-        db.commit()
+    db.commit()
+    db.refresh(message)
     
     return message
 
@@ -59,6 +64,107 @@ def get_session_messages(db: Session, session_id: int) -> List[ChatMessage]:
         ChatMessage.session_id == session_id
     ).order_by(ChatMessage.timestamp).all()
 
+def get_session_messages_window(
+    db: Session,
+    session_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> Tuple[List[ChatMessage], bool]:
+    """
+    Get a window of a session's messages in id order.
+    after_id: only messages newer than this id (incremental sync)
+    before_id: only messages older than this id (paging back through history)
+    limit: max messages; with before_id the newest ones before the cursor are returned
+    Returns (messages, has_more) where has_more means the limit cut the window short.
+    """
+    query = db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+    if after_id is not None:
+        query = query.filter(ChatMessage.id > after_id)
+    if before_id is not None:
+        query = query.filter(ChatMessage.id < before_id)
+
+    if limit is None:
+        return query.order_by(ChatMessage.id).all(), False
+
+    if before_id is not None or after_id is None:
+        # Newest `limit` messages (before the cursor), returned oldest first
+        rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        return list(reversed(rows[:limit])), has_more
+
+    rows = query.order_by(ChatMessage.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
+
+def session_etag(db: Session, session: ChatSession) -> str:
+    """
+    Cheap validator for a session's contents: changes whenever the title,
+    updated_at or message set changes, without loading the messages.
+    """
+    count, last_id = db.query(func.count(ChatMessage.id), func.max(ChatMessage.id)).filter(
+        ChatMessage.session_id == session.id
+    ).one()
+    raw = f"{session.id}:{session.title}:{session.updated_at.isoformat()}:{count}:{last_id}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+def _fts_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression: every word must match,
+    the last one as a prefix so search-as-you-type works.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    quoted = ['"' + term + '"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search_messages(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    session_id: Optional[int] = None,
+    role: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Ranked (bm25) full-text search over chat history with highlighted snippets"""
+    match = _fts_query(query)
+    if not match:
+        return []
+
+    sql = """
+        SELECT m.id AS message_id, m.session_id, s.title AS session_title, m.role, m.timestamp,
+               snippet(chat_messages_fts, 0, '[', ']', '…', 12) AS snippet,
+               bm25(chat_messages_fts) AS rank
+        FROM chat_messages_fts
+        JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+        JOIN chat_sessions s ON s.id = m.session_id
+        WHERE chat_messages_fts MATCH :match
+    """
+    params: Dict[str, Any] = {"match": match, "limit": limit}
+    if session_id is not None:
+        sql += " AND m.session_id = :session_id"
+        params["session_id"] = session_id
+    if role:
+        sql += " AND m.role = :role"
+        params["role"] = role
+    sql += " ORDER BY rank LIMIT :limit"
+
+    rows = db.execute(text(sql), params).mappings().all()
+    return [
+        {
+            "message_id": row["message_id"],
+            "session_id": row["session_id"],
+            "session_title": row["session_title"],
+            "role": row["role"],
+            "timestamp": str(row["timestamp"]) if row["timestamp"] else None,
+            "snippet": row["snippet"],
+            "score": round(-row["rank"], 4),
+        }
+        for row in rows
+    ]
+
+@retry_on_locked
 def delete_chat_session(db: Session, session_id: int) -> bool:
     """Delete a chat session and all its messages"""
     session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
@@ -68,6 +174,7 @@ def delete_chat_session(db: Session, session_id: int) -> bool:
         return True
     return False
 
+@retry_on_locked
 def update_session_title(db: Session, session_id: int, title: str) -> Optional[ChatSession]:
     """Update the title of a chat session"""
     session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
@@ -107,6 +214,8 @@ def session_to_dict(session: ChatSession, include_messages: bool = False) -> Dic
     
     if include_messages:
         result["messages"] = [message_to_dict(msg) for msg in session.messages]
+        # Cursor for incremental sync via /chat/sessions/{id}/messages?after_id=
+        result["last_message_id"] = max((msg.id for msg in session.messages), default=None)
     else:
         result["message_count"] = len(session.messages)
     
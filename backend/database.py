@@ -1,15 +1,37 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Index, text, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.schema import CreateTable
 from datetime import datetime
+from functools import wraps
 import os
+import time
 
-# Database file location
-DB_PATH = os.path.join(os.path.dirname(__file__), "mahakaal_chats.db")
+# Database file location. In Docker this points into the mounted data directory:
+# in WAL mode the -wal/-shm files next to it hold committed data too.
+DB_PATH = os.getenv("CHAT_DB_PATH", os.path.join(os.path.dirname(__file__), "mahakaal_chats.db"))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Several uvicorn workers share this file: writers wait for the lock instead of
+# failing immediately, and WAL lets readers proceed while one worker writes.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_WRITE_RETRIES = int(os.getenv("SQLITE_WRITE_RETRIES", "5"))
+
 # Create engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+)
+
+@event.listens_for(engine, "connect")
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 # Session maker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -24,11 +46,14 @@ class ChatSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationship to messages
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
 
+    # AUTOINCREMENT: ids of deleted or archived sessions are never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
 class ChatMessage(Base):
     """Represents a single message in a chat session"""
     __tablename__ = "chat_messages"
@@ -45,10 +70,213 @@ class ChatMessage(Base):
     # Relationship to session
     session = relationship("ChatSession", back_populates="messages")
 
-def init_db():
-    """Initialize the database, creating tables if they don't exist"""
+    # Message windows/cursors are read per session in id order
+    __table_args__ = (Index("ix_chat_messages_session_id_id", "session_id", "id"), {"sqlite_autoincrement": True})
+
+class ArchivedSession(Base):
+    """Stub left in the hot database for a session moved to a compressed archive file"""
+    __tablename__ = "archived_sessions"
+
+    id = Column(Integer, primary_key=True)  # original chat_sessions.id
+    title = Column(String(200), nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime, index=True)
+    message_count = Column(Integer, default=0)
+    archive_file = Column(String(200), nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class EventAlias(Base):
+    """Short opaque alias shown to the LLM in place of a long Google event id"""
+    __tablename__ = "event_aliases"
+
+    alias = Column(String(16), primary_key=True)
+    event_id = Column(String(1024), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CacheVersion(Base):
+    """Version counter shared by all workers; bumping it invalidates every worker's local cache"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class TurnEvent(Base):
+    """Buffered agent event, so a turn can be resumed through any worker"""
+    __tablename__ = "turn_events"
+
+    turn_id = Column(String(64), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class PendingMutation(Base):
+    """Journaled calendar write awaiting delivery to Google (write-behind mode)"""
+    __tablename__ = "pending_mutations"
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String(1024), nullable=False, index=True)
+    kind = Column(String(16), nullable=False)  # 'create', 'patch', 'delete'
+    body = Column(Text, nullable=True)  # JSON event fields
+    description = Column(Text, nullable=True)  # human-readable, for failure reports
+    session_id = Column(Integer, nullable=True)
+    status = Column(String(16), nullable=False, default="pending", index=True)  # 'pending', 'flushing', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TokenUsage(Base):
+    """LLM token counts for one agent turn and model tier (the token ledger)"""
+    __tablename__ = "token_usage"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, nullable=True, index=True)  # no FK: usage outlives deleted chats
+    turn_id = Column(String(64), nullable=True, index=True)
+    user = Column(String(200), nullable=True)
+    tier = Column(String(20), nullable=False)
+    model = Column(String(100), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (Index("ix_token_usage_user_created", "user", "created_at"),)
+
+# Full-text index over chat_messages.content, kept in sync by triggers.
+# External-content FTS5 table: stores only the index, rows live in chat_messages.
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+        content, content='chat_messages', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE OF content ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+def _init_fts():
+    """Create the FTS5 index and triggers; backfill existing messages the first time."""
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chat_messages_fts'"
+        )).first()
+        for ddl in FTS_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')"))
+
+def _enable_incremental_vacuum():
+    """
+    Switch the file to auto_vacuum=INCREMENTAL so freed pages (e.g. after
+    archival) can be returned to the OS in small steps. Changing the mode on an
+    existing database needs one full VACUUM, done once here.
+    """
+    with engine.connect() as conn:
+        mode = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+        if mode != 2:
+            conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+
+def incremental_vacuum(pages: int = 1000) -> int:
+    """Release up to `pages` free pages back to the filesystem; returns pages still free."""
+    raw = engine.raw_connection()
+    try:
+        # sqlite3's execute() steps this pragma only once (one page);
+        # executescript() runs it to completion.
+        raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        cursor = raw.cursor()
+        cursor.execute("PRAGMA freelist_count")
+        return cursor.fetchone()[0]
+    finally:
+        raw.close()
+
+def _migrate_autoincrement() -> list:
+    """
+    Rebuild chat tables created before they were declared AUTOINCREMENT (SQLite
+    can't alter a primary key in place). Rows keep their ids; indexes and FTS
+    triggers are recreated by init_db. Returns the names of rebuilt tables.
+    """
+    migrated = []
+    with engine.begin() as conn:
+        for table in (ChatSession.__table__, ChatMessage.__table__):
+            sql = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name=:name"
+            ), {"name": table.name}).scalar()
+            if sql is None or "AUTOINCREMENT" in sql.upper():
+                continue
+            new_name = f"{table.name}_autoincrement"
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            conn.execute(text(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {new_name} ", 1)))
+            columns = ", ".join(column.name for column in table.columns)
+            conn.execute(text(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {new_name} RENAME TO {table.name}"))
+            migrated.append(table.name)
+    return migrated
+
+def reserve_ids(table_name: str, floor: int):
+    """Make an AUTOINCREMENT table hand out ids above `floor` from now on."""
+    with engine.begin() as conn:
+        current = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name=:name"), {"name": table_name}).scalar()
+        if current is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table_name, "seq": floor})
+        elif current < floor:
+            conn.execute(text("UPDATE sqlite_sequence SET seq=:seq WHERE name=:name"), {"name": table_name, "seq": floor})
+
+def init_db() -> list:
+    """
+    Initialize the database, creating tables if they don't exist. Returns the
+    chat tables that had to be rebuilt as AUTOINCREMENT (see archive).
+    """
+    _enable_incremental_vacuum()
+    migrated = _migrate_autoincrement()
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    _init_fts()
     print(f"✓ Database initialized at {DB_PATH}")
+    return migrated
+
+def _is_lock_error(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
+
+def retry_on_locked(func):
+    """
+    Retry a write when SQLite is still locked after busy_timeout (e.g. another
+    worker holds a long write transaction). The wrapped function must take the
+    Session as its first argument and be safe to re-run after a rollback.
+    """
+    @wraps(func)
+    def wrapper(db: Session, *args, **kwargs):
+        for attempt in range(SQLITE_WRITE_RETRIES):
+            try:
+                return func(db, *args, **kwargs)
+            except OperationalError as e:
+                db.rollback()
+                if not _is_lock_error(e) or attempt == SQLITE_WRITE_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+    return wrapper
 
 def get_db():
     """Get database session"""
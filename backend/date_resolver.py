@@ -0,0 +1,304 @@
+import re
+import datetime
+from typing import List, Optional, NamedTuple, Union, Tuple
+from dateutil import parser as date_parser
+from dateutil.relativedelta import relativedelta, MO, TU, WE, TH, FR, SA, SU
+
+# Deterministic resolution of relative date expressions ("next Sunday", "this
+# weekend", "the Tuesday after next", "in 3 weeks") to concrete CST dates, for
+# the resolve_dates skill. A small grammar handles the relative forms with
+# dateutil's relativedelta; anything else goes to dateutil's parser for
+# absolute dates ("Nov 6", "12/25", "2026-11-02"). Weeks start on Monday.
+# Conventions for ambiguous forms:
+#   "friday" / "this friday"   -> the next Friday, counting today
+#   "next friday"              -> the first Friday after today (note gives Friday of next week)
+#   "the friday after next"    -> one week after "next friday"
+#   "friday next week"         -> the Friday of next week
+#   "next weekend"             -> the weekend of next week
+#   "the 15th" / "dec 3"       -> the next such date, counting today (with a note if that rolled forward)
+#   "at 3" / "3:30"            -> 1-7 without am/pm mean the afternoon (with a note)
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_WEEKDAY_ALIASES = {
+    "mon": 0, "tue": 1, "tues": 1, "wed": 2, "weds": 2, "thu": 3, "thur": 3, "thurs": 3,
+    "fri": 4, "sat": 5, "sun": 6,
+}
+_WEEKDAY_ALIASES.update({name: i for i, name in enumerate(WEEKDAYS)})
+_RELATIVE_WEEKDAYS = [MO, TU, WE, TH, FR, SA, SU]
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+_WD = r"(?P<wd>" + "|".join(sorted(_WEEKDAY_ALIASES, key=len, reverse=True)) + r")"
+_NUM = r"(?P<n>\d+|" + "|".join(NUMBER_WORDS) + r")"
+_UNIT = r"(?P<unit>day|week|fortnight|month|year)s?"
+_TIME_RE = re.compile(
+    r"(?:\s*,)?\s+(?:at\s+)?(?P<time>\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}|noon|midnight)$"
+    r"|\s+at\s+(?P<hour>\d{1,2})$"
+)
+_PART_OF_DAY_RE = re.compile(r"\s+(?:morning|afternoon|evening|night)$")
+
+
+class Resolution(NamedTuple):
+    start: datetime.date
+    end: datetime.date
+    time: Optional[datetime.time] = None
+    note: Optional[str] = None
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("’", "'").strip()
+    text = re.sub(r"[?!.]+$", "", text)
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"^(?:on|for|by) ", "", text)
+
+
+def _weekday(word: str) -> int:
+    return _WEEKDAY_ALIASES[word]
+
+
+def _number(word: str) -> int:
+    return int(word) if word.isdigit() else NUMBER_WORDS[word]
+
+
+def _delta(n: int, unit: str) -> relativedelta:
+    if unit == "fortnight":
+        return relativedelta(days=14 * n)
+    return relativedelta(**{unit + "s": n})
+
+
+def _week_start(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _upcoming(day: datetime.date, weekday: int, include_today: bool) -> datetime.date:
+    """The first `weekday` on or after (include_today) / strictly after `day`."""
+    start = day if include_today else day + datetime.timedelta(days=1)
+    return start + relativedelta(weekday=_RELATIVE_WEEKDAYS[weekday])
+
+
+def _previous(day: datetime.date, weekday: int) -> datetime.date:
+    return day + relativedelta(days=-1, weekday=_RELATIVE_WEEKDAYS[weekday](-1))
+
+
+def _single(day: datetime.date, note: Optional[str] = None) -> Resolution:
+    return Resolution(day, day, note=note)
+
+
+def _period(kind: str, offset: int, today: datetime.date) -> Resolution:
+    """The week/weekend/month/year `offset` periods from the current one."""
+    if kind == "week":
+        start = _week_start(today) + datetime.timedelta(weeks=offset)
+        return Resolution(start, start + datetime.timedelta(days=6))
+    if kind == "weekend":
+        saturday = _week_start(today) + datetime.timedelta(weeks=offset, days=5)
+        return Resolution(saturday, saturday + datetime.timedelta(days=1))
+    if kind == "month":
+        start = today.replace(day=1) + relativedelta(months=offset)
+        return Resolution(start, start + relativedelta(months=1, days=-1))
+    start = today.replace(month=1, day=1) + relativedelta(years=offset)
+    return Resolution(start, start.replace(month=12, day=31))
+
+
+_OFFSETS = {"this": 0, "current": 0, "coming": 0, "next": 1, "last": -1, "past": -1, "previous": -1}
+
+
+def _resolve_day(text: str, today: datetime.date) -> Resolution:
+    if text in ("today", "tonight", "now", "this morning", "this afternoon", "this evening"):
+        return _single(today)
+    text = _PART_OF_DAY_RE.sub("", text)
+    text = re.sub(r"^the ", "", text)
+    if text == "tomorrow":
+        return _single(today + datetime.timedelta(days=1))
+    if text == "yesterday":
+        return _single(today - datetime.timedelta(days=1))
+    if text == "day after tomorrow":
+        return _single(today + datetime.timedelta(days=2))
+    if text == "day before yesterday":
+        return _single(today - datetime.timedelta(days=2))
+
+    # friday / this friday / this coming friday / next friday / last friday
+    match = re.fullmatch(r"(?:(?P<rel>this coming|this|coming|next|last|past|previous) )?" + _WD, text)
+    if match:
+        weekday, rel = _weekday(match["wd"]), match["rel"]
+        if rel in (None, "this", "coming", "this coming"):
+            return _single(_upcoming(today, weekday, include_today=rel in (None, "this")))
+        if rel == "next":
+            day = _upcoming(today, weekday, include_today=False)
+            of_next_week = _week_start(today) + datetime.timedelta(weeks=1, days=weekday)
+            note = None
+            if of_next_week != day:
+                note = f"if the {WEEKDAYS[weekday].title()} of next week was meant: {of_next_week}"
+            return _single(day, note)
+        return _single(_previous(today, weekday))
+
+    # friday next week / next week friday / friday of last week
+    match = (re.fullmatch(_WD + r"(?: of)? (?P<rel>this|next|last) week", text)
+             or re.fullmatch(r"(?P<rel>this|next|last) week(?:'s)? " + _WD, text))
+    if match:
+        week = _period("week", _OFFSETS[match["rel"]], today)
+        return _single(week.start + datetime.timedelta(days=_weekday(match["wd"])))
+
+    # the friday after next
+    match = re.fullmatch(_WD + r" after next", text)
+    if match:
+        return _single(_upcoming(today, _weekday(match["wd"]), include_today=False) + datetime.timedelta(weeks=1))
+
+    # the week/weekend after next
+    match = re.fullmatch(r"(?P<kind>week|weekend) after next", text)
+    if match:
+        return _period(match["kind"], 2, today)
+
+    # this weekend / next month / last year / the coming week
+    match = re.fullmatch(r"(?P<rel>this|current|coming|next|last|past|previous) (?P<kind>week|weekend|month|year)", text)
+    if match:
+        resolution = _period(match["kind"], _OFFSETS[match["rel"]], today)
+        if match["kind"] == "weekend" and match["rel"] == "next" and today.weekday() < 5:
+            coming = _period("weekend", 0, today)
+            resolution = resolution._replace(note=f"if the coming weekend was meant: {coming.start} to {coming.end}")
+        return resolution
+    if text in ("weekend", "week", "month", "year"):
+        return _period(text, 0, today)
+
+    # end of the month / start of next week / beginning of the year
+    match = re.fullmatch(
+        r"(?P<edge>end|start|beginning) of (?:the )?(?:(?P<rel>this|next|last) )?(?P<kind>week|month|year)", text
+    )
+    if match:
+        period = _period(match["kind"], _OFFSETS[match["rel"] or "this"], today)
+        return _single(period.end if match["edge"] == "end" else period.start)
+
+    # next 3 days / the past 2 weeks (ranges ending or starting today)
+    match = re.fullmatch(r"(?P<rel>next|coming|last|past) " + _NUM + " " + _UNIT, text)
+    if match:
+        span = _delta(_number(match["n"]), match["unit"])
+        if match["rel"] in ("next", "coming"):
+            return Resolution(today, today + span - datetime.timedelta(days=1))
+        return Resolution(today - span + datetime.timedelta(days=1), today)
+
+    # in 3 weeks / in a fortnight
+    match = re.fullmatch(r"in " + _NUM + " " + _UNIT, text)
+    if match:
+        return _single(today + _delta(_number(match["n"]), match["unit"]))
+
+    # 2 weeks ago
+    match = re.fullmatch(_NUM + " " + _UNIT + " ago", text)
+    if match:
+        return _single(today - _delta(_number(match["n"]), match["unit"]))
+
+    # 3 days after next friday / 2 weeks from tomorrow / a week before dec 24
+    match = re.fullmatch(_NUM + " " + _UNIT + r" (?P<dir>after|from|before) (?P<anchor>.+)", text)
+    if match:
+        anchor = _resolve_day(match["anchor"], today).start
+        span = _delta(_number(match["n"]), match["unit"])
+        return _single(anchor - span if match["dir"] == "before" else anchor + span)
+
+    # the friday after next week / the monday before the 15th
+    match = re.fullmatch(_WD + r" (?P<dir>after|before) (?P<anchor>.+)", text)
+    if match:
+        anchor = _resolve_day(match["anchor"], today).start
+        weekday = _weekday(match["wd"])
+        if match["dir"] == "after":
+            return _single(_upcoming(anchor, weekday, include_today=False))
+        return _single(_previous(anchor, weekday))
+
+    return _parse_absolute(text, today)
+
+
+# Two defaults that differ in year and month (both leap years, both 31-day months)
+_PROBE_DEFAULTS = (datetime.datetime(2000, 1, 1), datetime.datetime(2004, 3, 1))
+
+
+def _parse_absolute(text: str, today: datetime.date) -> Resolution:
+    """
+    Absolute dates via dateutil; a missing year/month comes from today. A date
+    without a year that would fall before today is taken as the next one ("the
+    15th" on the 19th is next month's), noting the past reading.
+    """
+    text = re.sub(r"\b(?:of|the)\b", " ", text)
+    default = datetime.datetime.combine(today, datetime.time())
+    try:
+        day = date_parser.parse(text, default=default).date()
+        probes = [date_parser.parse(text, default=d) for d in _PROBE_DEFAULTS]
+    except (ValueError, OverflowError):
+        raise ValueError("unrecognized date expression")
+    if day >= today or probes[0].year == probes[1].year:
+        return _single(day)
+    if probes[0].month == probes[1].month:
+        upcoming = day + relativedelta(years=1)
+    else:
+        # Day of month only: the next month that has that day
+        upcoming = next(
+            candidate for candidate in (
+                _replace_day(today.replace(day=1) + relativedelta(months=n), day.day) for n in range(1, 13)
+            ) if candidate
+        )
+    return _single(upcoming, f"{day} has already passed; give the year if it was meant")
+
+
+def _replace_day(month_start: datetime.date, day: int) -> Optional[datetime.date]:
+    try:
+        return month_start.replace(day=day)
+    except ValueError:
+        return None
+
+
+def _parse_time(text: str) -> Tuple[datetime.time, Optional[str]]:
+    """Time of day, plus a note when a bare 1-7 o'clock was read as pm."""
+    if text == "noon":
+        return datetime.time(12, 0), None
+    if text == "midnight":
+        return datetime.time(0, 0), None
+    # A bare "3" would parse as the 3rd of the month
+    at = date_parser.parse(f"{text}:00" if text.isdigit() else text).time()
+    if not re.search(r"am|pm", text) and not text.startswith("0") and 1 <= at.hour <= 7:
+        # Nobody books "at 3" meaning 3 in the morning
+        pm = at.replace(hour=at.hour + 12)
+        return pm, f"{text} read as {pm:%H:%M}; say {text}am for the morning"
+    return at, None
+
+
+def resolve(expression: str, today: Optional[datetime.date] = None) -> Resolution:
+    """Resolve one expression; raises ValueError if it can't be understood."""
+    today = today or datetime.datetime.now(CST).date()
+    text = _normalize(expression)
+    if not text:
+        raise ValueError("empty expression")
+    at, time_note = None, None
+    match = _TIME_RE.search(text)
+    if match and match.start() > 0:
+        at, time_note = _parse_time(match["time"] or match["hour"])
+        text = text[:match.start()].strip()
+    resolution = _resolve_day(text, today)
+    note = "; ".join(filter(None, [resolution.note, time_note])) or None
+    return resolution._replace(time=at, note=note)
+
+
+def _describe(resolution: Resolution) -> str:
+    start, end = resolution.start, resolution.end
+    if start == end:
+        text = f"{start} ({start:%A})"
+    else:
+        days = (end - start).days + 1
+        text = f"{start} ({start:%a}) to {end} ({end:%a}), {days} days [start_date={start}, days={days}]"
+    if resolution.time:
+        text += f" at {resolution.time:%H:%M}"
+    if resolution.note:
+        text += f" ({resolution.note})"
+    return text
+
+
+def resolve_all(expressions: Union[List[str], str], today: Optional[datetime.date] = None) -> str:
+    """One line per expression, prefixed with today's date so the model can sanity-check."""
+    today = today or datetime.datetime.now(CST).date()
+    if isinstance(expressions, str):
+        expressions = [expressions]
+    lines = [f"Today is {today:%A}, {today} (CST)."]
+    for expression in expressions:
+        try:
+            lines.append(f"'{expression}': {_describe(resolve(expression, today))}")
+        except ValueError as e:
+            lines.append(f"'{expression}': could not resolve ({e})")
+    return "\n".join(lines)
@@ -0,0 +1,290 @@
+import os
+import re
+import time
+import bisect
+import datetime
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+# In-process inverted index over every event this worker has fetched, for
+# search_events. Tokens from summaries, descriptions and locations, and a
+# separate attendee index (emails and display names) map to raw event ids.
+# Query terms match exactly, by prefix ("pri" -> "priya") or within a small
+# edit distance ("pryia" -> "priya"); every term must match. The index is fed
+# by the calendar cache (regular fetches, push resyncs and backfills of past or
+# far-future ranges) and by successful mutations, and it remembers which time
+# ranges it has seen so a search only goes upstream for the gaps. While a push
+# channel is live, upstream edits anywhere in the calendar reach the index via
+# resync (or drop its coverage via mark_stale), so EVENT_INDEX_PUSH_TTL is only
+# a long backstop; without one, ranges older than EVENT_INDEX_TTL are refetched.
+EVENT_INDEX_TTL = int(os.getenv("EVENT_INDEX_TTL", "1800"))
+EVENT_INDEX_PUSH_TTL = int(os.getenv("EVENT_INDEX_PUSH_TTL", str(7 * 86400)))
+# Fuzzy matching: terms of at least this many characters may be 1 edit away (2 from 8 on)
+FUZZY_MIN_LENGTH = 4
+PREFIX_MIN_LENGTH = 2
+
+# Field weights for ranking
+SUMMARY_WEIGHT = 3.0
+ATTENDEE_WEIGHT = 2.0
+OTHER_WEIGHT = 1.0
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_lock = threading.RLock()
+_docs: Dict[str, Dict[str, Any]] = {}
+_postings: Dict[str, Dict[str, float]] = {}   # term -> {event id: field weight}
+_people: Dict[str, Set[str]] = {}             # attendee term -> event ids
+_doc_terms: Dict[str, Tuple[Set[str], Set[str]]] = {}
+_exceptions: Dict[str, Set[str]] = {}         # recurring master id -> ids of its modified instances
+_vocabulary: List[str] = []
+_people_vocabulary: List[str] = []
+_vocabulary_dirty = False
+_covered: List[Tuple[datetime.datetime, datetime.datetime, float]] = []
+_push_active_until = 0.0
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _attendee_terms(event: Dict[str, Any]) -> Set[str]:
+    terms = set()
+    for attendee in event.get("attendees", []):
+        if attendee.get("self"):
+            continue
+        email = (attendee.get("email") or "").lower()
+        if email:
+            terms.add(email)
+            terms.update(tokenize(email.split("@")[0]))
+        terms.update(tokenize(attendee.get("displayName")))
+    return terms
+
+
+def _unindex(event_id: str):
+    global _vocabulary_dirty
+    terms = _doc_terms.pop(event_id, None)
+    event = _docs.pop(event_id, None)
+    if terms:
+        for term in terms[0]:
+            postings = _postings.get(term)
+            if postings is not None:
+                postings.pop(event_id, None)
+                if not postings:
+                    del _postings[term]
+                    _vocabulary_dirty = True
+        for term in terms[1]:
+            ids = _people.get(term)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del _people[term]
+                    _vocabulary_dirty = True
+    if event and event.get("recurringEventId"):
+        siblings = _exceptions.get(event["recurringEventId"])
+        if siblings:
+            siblings.discard(event_id)
+
+
+def _index(event: Dict[str, Any]):
+    global _vocabulary_dirty
+    event_id = event["id"]
+    _unindex(event_id)
+    if event.get("status") == "cancelled":
+        if event.get("recurringEventId"):
+            # A deleted occurrence: never matches, but keeps the series from expanding it
+            _docs[event_id] = event
+            _exceptions.setdefault(event["recurringEventId"], set()).add(event_id)
+        return
+    weights: Dict[str, float] = {}
+    for term in tokenize(event.get("description")) + tokenize(event.get("location")):
+        weights[term] = OTHER_WEIGHT
+    people = _attendee_terms(event)
+    for term in people:
+        weights[term] = max(weights.get(term, 0.0), ATTENDEE_WEIGHT)
+    for term in tokenize(event.get("summary")):
+        weights[term] = SUMMARY_WEIGHT
+    for term, weight in weights.items():
+        if term not in _postings:
+            _vocabulary_dirty = True
+        _postings.setdefault(term, {})[event_id] = weight
+    for term in people:
+        if term not in _people:
+            _vocabulary_dirty = True
+        _people.setdefault(term, set()).add(event_id)
+    _docs[event_id] = event
+    _doc_terms[event_id] = (set(weights), people)
+    if event.get("recurringEventId"):
+        _exceptions.setdefault(event["recurringEventId"], set()).add(event_id)
+
+
+def add(items: List[Dict[str, Any]]):
+    """Index fetched events (replacing older copies); cancelled ones are dropped."""
+    with _lock:
+        for event in items:
+            _index(event)
+
+
+def _series_instance(event_id: str) -> bool:
+    """An occurrence of an indexed recurring series that has no document of its own."""
+    return event_id not in _docs and "_" in event_id and event_id.rsplit("_", 1)[0] in _docs
+
+
+def remove(event_id: str):
+    """Drop a deleted event. Deleting one occurrence of a series forces a refetch instead."""
+    with _lock:
+        if _series_instance(event_id):
+            _covered.clear()
+        _unindex(event_id)
+
+
+def apply_patch(event_id: str, changes: Dict[str, Any]):
+    """Reflect a delivered patch in an already indexed event."""
+    with _lock:
+        event = _docs.get(event_id)
+        if event is not None:
+            _index({**event, **changes})
+        elif _series_instance(event_id):
+            _covered.clear()
+
+
+# ===== Coverage =====
+
+def mark_covered(start: datetime.datetime, end: datetime.datetime):
+    with _lock:
+        _covered.append((start, end, time.time()))
+
+
+def set_push_active(until: float):
+    """Mirrors calendar_cache.set_push_active (expiry of the live watch channel, 0 when there is none)."""
+    global _push_active_until
+    _push_active_until = until
+
+
+def _ttl() -> int:
+    return EVENT_INDEX_PUSH_TTL if time.time() < _push_active_until else EVENT_INDEX_TTL
+
+
+def mark_stale():
+    """The calendar changed in ways not seen here: every range must be refetched before it is trusted."""
+    with _lock:
+        _covered.clear()
+
+
+def missing(start: datetime.datetime, end: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """Parts of [start, end) not covered by a fetch that is still trusted (see _ttl)."""
+    now = time.time()
+    ttl = _ttl()
+    with _lock:
+        _covered[:] = [c for c in _covered if now - c[2] <= ttl]
+        fresh = sorted((s, e) for s, e, _ in _covered)
+    gaps = []
+    cursor = start
+    for c_start, c_end in fresh:
+        if c_end <= cursor:
+            continue
+        if c_start >= end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+# ===== Matching =====
+
+def _edit_distance_at_most(a: str, b: str, limit: int) -> bool:
+    """Edit distance with adjacent transpositions counting as one edit ("pryia" -> "priya")."""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+def _refresh_vocabulary():
+    global _vocabulary, _people_vocabulary, _vocabulary_dirty
+    if _vocabulary_dirty:
+        _vocabulary = sorted(_postings)
+        _people_vocabulary = sorted(_people)
+        _vocabulary_dirty = False
+
+
+def _expand_term(term: str, vocabulary: List[str]) -> List[Tuple[str, float]]:
+    """Indexed terms matching a query term, with a match-quality factor."""
+    matches = []
+    position = bisect.bisect_left(vocabulary, term)
+    if position < len(vocabulary) and vocabulary[position] == term:
+        matches.append((term, 1.0))
+    if len(term) >= PREFIX_MIN_LENGTH:
+        for candidate in vocabulary[position:]:
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                matches.append((candidate, PREFIX_FACTOR))
+    if not matches and len(term) >= FUZZY_MIN_LENGTH:
+        limit = 2 if len(term) >= 8 else 1
+        matches = [(c, FUZZY_FACTOR) for c in vocabulary if _edit_distance_at_most(term, c, limit)]
+    return matches
+
+
+def match(query: str = "", attendee: str = "") -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+    """
+    ({event id: score}, raw events) for events matching every query term and,
+    if given, every attendee term. Raw events include the modified instances of
+    matching recurring series so they can be expanded correctly.
+    """
+    terms = tokenize(query)
+    with _lock:
+        _refresh_vocabulary()
+        scores: Optional[Dict[str, float]] = None
+        for term in terms:
+            term_scores: Dict[str, float] = {}
+            for candidate, factor in _expand_term(term, _vocabulary):
+                for event_id, weight in _postings[candidate].items():
+                    term_scores[event_id] = max(term_scores.get(event_id, 0.0), weight * factor)
+            scores = term_scores if scores is None else {
+                event_id: score + term_scores[event_id] for event_id, score in scores.items() if event_id in term_scores
+            }
+            if not scores:
+                return {}, []
+        person = attendee.strip().lower()
+        if person:
+            # Full email, or every name/email-part term (by prefix)
+            person_terms = [person] if "@" in person else tokenize(person)
+            allowed: Optional[Set[str]] = None
+            for term in person_terms:
+                ids = set()
+                for candidate, _ in _expand_term(term, _people_vocabulary):
+                    ids |= _people[candidate]
+                allowed = ids if allowed is None else allowed & ids
+            allowed = allowed or set()
+            if scores is None:
+                scores = {event_id: ATTENDEE_WEIGHT for event_id in allowed}
+            else:
+                scores = {event_id: score for event_id, score in scores.items() if event_id in allowed}
+        if scores is None:
+            return {}, []
+        raw_ids = set(scores)
+        for event_id in scores:
+            raw_ids |= _exceptions.get(event_id, set())
+        return scores, [_docs[event_id] for event_id in raw_ids if event_id in _docs]
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {"events": len(_docs), "terms": len(_postings), "people": len(_people), "ranges": len(_covered)}
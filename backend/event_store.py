@@ -0,0 +1,153 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+from sqlalchemy import create_engine, Column, Integer, String, Index, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+import process_sync
+from database import SQLITE_BUSY_TIMEOUT_MS
+
+# Local event store for the offline/demo skill backend (skills.py).
+# Replaces the old events.json file: indexed by date/time, transactional writes,
+# AUTOINCREMENT ids that are never reused after deletions, and one event per
+# date/time slot enforced by a unique index (so it holds across workers).
+EVENTS_DB_PATH = os.getenv("EVENTS_DB_PATH", str(Path(__file__).parent / "events.db"))
+LEGACY_EVENTS_FILE = Path(__file__).parent / "events.json"
+
+engine = create_engine(
+    f"sqlite:///{EVENTS_DB_PATH}",
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
+
+
+@event.listens_for(engine, "connect")
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+class LocalEvent(Base):
+    """A calendar event in the local store"""
+    __tablename__ = "events"
+    __table_args__ = (
+        Index("ux_events_date_time", "date", "time", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(200), nullable=False)
+    date = Column(String(10), nullable=False)  # YYYY-MM-DD
+    time = Column(String(5), nullable=False)   # HH:MM (24h)
+    created_at = Column(String(19))
+
+
+def _to_dict(e: LocalEvent) -> dict:
+    return {"id": e.id, "title": e.title, "date": e.date, "time": e.time, "created_at": e.created_at}
+
+
+def _migrate_legacy_file():
+    """One-time import of events.json; the file is renamed so it is not imported twice."""
+    if not LEGACY_EVENTS_FILE.exists() or LEGACY_EVENTS_FILE.is_dir():
+        return
+    try:
+        with open(LEGACY_EVENTS_FILE, "r") as f:
+            legacy = json.load(f)
+    except json.JSONDecodeError:
+        legacy = []
+    db = SessionLocal()
+    try:
+        # The old file never enforced one event per slot; later duplicates are dropped
+        taken = set(db.query(LocalEvent.date, LocalEvent.time).all())
+        skipped = 0
+        for item in legacy:
+            slot = (item.get("date"), item.get("time"))
+            if slot in taken:
+                skipped += 1
+                continue
+            taken.add(slot)
+            db.add(LocalEvent(
+                title=item.get("title", "Untitled"),
+                date=item.get("date"),
+                time=item.get("time"),
+                created_at=item.get("created_at"),
+            ))
+        db.commit()
+    finally:
+        db.close()
+    LEGACY_EVENTS_FILE.rename(LEGACY_EVENTS_FILE.with_suffix(".json.migrated"))
+    print(f"✓ Imported {len(legacy) - skipped} events from {LEGACY_EVENTS_FILE.name}"
+          + (f" ({skipped} double bookings skipped)" if skipped else ""))
+
+
+def _ensure_unique_slots():
+    """Stores created before the unique index get it now, replacing the plain one."""
+    slot_index = next(i for i in LocalEvent.__table__.indexes if i.name == "ux_events_date_time")
+    try:
+        slot_index.create(bind=engine, checkfirst=True)
+    except IntegrityError:
+        print("⚠️ events.db already has two events in one slot; double bookings are only prevented per process")
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_events_date_time")
+
+
+def init_store():
+    # Several workers import this module at once
+    with process_sync.file_lock("events-db-init"):
+        Base.metadata.create_all(bind=engine)
+        _ensure_unique_slots()
+        _migrate_legacy_file()
+
+
+def events_on(date_str: str) -> List[dict]:
+    """Events on a date, ordered by time (index range scan)."""
+    db = SessionLocal()
+    try:
+        rows = db.query(LocalEvent).filter(LocalEvent.date == date_str).order_by(LocalEvent.time).all()
+        return [_to_dict(e) for e in rows]
+    finally:
+        db.close()
+
+
+_write_lock = threading.Lock()
+
+
+def add_event_if_free(title: str, date_str: str, time_str: str, created_at: str) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Conflict check (indexed point lookup) and insert in one transaction.
+    Returns (new_event, None) on success or (None, conflicting_event).
+    The lock only serialises this process; another worker booking the same
+    slot in between is caught by the unique index.
+    """
+    with _write_lock:
+        db = SessionLocal()
+        try:
+            conflict = db.query(LocalEvent).filter(
+                LocalEvent.date == date_str, LocalEvent.time == time_str
+            ).first()
+            if conflict:
+                return None, _to_dict(conflict)
+            row = LocalEvent(title=title, date=date_str, time=time_str, created_at=created_at)
+            db.add(row)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                conflict = db.query(LocalEvent).filter(
+                    LocalEvent.date == date_str, LocalEvent.time == time_str
+                ).first()
+                return None, _to_dict(conflict)
+            db.refresh(row)
+            return _to_dict(row), None
+        finally:
+            db.close()
+
+
+init_store()
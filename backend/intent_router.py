@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import uuid
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import calendar_cache
+import date_resolver
+import model_router
+import skills_google
+
+# Deterministic fast path in front of the agent loop.
+# A handful of formulaic read requests ("what's on today", "what time is it")
+# are recognised by a small grammar and answered by calling the skill directly
+# and filling in a template, with no LLM round trip. The turn still emits the
+# same tool-call/tool-result history entries as an LLM turn. Anything that does
+# not match a rule completely falls through to the LLM.
+FAST_PATH_ENABLED = os.getenv("AGENT_FAST_PATH", "true").lower() == "true"
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Greetings/politeness that don't change the intent
+_FILLER_RE = re.compile(r"^(?:(?:hey|hi|hello|ok|okay|so|um|please|mahakaal)\b\s*)+|(?:\s*\b(?:please|thanks|thank you))+$")
+
+_DAY = r"(?P<day>today|tonight|tomorrow|yesterday|(?:this )?(?:" + "|".join(WEEKDAYS) + r"))"
+_WHAT = r"(?:what(?:s| is)|whats|what do i have|what have i got)"
+_HAVE = r"(?:what do i have|what have i got)"
+_CALENDAR = r"(?:calendar|schedule|agenda|day|plans)"
+
+SCHEDULE_PATTERNS = [
+    # what's on (my calendar) (for) today / what's my schedule tomorrow
+    rf"{_WHAT} (?:on |going on |happening |planned )?(?:on |in )?(?:my {_CALENDAR} )?(?:for |on )?{_DAY}",
+    rf"{_WHAT} my {_CALENDAR} (?:look like )?(?:for |on )?{_DAY}(?: look like)?",
+    rf"{_HAVE} (?:for |on )?{_DAY}",
+    rf"what does my {_CALENDAR} look like (?:for |on )?{_DAY}",
+    # show/list/check my schedule for tomorrow
+    rf"(?:show|list|check|give|tell)(?: me)? (?:my |the )?(?:{_CALENDAR}|events|meetings) (?:for |on )?{_DAY}",
+    # do i have anything/any meetings today / am i free tomorrow / am i busy on friday
+    rf"(?:do i have|have i got) (?:anything|any (?:events|meetings|plans)|meetings|events|plans)(?: on| planned| scheduled)?(?: for| on)? {_DAY}",
+    rf"am i (?:free|busy)(?: on)? {_DAY}",
+    # today's schedule / tomorrow's agenda
+    rf"{_DAY}s (?:{_CALENDAR}|events|meetings)",
+    rf"(?:my )?(?:{_CALENDAR}|events|meetings) (?:for )?{_DAY}",
+]
+
+TIME_PATTERNS = [
+    r"(?:what(?:s| is)|whats) the (?:current )?time(?: now| right now)?",
+    r"what time is it(?: now| right now)?",
+    r"(?:current )?time(?: now)?",
+    r"(?:what(?:s| is)|whats) (?:the date|todays date|the date today|the day today)",
+    r"what day is (?:it|today)(?: today)?",
+    r"what(?:s| is) today",
+]
+
+_SCHEDULE_RES = [re.compile(p + r"$") for p in SCHEDULE_PATTERNS]
+_TIME_RES = [re.compile(p + r"$") for p in TIME_PATTERNS]
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop apostrophes/punctuation and filler words, collapse whitespace."""
+    text = text.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return _FILLER_RE.sub("", text).strip()
+
+
+def _resolve_day(word: str, today: datetime.date) -> datetime.date:
+    # Bare weekday: the next one, counting today
+    return date_resolver.resolve(word, today).start
+
+
+def classify(text: str, today: Optional[datetime.date] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    ("list_events", {"date_str": ..., "label": ...}) or ("get_current_datetime", {})
+    (label is the relative word used, e.g. "tomorrow", or None for weekdays)
+    for a message that matches a rule completely, else None.
+    """
+    normalized = normalize(text)
+    if not normalized:
+        return None
+    for pattern in _TIME_RES:
+        if pattern.match(normalized):
+            return "get_current_datetime", {}
+    for pattern in _SCHEDULE_RES:
+        match = pattern.match(normalized)
+        if match:
+            today = today or datetime.datetime.now(CST).date()
+            word = match.group("day")
+            day = _resolve_day(word, today)
+            label = word if word in ("today", "tonight", "tomorrow", "yesterday") else None
+            return "list_events", {"date_str": day.strftime("%Y-%m-%d"), "label": label}
+    return None
+
+
+def _event_line(event: Dict[str, Any]) -> str:
+    title = event.get("summary", "No Title")
+    if "date" in event["start"]:
+        return f"- All day: {title}"
+    start = calendar_cache.event_start(event).astimezone(CST)
+    end = calendar_cache.event_end(event).astimezone(CST)
+    return f"- {start:%H:%M}-{end:%H:%M} {title}"
+
+
+def _schedule_answer(date_str: str, label: Optional[str]) -> str:
+    day = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    when = f"{label} ({day:%A, %b %d})" if label else f"{day:%A, %b %d}"
+    # The skill call just filled the calendar cache; this read doesn't go upstream
+    events = skills_google.events_on_day(date_str)
+    if not events:
+        return f"You have nothing on your calendar for {when}. You're free."
+    lines = [f"Here's your schedule for {when}:"] + [_event_line(e) for e in events]
+    return "\n".join(lines)
+
+
+def _time_answer(result: str) -> str:
+    return f"It's {result} (CST)."
+
+
+def _last_user_message(message_history: List[Dict[str, Any]]) -> Optional[str]:
+    if not message_history:
+        return None
+    last = message_history[-1]
+    if not isinstance(last, dict) or last.get("role") != "user":
+        return None
+    return last.get("content") or None
+
+
+def try_answer(message_history: List[Dict[str, Any]]) -> Optional[List[str]]:
+    """
+    NDJSON events for a fast-path turn, or None to run the LLM agent instead.
+    Everything is computed before anything is returned, so a failing skill
+    call simply falls through to the normal agent loop.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    text = _last_user_message(message_history)
+    intent = classify(text) if text else None
+    if not intent:
+        return None
+    tool_name, params = intent
+    arguments = {"date_str": params["date_str"]} if tool_name == "list_events" else {}
+
+    result = skills_google.execute_tool_call(tool_name, arguments)
+    if model_router.is_tool_failure(result):
+        return None
+    try:
+        if tool_name == "list_events":
+            answer = _schedule_answer(params["date_str"], params["label"])
+        else:
+            answer = _time_answer(result)
+    except Exception as e:
+        print(f"Fast path fell through: {e}")
+        return None
+
+    call_id = f"call_fast_{uuid.uuid4().hex[:16]}"
+    assistant_msg = {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": call_id,
+            "type": "function",
+            "function": {"name": tool_name, "arguments": json.dumps(arguments)},
+        }],
+    }
+    tool_msg = {"tool_call_id": call_id, "role": "tool", "name": tool_name, "content": result}
+    return [
+        json.dumps({"type": "history_append", "content": "Assistant tool call", "data": assistant_msg}) + "\n",
+        json.dumps({"type": "log", "content": f"Using Skill: {tool_name}", "data": arguments}) + "\n",
+        json.dumps({"type": "log", "content": f"Skill Result: {result}"}) + "\n",
+        json.dumps({"type": "history_append", "content": "Tool result", "data": tool_msg}) + "\n",
+        json.dumps({"type": "answer", "content": answer}) + "\n",
+    ]
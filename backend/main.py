@@ -1,28 +1,57 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+import json
+import uuid
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from agent import run_agent_stream
+import model_router
+import admission
+import answer_cache
+import profiling
+import memory
+import process_sync
+import archive
+import chat_export
+import calendar_watch
+import mutation_queue
+import token_ledger
+import event_index
+from turns import start_turn, get_turn
 from auth import router as auth_router
+from ws_chat import router as ws_router
 from database import init_db, get_db
 from chat_storage import (
     create_chat_session, save_message, get_chat_sessions,
     get_chat_session, get_session_messages, delete_chat_session,
-    update_session_title, session_to_dict, message_to_dict
+    update_session_title, session_to_dict, message_to_dict,
+    get_session_messages_window, session_etag, search_messages
 )
 
 app = FastAPI(title="Mahakaal API")
 app.include_router(auth_router)
+app.include_router(ws_router)
 
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
-    init_db()
+    # Workers start together; only one at a time may create tables or VACUUM
+    with process_sync.file_lock("db-init"):
+        if init_db():
+            archive.reserve_archived_ids()
+    archive.start_background_archiver()
+    calendar_watch.start_background_watcher()
+    mutation_queue.start_background_flusher()
+
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 # Allow CORS for frontend and mobile
 app.add_middleware(
@@ -35,22 +64,62 @@ app.add_middleware(
 
 class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]]
+    # Optional client-generated id; re-POSTing the same id attaches to the running turn
+    turn_id: Optional[str] = None
+    last_seq: int = 0
+    # Chat session the turn belongs to; queued calendar writes report failures there
+    session_id: Optional[int] = None
 
 @app.get("/")
 def read_root():
     return {"message": "Mahakaal Agent is Online. Time flows."}
 
 @app.post("/chat")
-def chat_endpoint(request: ChatRequest):
+def chat_endpoint(request: ChatRequest, http_request: Request):
     """
     Streaming endpoint.
     Client receives line-delimited JSON events.
+    The turn runs in the background; every event carries `turn_id` and `seq`
+    so a dropped client can resume via /chat/turns/{turn_id}.
+    Turns go through admission control, so the stream may begin with
+    queue-position status events (or a single "overloaded" error).
     """
+    user = admission.client_key(http_request.headers, http_request.client.host if http_request.client else None)
+    turn_id = request.turn_id or uuid.uuid4().hex
+    turn = start_turn(
+        lambda: admission.CONTROLLER.run(
+            user, lambda: run_agent_stream(request.messages, request.session_id, turn_id, user)
+        ),
+        turn_id
+    )
+    return StreamingResponse(
+        turn.read(request.last_seq), 
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/chat/turns/{turn_id}")
+def resume_turn(turn_id: str, after_seq: int = 0):
+    """Resume a turn's event stream after the last sequence number the client saw"""
+    turn = get_turn(turn_id)
+    if not turn:
+        raise HTTPException(status_code=404, detail="Turn not found or expired")
     return StreamingResponse(
-        run_agent_stream(request.messages), 
+        turn.read(after_seq),
         media_type="application/x-ndjson"
     )
 
+@app.get("/agent/metrics")
+def agent_metrics():
+    """Per-tier model latency and token totals since startup, plus routing and admission state"""
+    return {
+        "routing": model_router.routing_config(),
+        "admission": admission.CONTROLLER.snapshot(),
+        "answer_cache": answer_cache.stats(),
+        "token_budgets": token_ledger.budget_config(),
+        "event_index": event_index.stats(),
+        **model_router.GLOBAL_STATS.to_dict()
+    }
+
 # ===== Chat Session Management Endpoints =====
 
 class CreateSessionRequest(BaseModel):
@@ -74,30 +143,111 @@ def create_session(request: CreateSessionRequest, db: Session = Depends(get_db))
     return session_to_dict(session)
 
 @app.get("/chat/sessions")
-def list_sessions(db: Session = Depends(get_db)):
-    """Get all chat sessions"""
+def list_sessions(include_archived: bool = True, db: Session = Depends(get_db)):
+    """Get all chat sessions; archived ones are listed after them and opened transparently on access"""
     sessions = get_chat_sessions(db)
-    return [session_to_dict(s) for s in sessions]
+    result = [session_to_dict(s) for s in sessions]
+    if include_archived:
+        result += [archive.archived_session_to_dict(s) for s in archive.get_archived_sessions(db)]
+    return result
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+@app.get("/chat/search")
+def search_chat_history(
+    q: str,
+    limit: int = 20,
+    session_id: Optional[int] = None,
+    role: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Full-text search over past messages, ranked, with snippets and session ids"""
+    limit = max(1, min(limit, 100))
+    return {"query": q, "results": search_messages(db, q, limit=limit, session_id=session_id, role=role)}
 
 @app.get("/chat/sessions/{session_id}")
-def get_session(session_id: int, db: Session = Depends(get_db)):
-    """Get a specific chat session with all messages"""
+def get_session(session_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get a specific chat session with all messages (304 if If-None-Match is current)"""
+    archive.ensure_hot(db, session_id)
     session = get_chat_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    etag = session_etag(db, session)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return session_to_dict(session, include_messages=True)
 
+@app.get("/chat/sessions/{session_id}/messages")
+def get_session_messages_since(
+    session_id: int,
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Incremental/windowed message fetch.
+    after_id returns only messages newer than the client's last seen id;
+    before_id + limit pages back through long histories.
+    """
+    archive.ensure_hot(db, session_id)
+    session = get_chat_session(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    # Weak validator: same session state + same window parameters
+    session_tag = session_etag(db, session).strip('"')
+    window_etag = f'"{session_tag}-{after_id}-{before_id}-{limit}"'
+    if _etag_matches(request, window_etag):
+        return Response(status_code=304, headers={"ETag": "W/" + window_etag})
+
+    messages, has_more = get_session_messages_window(db, session_id, after_id, before_id, limit)
+    response.headers["ETag"] = "W/" + window_etag
+    return {
+        "session_id": session_id,
+        "messages": [message_to_dict(msg) for msg in messages],
+        "first_message_id": messages[0].id if messages else None,
+        "last_message_id": messages[-1].id if messages else None,
+        "has_more": has_more,
+    }
+
+@app.get("/chat/sessions/{session_id}/usage")
+def get_session_usage(session_id: int, turns: int = 50, db: Session = Depends(get_db)):
+    """Token ledger for a session: totals, per-tier totals and recent turns"""
+    archive.ensure_hot(db, session_id)
+    if not get_chat_session(db, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return token_ledger.session_usage(db, session_id, turn_limit=turns)
+
+@app.get("/chat/usage")
+def get_user_usage(request: Request, db: Session = Depends(get_db)):
+    """The caller's token usage over the last 24 hours (the per-user budget window)"""
+    user = admission.client_key(request.headers, request.client.host if request.client else None)
+    return token_ledger.user_usage(db, user)
+
 @app.delete("/chat/sessions/{session_id}")
 def remove_session(session_id: int, db: Session = Depends(get_db)):
     """Delete a chat session"""
-    success = delete_chat_session(db, session_id)
+    success = delete_chat_session(db, session_id) or archive.delete_archived_session(db, session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
+    memory.INDEX.forget_session(session_id)
     return {"status": "deleted", "session_id": session_id}
 
 @app.patch("/chat/sessions/{session_id}")
 def update_session(session_id: int, request: UpdateSessionRequest, db: Session = Depends(get_db)):
     """Update a chat session title"""
+    archive.ensure_hot(db, session_id)
     session = update_session_title(db, session_id, request.title)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -106,6 +256,8 @@ def update_session(session_id: int, request: UpdateSessionRequest, db: Session =
 @app.post("/chat/messages")
 def add_message(request: SaveMessageRequest, db: Session = Depends(get_db)):
     """Save a message to a chat session"""
+    if not archive.ensure_hot(db, request.session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
     message = save_message(
         db,
         session_id=request.session_id,
@@ -117,6 +269,103 @@ def add_message(request: SaveMessageRequest, db: Session = Depends(get_db)):
     )
     return {"status": "saved", "message_id": message.id}
 
+# ===== Calendar Push Notifications =====
+
+@app.post("/calendar/notifications")
+def calendar_notification(request: Request):
+    """Receiver for Google Calendar watch-channel pings; triggers an incremental cache resync"""
+    try:
+        return calendar_watch.handle_notification(request.headers)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+@app.get("/calendar/watch")
+def calendar_watch_status():
+    """Current watch channel and notification count"""
+    return calendar_watch.status()
+
+@app.get("/calendar/mutations")
+def calendar_mutations():
+    """Write-behind queue: queued/failed calendar writes"""
+    return mutation_queue.status()
+
+@app.post("/admin/calendar/watch")
+def renew_calendar_watch():
+    """Create or replace the watch channel now"""
+    if not calendar_watch.CALENDAR_WEBHOOK_URL:
+        raise HTTPException(status_code=400, detail="CALENDAR_WEBHOOK_URL is not configured")
+    from skills_google import _get_calendar_service
+    calendar_watch.ensure_channel(_get_calendar_service(), force=True)
+    return calendar_watch.status()
+
+@app.post("/admin/archive")
+def run_archive_now():
+    """Run one archival + incremental VACUUM pass immediately"""
+    return archive.run_maintenance()
+
+@app.get("/chat/export")
+def export_chats(compress: bool = False, include_archived: bool = False):
+    """Stream every session and message as NDJSON (gzip'd with compress=true)"""
+    return StreamingResponse(
+        chat_export.export_chunks(include_archived=include_archived, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=mahakaal-chats.ndjson{'.gz' if compress else ''}"}
+    )
+
+@app.post("/chat/import")
+async def import_chats(request: Request, preserve_ids: bool = False):
+    """
+    Bulk-load an export from the raw request body (NDJSON or gzip'd NDJSON).
+    The body is consumed as a stream; rows are written in large batches.
+    """
+    importer = chat_export.Importer(preserve_ids=preserve_ids)
+    decoder = chat_export.LineDecoder()
+    pending = []
+    try:
+        async for chunk in request.stream():
+            pending += [json.loads(line) for line in decoder.feed(chunk)]
+            if len(pending) >= chat_export.IMPORT_BATCH_SIZE:
+                await asyncio.to_thread(_add_records, importer, pending)
+                pending = []
+        pending += [json.loads(line) for line in decoder.close()]
+        await asyncio.to_thread(_add_records, importer, pending)
+        return await asyncio.to_thread(importer.finish)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid export data: {e}")
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Exported ids already exist; import without preserve_ids")
+
+def _add_records(importer: chat_export.Importer, records: List[Dict[str, Any]]):
+    for record in records:
+        importer.add(record)
+
+# ===== Request Profiling (only with PROFILING_ENABLED=true) =====
+
+def _require_profiling():
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+@app.post("/admin/profiling")
+def arm_profiling(requests: int = 1, path_prefix: str = "/chat"):
+    """Profile the next N requests under path_prefix (or send `X-Profile: 1` on a single request)"""
+    _require_profiling()
+    return profiling.arm(requests, path_prefix)
+
+@app.get("/admin/profiles")
+def list_profiles():
+    """Stored request profiles, newest first"""
+    _require_profiling()
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: str):
+    """Folded stacks (flamegraph.pl / speedscope format) for one profiled request"""
+    _require_profiling()
+    path = profiling.profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found (it may still be recording)")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
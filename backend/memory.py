@@ -0,0 +1,287 @@
+import os
+import re
+import zlib
+import importlib
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+from database import SessionLocal, ChatMessage
+import process_sync
+
+# Long-term recall over past conversations.
+# Messages from chat_messages are embedded into a NumPy matrix (incrementally, by
+# message id watermark) and the top-k most similar snippets are injected into the
+# agent prompt, so the client no longer has to send the full history.
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_DIM = int(os.getenv("MEMORY_DIM", "512"))
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.25"))
+# Optional "module:callable" returning an embedder; defaults to HashingEmbedder
+MEMORY_EMBEDDER = os.getenv("MEMORY_EMBEDDER", "")
+# Only this many recent messages of the live conversation are sent to the LLM
+MEMORY_HISTORY_MESSAGES = int(os.getenv("MEMORY_HISTORY_MESSAGES", "20"))
+MEMORY_SNIPPET_CHARS = 240
+MEMORY_SYNC_BATCH = 1000
+SHARED_VERSION_NAME = "memory"
+
+# Tool output and tool-call stubs are noise for recall; index what people said
+INDEXED_ROLES = ("user", "assistant")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free default embedder: signed feature hashing of word unigrams
+    and bigrams with sublinear term frequency, L2-normalised.
+    Any object with `dim` and `embed(texts) -> np.ndarray[n, dim]` can replace it.
+    """
+
+    def __init__(self, dim: int = MEMORY_DIM):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text or "")
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+            buckets = (hashes % self.dim).astype(np.int64)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(out[row], buckets, signs)
+        # Sublinear tf keeps repeated words from dominating, then normalise for cosine
+        out = np.sign(out) * np.log1p(np.abs(out))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+class MemoryIndex:
+    """Append-only embedding matrix over chat_messages, grown by doubling."""
+
+    def __init__(self, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.shared_version = 0
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self.message_ids = np.zeros(0, dtype=np.int64)
+        self.session_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.texts: List[str] = []
+        self.roles: List[str] = []
+        self.timestamps: List[Optional[str]] = []
+        self.watermark = 0
+
+    def set_embedder(self, embedder):
+        """Swap the embedder; the index is rebuilt on the next sync."""
+        with self._lock:
+            self.embedder = embedder
+            self._reset()
+
+    def _grow(self, extra: int):
+        needed = self.size + extra
+        capacity = len(self.message_ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        vectors = np.zeros((new_capacity, self.embedder.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        self.vectors = vectors
+        for name, dtype in (("message_ids", np.int64), ("session_ids", np.int64), ("alive", bool)):
+            arr = np.zeros(new_capacity, dtype=dtype)
+            arr[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, arr)
+
+    def add(self, rows: List[Dict[str, Any]]):
+        """Embed and append rows with keys id, session_id, role, content, timestamp."""
+        if not rows:
+            return
+        with self._lock:
+            vectors = self.embedder.embed([r["content"] for r in rows])
+            self._grow(len(rows))
+            start, end = self.size, self.size + len(rows)
+            self.vectors[start:end] = vectors
+            self.message_ids[start:end] = [r["id"] for r in rows]
+            self.session_ids[start:end] = [r["session_id"] for r in rows]
+            self.alive[start:end] = True
+            self.texts.extend(r["content"] for r in rows)
+            self.roles.extend(r["role"] for r in rows)
+            self.timestamps.extend(r.get("timestamp") for r in rows)
+            self.size = end
+            self.watermark = max(self.watermark, max(r["id"] for r in rows))
+
+    def sync(self):
+        """Index messages saved since the last sync."""
+        with self._sync_lock:
+            # A session deleted through another worker, or an id-preserving import
+            # (possibly from the CLI, i.e. another process even with one worker): rebuild
+            version = process_sync.get_version(SHARED_VERSION_NAME)
+            if version != self.shared_version:
+                with self._lock:
+                    self._reset()
+                self.shared_version = version
+            self._sync()
+
+    def _sync(self):
+        db = SessionLocal()
+        try:
+            while True:
+                batch = db.query(ChatMessage).filter(
+                    ChatMessage.id > self.watermark,
+                    ChatMessage.role.in_(INDEXED_ROLES),
+                    ChatMessage.content.isnot(None),
+                ).order_by(ChatMessage.id).limit(MEMORY_SYNC_BATCH).all()
+                if not batch:
+                    return
+                self.add([_row(m) for m in batch])
+        finally:
+            db.close()
+
+    def add_session(self, session_id: int):
+        """
+        Index a session's messages that aren't indexed yet. Sessions restored
+        from the archive keep their old ids, below the watermark, so sync()
+        alone would never pick them up.
+        """
+        with self._sync_lock:
+            db = SessionLocal()
+            try:
+                messages = db.query(ChatMessage).filter(
+                    ChatMessage.session_id == session_id,
+                    ChatMessage.role.in_(INDEXED_ROLES),
+                    ChatMessage.content.isnot(None),
+                ).order_by(ChatMessage.id).all()
+            finally:
+                db.close()
+            with self._lock:
+                known = set(self.message_ids[:self.size][self.alive[:self.size]].tolist())
+            self.add([_row(m) for m in messages if m.id not in known])
+
+    def rebuild(self):
+        """Drop the index here and, via the shared version, in every other process; the next sync re-reads every message."""
+        with self._sync_lock:
+            with self._lock:
+                self._reset()
+        process_sync.bump_version(SHARED_VERSION_NAME)
+
+    def forget_session(self, session_id: int):
+        """Hide a deleted session's messages from future searches."""
+        with self._lock:
+            self.alive[:self.size][self.session_ids[:self.size] == session_id] = False
+        if process_sync.MULTI_WORKER:
+            process_sync.bump_version(SHARED_VERSION_NAME)
+
+    def search(self, query: str, k: int = MEMORY_TOP_K, min_score: float = MEMORY_MIN_SCORE,
+               exclude_texts: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Top-k cosine matches for `query`, best first."""
+        query_vec = self.embedder.embed([query])[0]
+        with self._lock:
+            if self.size == 0:
+                return []
+            scores = self.vectors[:self.size] @ query_vec
+            scores[~self.alive[:self.size]] = -1.0
+            # Over-fetch a little so excluded/duplicate texts don't starve the result
+            fetch = min(self.size, k * 3)
+            top = np.argpartition(-scores, fetch - 1)[:fetch]
+            top = top[np.argsort(-scores[top])]
+            results, seen = [], set()
+            for i in top:
+                if scores[i] < min_score or len(results) >= k:
+                    break
+                text = self.texts[i]
+                if text in seen or (exclude_texts and text in exclude_texts):
+                    continue
+                seen.add(text)
+                results.append({
+                    "message_id": int(self.message_ids[i]),
+                    "session_id": int(self.session_ids[i]),
+                    "role": self.roles[i],
+                    "date": self.timestamps[i],
+                    "content": text,
+                    "score": float(scores[i]),
+                })
+            return results
+
+
+def _row(m: ChatMessage) -> Dict[str, Any]:
+    return {
+        "id": m.id,
+        "session_id": m.session_id,
+        "role": m.role,
+        "content": m.content,
+        "timestamp": m.timestamp.strftime("%Y-%m-%d") if m.timestamp else None,
+    }
+
+
+def _load_embedder():
+    if not MEMORY_EMBEDDER:
+        return HashingEmbedder()
+    module_name, _, attr = MEMORY_EMBEDDER.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+INDEX = MemoryIndex(_load_embedder())
+
+
+def trim_history(message_history: List[Dict[str, Any]], max_messages: int = MEMORY_HISTORY_MESSAGES) -> List[Dict[str, Any]]:
+    """
+    Keep only the tail of the conversation, starting on a user message so that
+    assistant tool calls are never separated from their tool results.
+    """
+    if len(message_history) <= max_messages:
+        return message_history
+    tail = message_history[-max_messages:]
+    for i, msg in enumerate(tail):
+        if msg.get("role") == "user":
+            return tail[i:]
+    return tail[-1:]
+
+
+def index_restored(session_id: int):
+    """
+    Make a session put back with its original message ids (archive
+    rehydration) recallable. Other workers can only pick it up by rebuilding.
+    """
+    if not MEMORY_ENABLED:
+        return
+    if process_sync.MULTI_WORKER:
+        INDEX.rebuild()
+    else:
+        INDEX.add_session(session_id)
+
+
+def recall(message_history: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Returns a compact system note with past-conversation snippets relevant to
+    the latest user message, or None if nothing relevant is remembered.
+    """
+    if not MEMORY_ENABLED:
+        return None
+    query = next((m.get("content") for m in reversed(message_history)
+                  if m.get("role") == "user" and m.get("content")), None)
+    if not query:
+        return None
+
+    INDEX.sync()
+    in_prompt = {m.get("content") for m in message_history if m.get("content")}
+    hits = INDEX.search(query, exclude_texts=in_prompt)
+    if not hits:
+        return None
+
+    lines = []
+    for hit in hits:
+        snippet = " ".join(hit["content"].split())
+        if len(snippet) > MEMORY_SNIPPET_CHARS:
+            snippet = snippet[:MEMORY_SNIPPET_CHARS] + "…"
+        lines.append(f"- ({hit['date']}, {hit['role']}) {snippet}")
+    return "Relevant notes from earlier conversations (may be outdated):\n" + "\n".join(lines)
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import threading
+from typing import Dict, Any, List, Optional
+
+# Model tiers used by the agent loop.
+# The "fast" tier handles the mechanical tool-routing iterations; the "strong"
+# tier writes final answers and takes over when something looks off. Iterations
+# that are expected to produce the answer (the one after tool results, or the
+# first one for a message that needs no calendar lookup) go straight to the
+# strong tier, so an answer is never generated twice.
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+FAST_MODEL = os.getenv("AGENT_FAST_MODEL", "gpt-5-nano")
+STRONG_MODEL = os.getenv("AGENT_STRONG_MODEL", "gpt-5-mini")
+
+# Set AGENT_MODEL_ROUTING=false to run every iteration on the strong model (old behaviour)
+ROUTING_ENABLED = os.getenv("AGENT_MODEL_ROUTING", "true").lower() == "true"
+# Let the fast model deliver final answers itself instead of escalating
+FAST_FINAL_ANSWERS = os.getenv("AGENT_FAST_FINAL_ANSWERS", "false").lower() == "true"
+# User messages longer than this are treated as ambiguous and go straight to the strong model
+AMBIGUOUS_MESSAGE_CHARS = int(os.getenv("AGENT_AMBIGUOUS_MESSAGE_CHARS", "400"))
+
+TOOL_FAILURE_MARKERS = ("An error occurred", "System Error", "Error:")
+# Messages mentioning none of these are expected to be answered without tools
+_CALENDAR_HINTS = re.compile(
+    r"\b(?:calendar|schedul\w*|book\w*|meet\w*|event\w*|appointment\w*|call|busy|free|slot\w*|"
+    r"cancel\w*|delete|remove|move|reschedul\w*|invite\w*|remind\w*|when|what time|time|date|day|"
+    r"today|tonight|tomorrow|yesterday|week\w*|month\w*|year|morning|afternoon|evening|"
+    r"mon|tue|wed|thu|fri|sat|sun|(?:mon|tues|wednes|thurs|fri|satur|sun)days?|"
+    r"jan\w*|feb\w*|mar\w*|apr\w*|may|jun\w*|jul\w*|aug\w*|sep\w*|oct\w*|nov\w*|dec\w*|"
+    r"\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}|\d{4}-\d{2}-\d{2})\b",
+    re.IGNORECASE,
+)
+
+
+def model_for(tier: str) -> str:
+    """Returns the model name configured for a tier."""
+    return FAST_MODEL if tier == FAST_TIER else STRONG_MODEL
+
+
+def is_tool_failure(result: str) -> bool:
+    """Skills report failures as strings, so detect them by their prefixes."""
+    return bool(result) and result.startswith(TOOL_FAILURE_MARKERS)
+
+
+def _last_user_message(messages: List[Dict[str, Any]]) -> str:
+    for msg in reversed(messages):
+        if isinstance(msg, dict) and msg.get("role") == "user":
+            return msg.get("content") or ""
+    return ""
+
+
+def is_ambiguous_request(messages: List[Dict[str, Any]]) -> bool:
+    """
+    Cheap heuristic for requests that are not a simple lookup: long messages or
+    several questions at once. These skip the fast tier entirely.
+    """
+    text = _last_user_message(messages)
+    return len(text) > AMBIGUOUS_MESSAGE_CHARS or text.count("?") > 1
+
+
+def expects_direct_answer(messages: List[Dict[str, Any]]) -> bool:
+    """Small talk and general questions that won't need a calendar skill."""
+    return not _CALENDAR_HINTS.search(_last_user_message(messages))
+
+
+def choose_tier(messages: List[Dict[str, Any]], last_tool_failed: bool, after_tools: bool = False) -> str:
+    """
+    Picks the tier for the next iteration of the agent loop. `after_tools` is
+    set once tool results are in, when the next response is most likely the answer.
+    """
+    if not ROUTING_ENABLED:
+        return STRONG_TIER
+    if last_tool_failed:
+        return STRONG_TIER
+    if is_ambiguous_request(messages):
+        return STRONG_TIER
+    if not FAST_FINAL_ANSWERS and (after_tools or expects_direct_answer(messages)):
+        return STRONG_TIER
+    return FAST_TIER
+
+
+def should_escalate(tier: str, response_message) -> bool:
+    """
+    Decides whether a fast-tier response must be redone on the strong tier.
+    Malformed tool arguments are escalated, and so are final answers (no tool
+    calls) the router didn't expect, unless the fast tier may answer itself.
+    """
+    if tier != FAST_TIER:
+        return False
+    tool_calls = response_message.tool_calls
+    if not tool_calls:
+        return not FAST_FINAL_ANSWERS
+    for tool_call in tool_calls:
+        try:
+            json.loads(tool_call.function.arguments or "{}")
+        except ValueError:
+            return True
+    return False
+
+
+class TierStats:
+    """Accumulates latency and token counts per tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self.escalations = 0
+
+    def record(self, tier: str, model: str, latency_s: float, usage: Optional[Any]):
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self._lock:
+            stats = self._tiers.setdefault(tier, {
+                "model": model,
+                "calls": 0,
+                "latency_ms_total": 0.0,
+                "latency_ms_max": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            })
+            latency_ms = latency_s * 1000
+            stats["model"] = model
+            stats["calls"] += 1
+            stats["latency_ms_total"] += latency_ms
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    def record_escalation(self):
+        with self._lock:
+            self.escalations += 1
+
+    def merge(self, other: "TierStats"):
+        """Folds a finished turn into this (global) accumulator."""
+        with other._lock:
+            tiers = {t: dict(s) for t, s in other._tiers.items()}
+            escalations = other.escalations
+        with self._lock:
+            self.escalations += escalations
+            for tier, src in tiers.items():
+                dst = self._tiers.setdefault(tier, dict(src, calls=0, latency_ms_total=0.0,
+                                                        latency_ms_max=0.0, prompt_tokens=0,
+                                                        completion_tokens=0))
+                dst["model"] = src["model"]
+                dst["calls"] += src["calls"]
+                dst["latency_ms_total"] += src["latency_ms_total"]
+                dst["latency_ms_max"] = max(dst["latency_ms_max"], src["latency_ms_max"])
+                dst["prompt_tokens"] += src["prompt_tokens"]
+                dst["completion_tokens"] += src["completion_tokens"]
+
+    def totals(self) -> Dict[str, Dict[str, Any]]:
+        """Raw per-tier totals (copies), e.g. for persisting a turn's usage."""
+        with self._lock:
+            return {tier: dict(s) for tier, s in self._tiers.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for tier, s in self._tiers.items():
+                tiers[tier] = {
+                    "model": s["model"],
+                    "calls": s["calls"],
+                    "latency_ms_avg": round(s["latency_ms_total"] / s["calls"], 1) if s["calls"] else 0.0,
+                    "latency_ms_max": round(s["latency_ms_max"], 1),
+                    "prompt_tokens": s["prompt_tokens"],
+                    "completion_tokens": s["completion_tokens"],
+                }
+            return {"tiers": tiers, "escalations": self.escalations}
+
+
+# Process-wide totals, exposed via /agent/metrics for tuning the policy
+GLOBAL_STATS = TierStats()
+
+
+def routing_config() -> Dict[str, Any]:
+    """Current routing policy, reported alongside the stats."""
+    return {
+        "enabled": ROUTING_ENABLED,
+        "fast_model": FAST_MODEL,
+        "strong_model": STRONG_MODEL,
+        "fast_final_answers": FAST_FINAL_ANSWERS,
+        "ambiguous_message_chars": AMBIGUOUS_MESSAGE_CHARS,
+    }
@@ -0,0 +1,399 @@
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+from sqlalchemy.orm import Session
+from database import SessionLocal, PendingMutation, retry_on_locked
+import calendar_cache
+import event_index
+import process_sync
+
+# Write-behind mode for calendar mutations (CALENDAR_WRITE_BEHIND=true).
+# schedule/update/delete validate locally, journal the write in SQLite and
+# answer immediately; a background flusher delivers the journal to Google in
+# batch requests. Writes to the same event are coalesced while still pending
+# (create+patch -> create, create+delete -> nothing). Created events get a
+# client-chosen id, so a retried insert is recognised by Google (409) and
+# delivery is at-least-once but idempotent. Writes that fail for good are
+# reported into the chat session they came from as an assistant message.
+WRITE_BEHIND_ENABLED = os.getenv("CALENDAR_WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))  # Calendar API batch limit is 50
+WRITE_BEHIND_POLL_SECONDS = float(os.getenv("WRITE_BEHIND_POLL_SECONDS", "2"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "8"))
+WRITE_BEHIND_MAX_BACKOFF_SECONDS = 300
+FAILED_RETENTION = timedelta(days=7)
+FLUSH_LOCK = "calendar-mutations"
+
+CREATE, PATCH, DELETE = "create", "patch", "delete"
+PENDING, FLUSHING, FAILED = "pending", "flushing", "failed"
+# Quota errors come back as 403 with these reasons and are worth retrying
+_RETRYABLE_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+_session: ContextVar[Optional[int]] = ContextVar("mutation_session", default=None)
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def new_event_id() -> str:
+    """Client-chosen event id: Google accepts base32hex (0-9, a-v), which hex is a subset of."""
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def reporting_to(session_id: Optional[int]):
+    """Failures of writes queued inside this block are reported to `session_id`."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def _coalesce(kind: str, body: Dict[str, Any], new_kind: str, new_body: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Merge a new write into a still-pending one for the same event; None means both cancel out."""
+    if new_kind == DELETE:
+        return None if kind == CREATE else (DELETE, {})
+    if kind == DELETE:
+        return new_kind, new_body
+    return kind, {**body, **new_body}
+
+
+@retry_on_locked
+def _enqueue(db: Session, kind: str, event_id: str, body: Dict[str, Any], description: str,
+             session_id: Optional[int]):
+    latest = (
+        db.query(PendingMutation)
+        .filter(PendingMutation.event_id == event_id, PendingMutation.status == PENDING)
+        .order_by(PendingMutation.id.desc())
+        .first()
+    )
+    merged = False
+    if latest:
+        coalesced = _coalesce(latest.kind, json.loads(latest.body or "{}"), kind, body)
+        # Only rows the flusher hasn't claimed meanwhile may be rewritten
+        still_pending = db.query(PendingMutation).filter(
+            PendingMutation.id == latest.id, PendingMutation.status == PENDING
+        )
+        if coalesced is None:
+            merged = still_pending.delete(synchronize_session=False) == 1
+        else:
+            merged = still_pending.update({
+                "kind": coalesced[0],
+                "body": json.dumps(coalesced[1]),
+                "description": description,
+                "session_id": session_id or latest.session_id,
+                "updated_at": datetime.utcnow(),
+            }, synchronize_session=False) == 1
+    if not merged:
+        db.add(PendingMutation(
+            event_id=event_id, kind=kind, body=json.dumps(body),
+            description=description, session_id=session_id,
+        ))
+    db.commit()
+
+
+def enqueue(kind: str, event_id: str, body: Dict[str, Any], description: str):
+    """Durably journal a write; it is acknowledged once this returns."""
+    db = SessionLocal()
+    try:
+        _enqueue(db, kind, event_id, body, description, _session.get())
+    finally:
+        db.close()
+    # Reads overlay the queue, so anything keyed on the calendar version must move too
+    calendar_cache.note_queued_write()
+    _wake.set()
+
+
+def _queued(db: Session) -> List[PendingMutation]:
+    return (
+        db.query(PendingMutation)
+        .filter(PendingMutation.status.in_((PENDING, FLUSHING)))
+        .order_by(PendingMutation.id)
+        .all()
+    )
+
+
+def _pending_events(rows: List[PendingMutation]) -> Dict[str, Dict[str, Any]]:
+    """Events whose create hasn't reached Google yet, with later queued patches applied."""
+    events: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if row.kind == CREATE:
+            events[row.event_id] = {"id": row.event_id, **json.loads(row.body or "{}")}
+        elif row.event_id in events:
+            if row.kind == DELETE:
+                del events[row.event_id]
+            else:
+                events[row.event_id].update(json.loads(row.body or "{}"))
+    return events
+
+
+def _queued_rows() -> List[PendingMutation]:
+    db = SessionLocal()
+    try:
+        return _queued(db)
+    finally:
+        db.close()
+
+
+def pending_event(event_id: str) -> Optional[Dict[str, Any]]:
+    """A queued event that Google doesn't know about yet, as it will look once delivered."""
+    return _pending_events(_queued_rows()).get(event_id)
+
+
+def _queued_changes(rows: List[PendingMutation]) -> Tuple[set, Dict[str, Dict[str, Any]]]:
+    """Ids of events with a queued delete, and the merged queued patch of each other event."""
+    deleted: set = set()
+    patches: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if row.kind == DELETE:
+            deleted.add(row.event_id)
+            patches.pop(row.event_id, None)
+        elif row.kind == PATCH:
+            deleted.discard(row.event_id)
+            patches.setdefault(row.event_id, {}).update(json.loads(row.body or "{}"))
+    return deleted, patches
+
+
+def overlay(events: List[Dict[str, Any]], start, end, add_new: bool = True) -> List[Dict[str, Any]]:
+    """
+    Cached event instances in [start, end) as they will look once the queue is
+    delivered: queued deletes drop events, queued patches move/rename them (an
+    event moved in from outside the range is found through the calendar cache)
+    and, with add_new, queued creates appear. A no-op unless write-behind is on.
+    """
+    if not WRITE_BEHIND_ENABLED:
+        return events
+    rows = _queued_rows()
+    if not rows:
+        return events
+    deleted, patches = _queued_changes(rows)
+    pending = _pending_events(rows)
+    result, seen = [], set()
+    for event in events:
+        seen.add(event["id"])
+        if event["id"] in deleted:
+            continue
+        if event["id"] in patches:
+            event = {**event, **patches[event["id"]]}
+        if calendar_cache.overlaps(event, start, end):
+            result.append(event)
+    moved_in = [
+        {**cached, **patch} for cached, patch in (
+            (calendar_cache.cached_event(event_id), patch) for event_id, patch in patches.items()
+            if event_id not in seen and event_id not in deleted and event_id not in pending
+        ) if cached and not cached.get("recurrence")
+    ]
+    created = list(pending.values()) if add_new else []
+    result.extend(e for e in moved_in + created if calendar_cache.overlaps(e, start, end))
+    result.sort(key=calendar_cache.event_start)
+    return result
+
+
+def with_pending(conflicts: List[Dict[str, Any]], start, end, exclude_ids: Optional[set] = None) -> List[Dict[str, Any]]:
+    """Conflict list adjusted for queued writes: queued creates and moves block time, queued deletes and moves free it."""
+    exclude_ids = exclude_ids or set()
+    return [
+        e for e in overlay(conflicts, start, end)
+        if e["id"] not in exclude_ids and calendar_cache.is_busy(e)
+    ]
+
+
+# ===== Flushing =====
+
+def _claim(db: Session) -> List[PendingMutation]:
+    """
+    Oldest due writes, at most one per event (later writes to the same event
+    wait for the earlier one), marked as in flight.
+    """
+    now = datetime.utcnow()
+    claimed, seen = [], set()
+    for row in db.query(PendingMutation).filter(PendingMutation.status == PENDING).order_by(PendingMutation.id):
+        if row.event_id in seen:
+            continue
+        seen.add(row.event_id)
+        if row.next_attempt_at and row.next_attempt_at > now:
+            continue
+        claimed.append(row)
+        if len(claimed) >= WRITE_BEHIND_BATCH_SIZE:
+            break
+    for row in claimed:
+        row.status = FLUSHING
+    db.commit()
+    return claimed
+
+
+def _request(service, row: PendingMutation):
+    events = service.events()
+    body = json.loads(row.body or "{}")
+    if row.kind == CREATE:
+        return events.insert(calendarId=calendar_cache.CALENDAR_ID, body={**body, "id": row.event_id})
+    if row.kind == PATCH:
+        return events.patch(calendarId=calendar_cache.CALENDAR_ID, eventId=row.event_id, body=body)
+    return events.delete(calendarId=calendar_cache.CALENDAR_ID, eventId=row.event_id)
+
+
+def _outcome(row: PendingMutation, error: Optional[Exception]) -> str:
+    """'done', 'retry' or 'failed' for one delivered write."""
+    if error is None:
+        return "done"
+    if not isinstance(error, HttpError):
+        return "retry"
+    status = error.resp.status
+    # A retried write that already landed the first time
+    if (row.kind == CREATE and status == 409) or (row.kind == DELETE and status in (404, 410)):
+        return "done"
+    if status == 429 or status >= 500 or (status == 403 and any(r in (error.content or b"") for r in _RETRYABLE_REASONS)):
+        return "retry"
+    return "failed"
+
+
+def _send(service, rows: List[PendingMutation]) -> Dict[int, Optional[Exception]]:
+    errors: Dict[int, Optional[Exception]] = {}
+
+    def callback(request_id, response, exception):
+        errors[int(request_id)] = exception
+
+    batch = service.new_batch_http_request(callback=callback)
+    for row in rows:
+        batch.add(_request(service, row), request_id=str(row.id))
+    try:
+        batch.execute()
+    except Exception as e:
+        # Transport failure: nothing is known to have landed, so everything is retried
+        return {row.id: e for row in rows}
+    return {row.id: errors.get(row.id, RuntimeError("no response in batch")) for row in rows}
+
+
+def _report(db: Session, row: PendingMutation):
+    print(f"Calendar write failed for good: {row.description}: {row.last_error}")
+    if row.session_id is None:
+        return
+    from chat_storage import save_message
+    try:
+        save_message(
+            db, row.session_id, "assistant",
+            f"⚠️ I couldn't sync a calendar change to Google: {row.description}. "
+            f"It has not been applied ({row.last_error})."
+        )
+    except Exception as e:
+        print(f"Could not report calendar write failure to session {row.session_id}: {e}")
+
+
+def _index_delivered(row: PendingMutation):
+    """Keep the search index current without waiting for a refetch."""
+    body = json.loads(row.body or "{}")
+    if row.kind == CREATE:
+        event_index.add([{**body, "id": row.event_id}])
+    elif row.kind == PATCH:
+        event_index.apply_patch(row.event_id, body)
+    else:
+        event_index.remove(row.event_id)
+
+
+@retry_on_locked
+def _settle(db: Session, rows: List[PendingMutation], errors: Dict[int, Optional[Exception]]) -> Tuple[int, List[PendingMutation]]:
+    delivered, failed = 0, []
+    now = datetime.utcnow()
+    for row in rows:
+        error = errors[row.id]
+        outcome = _outcome(row, error)
+        if outcome == "done":
+            _index_delivered(row)
+            db.delete(row)
+            delivered += 1
+            continue
+        row.attempts += 1
+        row.last_error = str(error)[:500]
+        if outcome == "retry" and row.attempts < WRITE_BEHIND_MAX_ATTEMPTS:
+            row.status = PENDING
+            row.next_attempt_at = now + timedelta(seconds=min(2 ** row.attempts, WRITE_BEHIND_MAX_BACKOFF_SECONDS))
+            continue
+        row.status = FAILED
+        failed.append(row)
+        if row.kind == CREATE:
+            # Later writes to an event that never got created can't succeed either
+            for dependent in db.query(PendingMutation).filter(
+                PendingMutation.event_id == row.event_id, PendingMutation.status == PENDING
+            ):
+                dependent.status = FAILED
+                dependent.last_error = "the event was never created"
+    db.query(PendingMutation).filter(
+        PendingMutation.status == FAILED, PendingMutation.updated_at < now - FAILED_RETENTION
+    ).delete(synchronize_session=False)
+    db.commit()
+    return delivered, failed
+
+
+def flush(service=None) -> Dict[str, int]:
+    """Deliver one batch of due writes. Only one process flushes at a time."""
+    with process_sync.file_lock(FLUSH_LOCK, blocking=False) as acquired:
+        if not acquired:
+            return {"skipped": 1}
+        db = SessionLocal()
+        try:
+            # Rows still in flight under the lock were abandoned by a flusher that died
+            db.query(PendingMutation).filter(PendingMutation.status == FLUSHING).update(
+                {"status": PENDING}, synchronize_session=False
+            )
+            rows = _claim(db)
+            if not rows:
+                return {"delivered": 0, "failed": 0}
+            if service is None:
+                import skills_google
+                service = skills_google._get_calendar_service()
+            errors = _send(service, rows)
+            delivered, failed = _settle(db, rows, errors)
+            for row in failed:
+                _report(db, row)
+        finally:
+            db.close()
+    if delivered:
+        calendar_cache.invalidate()
+    return {"delivered": delivered, "failed": len(failed)}
+
+
+def _loop():
+    while not _stop.is_set():
+        try:
+            result = flush()
+            # A full batch likely means more is due right away
+            if result.get("delivered", 0) + result.get("failed", 0) >= WRITE_BEHIND_BATCH_SIZE:
+                continue
+        except Exception as e:
+            print(f"Calendar write-behind flush failed: {e}")
+        _wake.wait(WRITE_BEHIND_POLL_SECONDS)
+        _wake.clear()
+
+
+def start_background_flusher():
+    """Deliver queued writes in the background (no-op unless CALENDAR_WRITE_BEHIND=true)."""
+    if not WRITE_BEHIND_ENABLED:
+        return
+    _stop.clear()
+    threading.Thread(target=_loop, daemon=True, name="calendar-write-behind").start()
+
+
+def status() -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        rows = db.query(PendingMutation).order_by(PendingMutation.id).all()
+        counts: Dict[str, int] = {}
+        for row in rows:
+            counts[row.status] = counts.get(row.status, 0) + 1
+        queued = [r for r in rows if r.status != FAILED]
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "counts": counts,
+            "oldest_queued_seconds": round((datetime.utcnow() - queued[0].created_at).total_seconds(), 1) if queued else None,
+            "failed": [
+                {"id": r.id, "description": r.description, "error": r.last_error, "attempts": r.attempts}
+                for r in rows if r.status == FAILED
+            ][-20:],
+        }
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+import os
+import errno
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import text
+from database import SessionLocal, CacheVersion, retry_on_locked
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: fall back to in-process locking only
+    fcntl = None
+
+# Multi-worker deployment support.
+# uvicorn reads WEB_CONCURRENCY as its worker count; anything above 1 turns on the
+# cross-process paths (shared turn buffers, shared cache versions, file locks).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+MULTI_WORKER = WEB_CONCURRENCY > 1 or os.getenv("MULTI_WORKER", "false").lower() == "true"
+LOCK_DIR = os.getenv("LOCK_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".locks"))
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(name: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(name, threading.Lock())
+
+
+@contextmanager
+def file_lock(name: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive lock shared by all threads and worker processes on this host.
+    Yields True if the lock is held; with blocking=False yields False instead
+    of waiting when another holder exists.
+    """
+    local = _thread_lock(name)
+    if not local.acquire(blocking):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        with open(os.path.join(LOCK_DIR, f"{name}.lock"), "a") as handle:
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(handle.fileno(), flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    finally:
+        local.release()
+
+
+def atomic_write(path: str, data: str):
+    """Write via temp file + fsync + rename so readers never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        os.remove(tmp_path)
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+        # Single-file bind mounts (docker-compose) cannot be renamed over;
+        # rewrite in place instead. Callers hold a file_lock and readers retry
+        # on a torn read.
+        with open(path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_version(name: str) -> int:
+    """Current value of a shared cache version counter (0 if never bumped)."""
+    db = SessionLocal()
+    try:
+        row = db.query(CacheVersion.version).filter(CacheVersion.name == name).first()
+        return row[0] if row else 0
+    finally:
+        db.close()
+
+
+@retry_on_locked
+def _bump(db, name: str):
+    db.execute(text(
+        "INSERT INTO cache_versions (name, version) VALUES (:name, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+    ), {"name": name})
+    db.commit()
+
+
+def bump_version(name: str):
+    """Tell every worker that its local copy of `name` is stale."""
+    db = SessionLocal()
+    try:
+        _bump(db, name)
+    finally:
+        db.close()
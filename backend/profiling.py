@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+import process_sync
+
+# Opt-in sampling profiler for single requests.
+# With PROFILING_ENABLED=true, a request carrying `X-Profile: 1` (or one of the
+# next N requests armed via /admin/profiling) is sampled every
+# PROFILE_SAMPLE_INTERVAL seconds: the thread running its endpoint and, for
+# /chat, the background thread running the agent turn (agent loop, skills and
+# SQLAlchemy all execute there). Stacks are written in the folded format read by
+# flamegraph.pl, speedscope and inferno. When disabled the middleware is not
+# installed at all.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Safety cap: a profile stops sampling after this long even if the request hasn't finished
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_HEADER = b"x-profile"
+
+_current: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+_armed = {"remaining": 0, "path_prefix": "/chat"}
+_armed_lock = threading.Lock()
+
+
+class Profile:
+    """Samples the stacks of the threads serving one request until every span has ended."""
+
+    def __init__(self, method: str, path: str, scope: Optional[Dict[str, Any]] = None):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.scope = scope
+        self.started_at = time.time()
+        self.threads = set()
+        self.stacks: Counter = Counter()
+        self.sample_count = 0
+        self._spans = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._loop, daemon=True, name=f"profiler-{self.profile_id[:8]}")
+
+    def begin(self):
+        with self._lock:
+            self._spans += 1
+            if not self._sampler.is_alive() and not self._stop.is_set():
+                self._sampler.start()
+
+    def end(self):
+        with self._lock:
+            self._spans -= 1
+            if self._spans > 0:
+                return
+        self._stop.set()
+
+    def add_thread(self, ident: int):
+        self.threads.add(ident)
+
+    def _endpoint_code(self):
+        endpoint = self.scope.get("endpoint") if self.scope else None
+        return getattr(endpoint, "__code__", None)
+
+    def _loop(self):
+        deadline = self.started_at + PROFILE_MAX_SECONDS
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            self._sample()
+            if time.time() > deadline:
+                break
+        self._write()
+
+    def _sample(self):
+        own = threading.get_ident()
+        endpoint_code = self._endpoint_code()
+        names = None
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if ident not in self.threads and (endpoint_code is None or endpoint_code not in codes):
+                continue
+            if names is None:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            frames = [f"{os.path.basename(c.co_filename)}:{c.co_name}" for c in reversed(codes)]
+            self.stacks[";".join([names.get(ident, str(ident))] + frames)] += 1
+        self.sample_count += 1
+
+    def _write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        folded = "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        process_sync.atomic_write(os.path.join(PROFILE_DIR, f"{self.profile_id}.folded"), folded)
+        meta = {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_seconds": round(time.time() - self.started_at, 3),
+            "samples": self.sample_count,
+            "sample_interval": PROFILE_SAMPLE_INTERVAL,
+        }
+        # Written last: list_profiles() only shows finished profiles
+        process_sync.atomic_write(os.path.join(PROFILE_DIR, f"{self.profile_id}.json"), json.dumps(meta))
+        _prune()
+
+
+def _prune():
+    profiles = list_profiles()
+    for meta in profiles[PROFILE_KEEP:]:
+        for ext in (".folded", ".json"):
+            path = os.path.join(PROFILE_DIR, meta["profile_id"] + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+    profiles.sort(key=lambda meta: meta["started_at"], reverse=True)
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+def arm(requests: int, path_prefix: str = "/chat") -> Dict[str, Any]:
+    """Profile the next `requests` requests whose path starts with `path_prefix`."""
+    with _armed_lock:
+        _armed["remaining"] = max(requests, 0)
+        _armed["path_prefix"] = path_prefix
+        return dict(_armed)
+
+
+def _wants_profile(scope: Dict[str, Any]) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER and value.lower() in (b"1", b"true"):
+            return True
+    with _armed_lock:
+        if _armed["remaining"] > 0 and scope["path"].startswith(_armed["path_prefix"]):
+            _armed["remaining"] -= 1
+            return True
+    return False
+
+
+def current() -> Optional[Profile]:
+    """The profile of the request being handled in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def attach_thread(profile: Optional[Profile]):
+    """
+    Include the calling thread in a profile for the duration of the block.
+    The caller must already have called profile.begin() for this span.
+    """
+    if profile is None:
+        yield
+        return
+    profile.add_thread(threading.get_ident())
+    try:
+        yield
+    finally:
+        profile.threads.discard(threading.get_ident())
+        profile.end()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: starts a Profile for selected requests and returns its id in X-Profile-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], scope)
+        token = _current.set(profile)
+        profile.begin()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", profile.profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            profile.end()
@@ -0,0 +1,182 @@
+import os
+import base64
+import hashlib
+import datetime
+import threading
+from typing import List, Dict, Any, Optional
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, EventAlias
+import calendar_cache
+
+# Skill results end up in every later prompt of a turn (as `tool` messages), so
+# by default they are rendered compactly: short CST times grouped under one
+# header per day, short aliases instead of Google's long event ids, and no URLs
+# unless asked for. "verbose" keeps the original prose/ISO format.
+FORMAT_COMPACT = "compact"
+FORMAT_VERBOSE = "verbose"
+DEFAULT_FORMAT = os.getenv("SKILL_RESULT_FORMAT", FORMAT_COMPACT)
+# Per-tool overrides, e.g. SKILL_RESULT_FORMATS="search_events=verbose,list_events=compact"
+TOOL_FORMATS = dict(
+    item.split("=", 1) for item in os.getenv("SKILL_RESULT_FORMATS", "").split(",") if "=" in item
+)
+
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+ALIAS_LENGTH = 5
+
+_aliases: Dict[str, str] = {}      # alias -> event id
+_by_event: Dict[str, str] = {}     # event id -> alias
+_alias_lock = threading.Lock()
+
+
+def format_for(tool_name: str) -> str:
+    return TOOL_FORMATS.get(tool_name, DEFAULT_FORMAT)
+
+
+def _candidate(event_id: str, length: int) -> str:
+    digest = hashlib.sha1(event_id.encode("utf-8")).digest()
+    return "e" + base64.b32encode(digest).decode("ascii").lower()[:length]
+
+
+def alias_for(event_id: str) -> str:
+    """Stable short alias for one event id (see aliases_for)."""
+    return aliases_for([event_id])[event_id]
+
+
+def aliases_for(event_ids: List[str]) -> Dict[str, str]:
+    """
+    Stable short aliases for a result set's event ids. Derived from a hash (so
+    the same event always gets the same alias) and persisted, so aliases in
+    stored history stay resolvable across restarts. Ids not seen by this
+    process are looked up with one SELECT and stored with one INSERT.
+    """
+    with _alias_lock:
+        missing = list(dict.fromkeys(i for i in event_ids if i not in _by_event))
+        length = ALIAS_LENGTH
+        db = SessionLocal() if missing else None
+        try:
+            while missing:
+                wanted = {event_id: _candidate(event_id, length) for event_id in missing}
+                rows = db.query(EventAlias.alias, EventAlias.event_id).filter(
+                    EventAlias.event_id.in_(missing) | EventAlias.alias.in_(wanted.values())
+                ).all()
+                owners = {alias: event_id for alias, event_id in rows}
+                for alias, event_id in rows:
+                    if event_id in wanted:
+                        # Already stored (possibly lengthened after a collision)
+                        wanted[event_id] = alias
+                new, collided = [], []
+                for event_id, alias in wanted.items():
+                    owner = owners.get(alias)
+                    if owner is None:
+                        owners[alias] = event_id
+                        new.append(EventAlias(alias=alias, event_id=event_id))
+                    elif owner != event_id:
+                        collided.append(event_id)  # hash prefix collision: lengthen
+                        continue
+                    _aliases[alias] = event_id
+                    _by_event[event_id] = alias
+                if new:
+                    db.add_all(new)
+                    try:
+                        db.commit()
+                    except IntegrityError:
+                        # Another worker inserted some first; re-check who owns them
+                        db.rollback()
+                        for row in new:
+                            _aliases.pop(row.alias, None)
+                            _by_event.pop(row.event_id, None)
+                        missing = collided + [row.event_id for row in new]
+                        continue
+                missing = collided
+                length += 2
+        finally:
+            if db is not None:
+                db.close()
+        return {event_id: _by_event[event_id] for event_id in event_ids}
+
+
+def resolve_event_id(ref: Optional[str]) -> Optional[str]:
+    """Map an alias (with or without brackets) back to the Google event id; raw ids pass through."""
+    if not ref:
+        return ref
+    ref = ref.strip().strip("[]#")
+    with _alias_lock:
+        if ref in _aliases:
+            return _aliases[ref]
+    db = SessionLocal()
+    try:
+        row = db.query(EventAlias).filter(EventAlias.alias == ref).first()
+    finally:
+        db.close()
+    if row is None:
+        return ref
+    with _alias_lock:
+        _aliases[ref] = row.event_id
+        _by_event[row.event_id] = ref
+    return row.event_id
+
+
+def _time_span(event: Dict[str, Any]) -> str:
+    if "date" in event["start"]:
+        return "all-day"
+    start = calendar_cache.event_start(event).astimezone(CST)
+    end = calendar_cache.event_end(event).astimezone(CST)
+    if end.date() != start.date():
+        return f"{start:%H:%M}-{end:%m-%d %H:%M}"
+    return f"{start:%H:%M}-{end:%H:%M}"
+
+
+def _day(event: Dict[str, Any]) -> str:
+    if "date" in event["start"]:
+        day = datetime.datetime.strptime(event["start"]["date"], "%Y-%m-%d")
+    else:
+        day = calendar_cache.event_start(event).astimezone(CST)
+    return day.strftime("%a %Y-%m-%d")
+
+
+def format_event_list(tool_name: str, header: str, events: List[Dict[str, Any]],
+                      compact_header: Optional[str] = None) -> str:
+    """Render events either in the original verbose form or grouped by day."""
+    if format_for(tool_name) == FORMAT_VERBOSE:
+        response = f"{header}\n"
+        for event in events:
+            start = event["start"].get("dateTime", event["start"].get("date"))
+            response += f"- [{event['id']}] {start}: {event.get('summary', 'No Title')}\n"
+        return response
+
+    refs = aliases_for([event["id"] for event in events])
+    lines = [compact_header] if compact_header else []
+    current_day = None
+    for event in events:
+        day = _day(event)
+        if day != current_day:
+            lines.append(day)
+            current_day = day
+        lines.append(f" {_time_span(event)} [{refs[event['id']]}] {event.get('summary', 'No Title')}")
+    return "\n".join(lines) + "\n"
+
+
+def format_conflicts(tool_name: str, conflicts: List[Dict[str, Any]]) -> str:
+    if format_for(tool_name) == FORMAT_VERBOSE:
+        refs = {event["id"]: event["id"] for event in conflicts}
+    else:
+        refs = aliases_for([event["id"] for event in conflicts])
+    lines = []
+    for event in conflicts:
+        start = calendar_cache.event_start(event).astimezone(CST)
+        lines.append(f"- [{refs[event['id']]}] {start:%a %Y-%m-%d} {_time_span(event)}: {event.get('summary', 'No Title')}")
+    return "\n".join(lines)
+
+
+def format_mutation(tool_name: str, verbose: str, action: str, event: Dict[str, Any],
+                    include_link: bool = False) -> str:
+    """
+    Result of schedule/update. `verbose` is the original message; the compact
+    form names the event by alias and time, adding the URL only on request.
+    """
+    if format_for(tool_name) == FORMAT_VERBOSE:
+        return verbose
+    result = f"Confirmed. {action} [{alias_for(event['id'])}] {event.get('summary', 'No Title')} {_day(event)} {_time_span(event)}"
+    if include_link and event.get("htmlLink"):
+        result += f" {event['htmlLink']}"
+    return result
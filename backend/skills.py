@@ -1,22 +1,6 @@
-import json
 import datetime
-from pathlib import Path
-from typing import List, Dict, Any
-
-EVENTS_FILE = Path(__file__).parent / "events.json"
-
-def _load_events() -> List[Dict[str, Any]]:
-    if not EVENTS_FILE.exists():
-        return []
-    try:
-        with open(EVENTS_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
-
-def _save_events(events: List[Dict[str, Any]]):
-    with open(EVENTS_FILE, "w") as f:
-        json.dump(events, f, indent=2)
+from typing import Dict, Any
+import event_store
 
 def get_current_datetime() -> str:
     """Returns the current date and time in a human-readable format (CST)."""
@@ -29,8 +13,7 @@ def check_availability(date_str: str) -> str:
     Checks if there are any events on the given date (YYYY-MM-DD).
     Returns a list of events or a message saying it's clear.
     """
-    events = _load_events()
-    day_events = [e for e in events if e.get("date") == date_str]
+    day_events = event_store.events_on(date_str)
     
     if not day_events:
         return f"No events scheduled for {date_str}. You are free."
@@ -46,23 +29,10 @@ def schedule_event(title: str, date_str: str, time_str: str) -> str:
     date_str: YYYY-MM-DD
     time_str: HH:MM
     """
-    events = _load_events()
-    
-    # Simple conflict check (very basic for now)
-    for event in events:
-        if event.get("date") == date_str and event.get("time") == time_str:
-            return f"Conflict! You already have '{event['title']}' at {time_str} on {date_str}."
-    
-    new_event = {
-        "id": len(events) + 1,
-        "title": title,
-        "date": date_str,
-        "time": time_str,
-        "created_at": get_current_datetime()
-    }
-    
-    events.append(new_event)
-    _save_events(events)
+    # Conflict check and insert happen atomically in the local store
+    _, conflict = event_store.add_event_if_free(title, date_str, time_str, get_current_datetime())
+    if conflict:
+        return f"Conflict! You already have '{conflict['title']}' at {time_str} on {date_str}."
     
     return f"Confirmed. '{title}' has been scheduled for {date_str} at {time_str}."
 
@@ -3,10 +3,16 @@ import datetime
 import json
 from typing import List, Dict, Any, Optional
 from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+import auth
+import calendar_cache
+import mutation_queue
+import date_resolver
+import process_sync
+import result_format
+import time_analytics
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
@@ -14,33 +20,37 @@ SCOPES = ["https://www.googleapis.com/auth/calendar"]
 CREDENTIALS_FILE = "credentials.json"
 TOKEN_FILE = "token.json"
 CST = datetime.timezone(datetime.timedelta(hours=-6))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "20"))
 
 
 def _get_calendar_service():
     """Shows basic usage of the Google Calendar API."""
-    creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
     # time.
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    creds = auth.load_credentials()
     
-    # If there are no (valid) credentials available, let the user log in.
+    # If there are no (valid) credentials available, refresh or log in while
+    # holding the token lock, so concurrent workers don't race to refresh and
+    # overwrite each other's token.json.
     if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(CREDENTIALS_FILE):
-                raise FileNotFoundError(f"Missing {CREDENTIALS_FILE}. Please add it to the backend folder.")
-            
-            flow = InstalledAppFlow.from_client_secrets_file(
-                CREDENTIALS_FILE, SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-        
-        # Save the credentials for the next run
-        with open(TOKEN_FILE, "w") as token:
-            token.write(creds.to_json())
+        with process_sync.file_lock(auth.TOKEN_LOCK):
+            # Another worker may have refreshed while we waited for the lock
+            creds = auth.load_credentials()
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                else:
+                    if not os.path.exists(CREDENTIALS_FILE):
+                        raise FileNotFoundError(f"Missing {CREDENTIALS_FILE}. Please add it to the backend folder.")
+                    
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        CREDENTIALS_FILE, SCOPES
+                    )
+                    creds = flow.run_local_server(port=0)
+                
+                # Save the credentials for the next run
+                process_sync.atomic_write(TOKEN_FILE, creds.to_json())
 
     service = build("calendar", "v3", credentials=creds)
     return service
@@ -49,47 +59,42 @@ def get_current_datetime() -> str:
     """Returns the current date and time with day of the week in a human-readable format (CST)."""
     return datetime.datetime.now(CST).strftime("%A, %Y-%m-%d %H:%M:%S")
 
+def resolve_dates(expressions: List[str]) -> str:
+    """Resolves relative date expressions ("next Sunday", "this weekend") to concrete CST dates/ranges."""
+    try:
+        return date_resolver.resolve_all(expressions)
+    except Exception as e:
+        return f"System Error: {str(e)}"
+
+def events_on_day(date_str: str) -> List[Dict[str, Any]]:
+    """Event instances on a date (YYYY-MM-DD, CST day), served from the calendar cache plus queued writes."""
+    service = _get_calendar_service()
+    
+    # Parse date range for the entire day logic using CST
+    # Get local timezone
+    local_tz = CST
+    
+    # Create aware datetimes for start and end of day
+    dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    start_of_day = dt.replace(hour=0, minute=0, second=0, tzinfo=local_tz)
+    end_of_day = dt.replace(hour=23, minute=59, second=59, tzinfo=local_tz)
+
+    # Recurring series are expanded locally from cached masters
+    events = calendar_cache.events_between(service, start_of_day, end_of_day)
+    return mutation_queue.overlay(events, start_of_day, end_of_day)
+
 def list_events(date_str: str) -> str:
     """
     Checks if there are any events on the given date (YYYY-MM-DD).
     Returns a list of events or a message saying it's clear.
     """
     try:
-        service = _get_calendar_service()
-        
-        # Parse date range for the entire day logic using CST
-        # Get local timezone
-        local_tz = CST
-        
-        # Create aware datetimes for start and end of day
-        dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        start_of_day = dt.replace(hour=0, minute=0, second=0, tzinfo=local_tz).isoformat()
-        end_of_day = dt.replace(hour=23, minute=59, second=59, tzinfo=local_tz).isoformat()
-
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=start_of_day,
-                timeMax=end_of_day,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        events = events_result.get("items", [])
+        events = events_on_day(date_str)
 
         if not events:
             return f"No events found for {date_str}. You are free."
 
-        response = f"Events on {date_str}:\n"
-        for event in events:
-            start = event["start"].get("dateTime", event["start"].get("date"))
-            summary = event.get("summary", "No Title")
-            # Formatting start time slightly for readability
-            response += f"- [{event['id']}] {start}: {summary}\n"
-            
-        return response
+        return result_format.format_event_list("list_events", f"Events on {date_str}:", events)
 
     except HttpError as error:
         return f"An error occurred: {error}"
@@ -105,91 +110,130 @@ def list_events_range(start_date: str, days: int = 7) -> str:
         local_tz = CST
         
         dt_start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-        time_min = dt_start.replace(hour=0, minute=0, second=0, tzinfo=local_tz).isoformat()
+        time_min = dt_start.replace(hour=0, minute=0, second=0, tzinfo=local_tz)
         
         dt_end = dt_start + datetime.timedelta(days=days)
-        time_max = dt_end.replace(hour=23, minute=59, second=59, tzinfo=local_tz).isoformat()
-
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        events = events_result.get("items", [])
+        time_max = dt_end.replace(hour=23, minute=59, second=59, tzinfo=local_tz)
+
+        events = calendar_cache.events_between(service, time_min, time_max)
+        events = mutation_queue.overlay(events, time_min, time_max)
 
         if not events:
             return f"No events found from {start_date} to {(dt_start + datetime.timedelta(days=days-1)).strftime('%Y-%m-%d')}."
 
-        response = f"Events from {start_date} for {days} days:\n"
-        for event in events:
-            start = event["start"].get("dateTime", event["start"].get("date"))
-            summary = event.get("summary", "No Title")
-            response += f"- [{event['id']}] {start}: {summary}\n"
-            
-        return response
+        return result_format.format_event_list(
+            "list_events_range", f"Events from {start_date} for {days} days:", events
+        )
 
     except HttpError as error:
         return f"An error occurred: {error}"
     except Exception as e:
         return f"System Error: {str(e)}"
 
-def search_events(query: str, days_range: int = 30) -> str:
+def search_events(query: Optional[str] = None, days_range: int = 30, start_date: Optional[str] = None, end_date: Optional[str] = None, attendee: Optional[str] = None, newest_first: Optional[bool] = None, limit: int = SEARCH_LIMIT) -> str:
     """
-    Search for events by title/summary over a range of days from today.
+    Search events by keyword (title, description, location, attendees; prefix
+    and typo tolerant) and/or attendee, via the local event index.
+    Range: start_date..end_date (YYYY-MM-DD, inclusive) if given, otherwise
+    days_range days from now (negative = the past |days_range| days up to now).
+    Past searches list the newest first unless newest_first says otherwise.
+    Queued (write-behind) edits and deletes are reflected; queued new events
+    are only found once delivered.
     """
     try:
+        if not (query or attendee):
+            return "Error: give a query, an attendee, or both."
         service = _get_calendar_service()
-        local_tz = CST
-        
-        now = datetime.datetime.now(local_tz)
-        time_min = now.isoformat()
-        
-        future = now + datetime.timedelta(days=days_range)
-        time_max = future.isoformat()
-
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=time_min,
-                timeMax=time_max,
-                q=query,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
+        now = datetime.datetime.now(CST)
+
+        if start_date or end_date:
+            if start_date:
+                time_min = datetime.datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=CST)
+            if end_date:
+                time_max = datetime.datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=CST) + datetime.timedelta(days=1)
+            if not start_date:
+                time_min = time_max - datetime.timedelta(days=abs(days_range))
+            if not end_date:
+                time_max = time_min + datetime.timedelta(days=abs(days_range))
+            label = f"{time_min:%Y-%m-%d} to {time_max - datetime.timedelta(days=1):%Y-%m-%d}"
+            past = time_max <= now
+        elif days_range < 0:
+            time_min, time_max = now + datetime.timedelta(days=days_range), now
+            label, past = f"past {-days_range} days", True
+        else:
+            time_min, time_max = now, now + datetime.timedelta(days=days_range)
+            label, past = f"next {days_range} days", False
+        if time_max <= time_min:
+            return "Error: end_date is before start_date."
+        if newest_first is None:
+            newest_first = past
+
+        what = " ".join(filter(None, [f"'{query}'" if query else None, f"with {attendee}" if attendee else None]))
+        matches = calendar_cache.search(service, time_min, time_max, query or "", attendee or "")
+        if mutation_queue.WRITE_BEHIND_ENABLED:
+            current = {e["id"]: e for e in mutation_queue.overlay([e for _, e in matches], time_min, time_max, add_new=False)}
+            matches = [(score, current[e["id"]]) for score, e in matches if e["id"] in current]
+        if not matches:
+            return f"No events found matching {what} ({label})."
+
+        total = len(matches)
+        if limit and total > limit:
+            # Keep the best matches; among equals, the ones listed first
+            best = sorted(range(total), key=lambda i: (-matches[i][0], -i if newest_first else i))[:limit]
+            matches = [matches[i] for i in sorted(best)]
+        events = [event for _, event in matches]
+        if newest_first:
+            events.reverse()
+
+        header = f"Search results for {what} ({label}{', newest first' if newest_first else ''}):"
+        if len(events) < total:
+            header += f" best {len(events)} of {total}"
+        return result_format.format_event_list(
+            "search_events", header, events, compact_header=f"{what} {label}:"
         )
-        events = events_result.get("items", [])
 
-        if not events:
-            return f"No events found matching '{query}' in the next {days_range} days."
+    except HttpError as error:
+        return f"An error occurred: {error}"
+    except Exception as e:
+        return f"System Error: {str(e)}"
 
-        response = f"Search results for '{query}' (next {days_range} days):\n"
-        for event in events:
-            start = event["start"].get("dateTime", event["start"].get("date"))
-            summary = event.get("summary", "No Title")
-            response += f"- [{event['id']}] {start}: {summary}\n"
-            
-        return response
+def analyze_time(start_date: str, end_date: Optional[str] = None, days: Optional[int] = None, group_by: Optional[List[str]] = None, keywords: Optional[List[str]] = None) -> str:
+    """
+    Summarizes how time was (or will be) spent between start_date and end_date
+    (inclusive, YYYY-MM-DD): hours per day/week/weekday, busiest hours, and
+    breakdowns by keyword or attendee.
+    """
+    try:
+        service = _get_calendar_service()
+        return time_analytics.analyze(service, start_date, end_date, days, group_by, keywords)
 
     except HttpError as error:
         return f"An error occurred: {error}"
     except Exception as e:
         return f"System Error: {str(e)}"
 
-def schedule_event(title: str, date_str: str, time_str: str, duration_minutes: int = 60, attendees: Optional[List[str]] = None) -> str:
+def _find_conflicts(service, start: datetime.datetime, end: datetime.datetime, exclude_ids: Optional[set] = None) -> List[Dict[str, Any]]:
+    """Busy events overlapping the slot, including writes still queued for Google in write-behind mode."""
+    conflicts = calendar_cache.find_conflicts(service, start, end, exclude_ids)
+    if mutation_queue.WRITE_BEHIND_ENABLED:
+        conflicts = mutation_queue.with_pending(conflicts, start, end, exclude_ids)
+    return conflicts
+
+def _describe(event: Dict[str, Any]) -> str:
+    start = calendar_cache.event_start(event).astimezone(CST)
+    return f"'{event.get('summary', 'No Title')}' on {start:%a %Y-%m-%d %H:%M}"
+
+QUEUED_NOTE = " (queued; syncing to Google Calendar)"
+
+def schedule_event(title: str, date_str: str, time_str: str, duration_minutes: int = 60, attendees: Optional[List[str]] = None, allow_conflicts: bool = False, include_link: bool = False) -> str:
     """
     Schedules an event.
     date_str: YYYY-MM-DD
     time_str: HH:MM
     duration_minutes: Duration in minutes (default 60)
     attendees: List of email strings
+    allow_conflicts: Book even if the slot overlaps existing events
+    include_link: Append the event's Google Calendar URL to the result
     """
     try:
         service = _get_calendar_service()
@@ -201,6 +245,16 @@ def schedule_event(title: str, date_str: str, time_str: str, duration_minutes: i
         # Better approach: Use fully aware datetimes for start/end
         start_dt = datetime.datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M").replace(tzinfo=local_tz)
         end_dt = start_dt + datetime.timedelta(minutes=duration_minutes)
+
+        # Overlap check against the cached busy-period index, before writing
+        if not allow_conflicts:
+            conflicts = _find_conflicts(service, start_dt, end_dt)
+            if conflicts:
+                return (
+                    f"Conflict! {date_str} {time_str} ({duration_minutes} min) overlaps:\n"
+                    f"{result_format.format_conflicts('schedule_event', conflicts)}\n"
+                    "Nothing was scheduled. Call again with allow_conflicts=true to book anyway."
+                )
         
         event = {
             "summary": title,
@@ -215,27 +269,49 @@ def schedule_event(title: str, date_str: str, time_str: str, duration_minutes: i
         if attendees:
             event["attendees"] = [{"email": email} for email in attendees]
 
+        if mutation_queue.WRITE_BEHIND_ENABLED:
+            # Acknowledge now; the id is ours, so a redelivered insert is a no-op
+            event["id"] = mutation_queue.new_event_id()
+            mutation_queue.enqueue(mutation_queue.CREATE, event["id"], event, f"create {_describe(event)}")
+            return result_format.format_mutation(
+                "schedule_event", f"Confirmed. Event queued: {title} on {date_str} at {time_str}",
+                "Created", event, include_link
+            ) + QUEUED_NOTE
+
         created_event = service.events().insert(calendarId="primary", body=event).execute()
+        calendar_cache.apply_change(created_event["id"], created_event)
         
-        return f"Confirmed. Event created: {created_event.get('htmlLink')}"
+        return result_format.format_mutation(
+            "schedule_event", f"Confirmed. Event created: {created_event.get('htmlLink')}",
+            "Created", created_event, include_link
+        )
 
     except HttpError as error:
         return f"An error occurred: {error}"
     except Exception as e:
         return f"System Error: {str(e)}"
 
-def update_event(event_id: str, title: Optional[str] = None, date_str: Optional[str] = None, time_str: Optional[str] = None, duration_minutes: Optional[int] = None, attendees: Optional[List[str]] = None) -> str:
+def update_event(event_id: str, title: Optional[str] = None, date_str: Optional[str] = None, time_str: Optional[str] = None, duration_minutes: Optional[int] = None, attendees: Optional[List[str]] = None, allow_conflicts: bool = False, include_link: bool = False) -> str:
     """
     Updates an existing event's details.
+    event_id may be a short alias from a previous (compact) skill result.
     """
     try:
         service = _get_calendar_service()
+        event_id = result_format.resolve_event_id(event_id)
         
         # Get existing event first to patch it
-        event = service.events().get(calendarId="primary", eventId=event_id).execute()
+        event = None
+        if mutation_queue.WRITE_BEHIND_ENABLED:
+            # An event created moments ago may still be in the queue
+            event = mutation_queue.pending_event(event_id) or calendar_cache.cached_event(event_id)
+        if event is None:
+            event = service.events().get(calendarId="primary", eventId=event_id).execute()
+        event = dict(event)
+        changes = {}
         
         if title:
-            event["summary"] = title
+            event["summary"] = changes["summary"] = title
             
         if date_str or time_str or duration_minutes:
             # We need to reconstruct the start/end if either changes
@@ -256,15 +332,38 @@ def update_event(event_id: str, title: Optional[str] = None, date_str: Optional[
             final_start_dt = datetime.datetime.strptime(f"{new_date} {new_time}", "%Y-%m-%d %H:%M").replace(tzinfo=local_tz)
             final_end_dt = final_start_dt + datetime.timedelta(minutes=new_duration)
             
-            event["start"] = {"dateTime": final_start_dt.isoformat()}
-            event["end"] = {"dateTime": final_end_dt.isoformat()}
+            if not allow_conflicts:
+                conflicts = _find_conflicts(
+                    service, final_start_dt, final_end_dt, exclude_ids={event_id}
+                )
+                if conflicts:
+                    return (
+                        f"Conflict! Moving the event to {new_date} {new_time} ({new_duration} min) overlaps:\n"
+                        f"{result_format.format_conflicts('update_event', conflicts)}\n"
+                        "Nothing was changed. Call again with allow_conflicts=true to move it anyway."
+                    )
+            
+            event["start"] = changes["start"] = {"dateTime": final_start_dt.isoformat()}
+            event["end"] = changes["end"] = {"dateTime": final_end_dt.isoformat()}
             
         if attendees:
             # Replace existing list
-            event["attendees"] = [{"email": email} for email in attendees]
+            event["attendees"] = changes["attendees"] = [{"email": email} for email in attendees]
+
+        if mutation_queue.WRITE_BEHIND_ENABLED:
+            # Only the changed fields are sent (as a patch), so concurrent edits elsewhere survive
+            mutation_queue.enqueue(mutation_queue.PATCH, event_id, changes, f"update {_describe(event)}")
+            return result_format.format_mutation(
+                "update_event", f"Event update queued: {event.get('summary', 'No Title')}",
+                "Updated", event, include_link
+            ) + QUEUED_NOTE
 
         updated_event = service.events().update(calendarId="primary", eventId=event_id, body=event).execute()
-        return f"Event updated successfully: {updated_event.get('htmlLink')}"
+        calendar_cache.apply_change(updated_event["id"], updated_event)
+        return result_format.format_mutation(
+            "update_event", f"Event updated successfully: {updated_event.get('htmlLink')}",
+            "Updated", updated_event, include_link
+        )
 
     except HttpError as error:
         return f"An error occurred: {error}"
@@ -277,7 +376,14 @@ def delete_event(event_id: str) -> str:
     """
     try:
         service = _get_calendar_service()
+        event_id = result_format.resolve_event_id(event_id)
+        if mutation_queue.WRITE_BEHIND_ENABLED:
+            event = mutation_queue.pending_event(event_id) or calendar_cache.cached_event(event_id)
+            description = f"delete {_describe(event)}" if event and event.get("start") else f"delete event {event_id}"
+            mutation_queue.enqueue(mutation_queue.DELETE, event_id, {}, description)
+            return "Event deleted successfully." + QUEUED_NOTE
         service.events().delete(calendarId="primary", eventId=event_id).execute()
+        calendar_cache.apply_change(event_id)
         return "Event deleted successfully."
     except HttpError as error:
         return f"An error occurred: {error}"
@@ -299,6 +405,24 @@ AVAILABLE_TOOLS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "resolve_dates",
+            "description": "Resolve relative date expressions (e.g. 'next Sunday', 'this weekend', 'the Tuesday after next', 'in 3 weeks', 'Nov 6 at 3pm') to exact dates or date ranges in CST. Pass every expression from the request in one call.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "expressions": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The date expressions, as the user wrote them."
+                    }
+                },
+                "required": ["expressions"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -344,6 +468,14 @@ AVAILABLE_TOOLS = [
                         "type": "array",
                         "items": { "type": "string" },
                         "description": "A list of email addresses to invite as attendees."
+                    },
+                    "allow_conflicts": {
+                        "type": "boolean",
+                        "description": "Book even if the slot overlaps existing events. Only set after the user confirms a reported conflict."
+                    },
+                    "include_link": {
+                        "type": "boolean",
+                        "description": "Include the Google Calendar link in the result. Only when the user asks for it."
                     }
                 },
                 "required": ["title", "date_str", "time_str"]
@@ -360,7 +492,7 @@ AVAILABLE_TOOLS = [
                 "properties": {
                     "event_id": {
                         "type": "string",
-                        "description": "The unique identifier of the event to update."
+                        "description": "The event reference shown in [brackets] in list/search results."
                     },
                     "title": {
                         "type": "string",
@@ -382,6 +514,14 @@ AVAILABLE_TOOLS = [
                         "type": "array",
                         "items": { "type": "string" },
                         "description": "New list of email addresses to invite (replaces existing list)."
+                    },
+                    "allow_conflicts": {
+                        "type": "boolean",
+                        "description": "Move the event even if the new time overlaps other events. Only set after the user confirms a reported conflict."
+                    },
+                    "include_link": {
+                        "type": "boolean",
+                        "description": "Include the Google Calendar link in the result. Only when the user asks for it."
                     }
                 },
                 "required": ["event_id"]
@@ -398,7 +538,7 @@ AVAILABLE_TOOLS = [
                 "properties": {
                     "event_id": {
                         "type": "string",
-                        "description": "The unique identifier of the event to delete."
+                        "description": "The event reference shown in [brackets] in list/search results."
                     }
                 },
                 "required": ["event_id"]
@@ -430,20 +570,75 @@ AVAILABLE_TOOLS = [
         "type": "function",
         "function": {
             "name": "search_events",
-            "description": "Search for events by title or keyword. Use this to find specific appointments when the exact date is unknown.",
+            "description": "Search events by keyword (title, description, location or attendee; prefixes and small typos match) and/or attendee, in the future or the past. For 'when did I last meet X' use attendee='X' with a negative days_range (e.g. -365) and limit=1.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "query": {
                         "type": "string",
-                        "description": "The search term (e.g., 'Gym', 'Doctor')."
+                        "description": "The search term (e.g., 'Gym', 'Doctor'). Optional if attendee is given."
+                    },
+                    "attendee": {
+                        "type": "string",
+                        "description": "Only events with this attendee (name, part of a name, or email)."
                     },
                     "days_range": {
                         "type": "integer",
-                        "description": "How many days into the future to search (default is 30)."
+                        "description": "How many days from now to search (default 30); negative searches the past, e.g. -90 for the last 90 days."
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Start of an explicit range (YYYY-MM-DD); overrides days_range."
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "End of an explicit range (YYYY-MM-DD, inclusive)."
+                    },
+                    "newest_first": {
+                        "type": "boolean",
+                        "description": "List the most recent events first (default: true for past ranges)."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of events to return (default 20)."
                     }
                 },
-                "required": ["query"]
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "analyze_time",
+            "description": "Summarize time use over a period (weeks to months): hours in events per day/week/weekday, busiest hours, and totals per keyword or attendee. Use this instead of listing events and adding up durations.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "description": "First day of the period in YYYY-MM-DD format."
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Last day of the period (inclusive) in YYYY-MM-DD format."
+                    },
+                    "days": {
+                        "type": "integer",
+                        "description": "Length of the period in days, if end_date is not given (default is 7)."
+                    },
+                    "group_by": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(time_analytics.GROUPS)},
+                        "description": "Breakdowns to include (default: week, weekday, hour). 'heatmap' is weekday x hour; 'keyword' without keywords groups by title."
+                    },
+                    "keywords": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Title keywords to total separately (e.g. ['standup', '1:1'])."
+                    }
+                },
+                "required": ["start_date"]
             }
         }
     }
@@ -452,6 +647,8 @@ AVAILABLE_TOOLS = [
 def execute_tool_call(tool_name: str, arguments: Dict[str, Any]) -> str:
     if tool_name == "get_current_datetime":
         return get_current_datetime()
+    elif tool_name == "resolve_dates":
+        return resolve_dates(arguments.get("expressions") or [])
     elif tool_name == "list_events":
         return list_events(arguments.get("date_str"))
     elif tool_name == "schedule_event":
@@ -460,7 +657,9 @@ def execute_tool_call(tool_name: str, arguments: Dict[str, Any]) -> str:
             arguments.get("date_str"), 
             arguments.get("time_str"),
             arguments.get("duration_minutes", 60),
-            arguments.get("attendees")
+            arguments.get("attendees"),
+            arguments.get("allow_conflicts", False),
+            arguments.get("include_link", False)
         )
     elif tool_name == "update_event":
         return update_event(
@@ -469,7 +668,9 @@ def execute_tool_call(tool_name: str, arguments: Dict[str, Any]) -> str:
             arguments.get("date_str"),
             arguments.get("time_str"),
             arguments.get("duration_minutes"),
-            arguments.get("attendees")
+            arguments.get("attendees"),
+            arguments.get("allow_conflicts", False),
+            arguments.get("include_link", False)
         )
     elif tool_name == "delete_event":
         return delete_event(arguments.get("event_id"))
@@ -481,7 +682,20 @@ def execute_tool_call(tool_name: str, arguments: Dict[str, Any]) -> str:
     elif tool_name == "search_events":
         return search_events(
             arguments.get("query"),
-            arguments.get("days_range", 30)
+            arguments.get("days_range", 30),
+            arguments.get("start_date"),
+            arguments.get("end_date"),
+            arguments.get("attendee"),
+            arguments.get("newest_first"),
+            arguments.get("limit", SEARCH_LIMIT)
+        )
+    elif tool_name == "analyze_time":
+        return analyze_time(
+            arguments.get("start_date"),
+            arguments.get("end_date"),
+            arguments.get("days"),
+            arguments.get("group_by"),
+            arguments.get("keywords")
         )
     else:
         return f"Error: Unknown tool '{tool_name}'"
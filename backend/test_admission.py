@@ -0,0 +1,69 @@
+import json
+import unittest
+from unittest import mock
+import admission
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    """Slot accounting, per-user skipping and load shedding."""
+
+    def test_per_user_limit_skips_instead_of_blocking(self):
+        controller = admission.AdmissionController(max_active=2, max_per_user=1, max_queued=4)
+        alice = controller._enqueue("alice")
+        alice_again = controller._enqueue("alice")
+        bob = controller._enqueue("bob")
+        self.assertTrue(alice.admitted)
+        self.assertFalse(alice_again.admitted)
+        # Bob arrived later but isn't held back by Alice's second turn
+        self.assertTrue(bob.admitted)
+
+        controller._leave(alice)
+        self.assertTrue(alice_again.admitted)
+        snapshot = controller.snapshot()
+        self.assertEqual((snapshot["active"], snapshot["queued"], snapshot["admitted_total"]), (2, 0, 3))
+
+    def test_fifo_when_global_limit_frees_up(self):
+        controller = admission.AdmissionController(max_active=1, max_per_user=1, max_queued=4)
+        first = controller._enqueue("a")
+        second, third = controller._enqueue("b"), controller._enqueue("c")
+        controller._leave(first)
+        self.assertTrue(second.admitted)
+        self.assertFalse(third.admitted)
+
+    def test_sheds_when_queue_is_full(self):
+        controller = admission.AdmissionController(max_active=1, max_per_user=1, max_queued=1)
+        running = controller._enqueue("a")
+        queued = controller._enqueue("b")
+        self.assertIsNotNone(queued)
+        self.assertIsNone(controller._enqueue("c"))
+        self.assertEqual(controller.snapshot()["shed_total"], 1)
+
+        # A queued turn that gives up frees its place
+        controller._leave(queued)
+        self.assertIsNotNone(controller._enqueue("c"))
+        controller._leave(running)
+        self.assertEqual(controller.snapshot()["active"], 1)
+
+    def test_run_reports_overload_and_releases_slots(self):
+        controller = admission.AdmissionController(max_active=1, max_per_user=1, max_queued=0)
+        turn = controller.run("a", lambda: iter(["answer\n"]))
+        self.assertEqual(next(turn), "answer\n")
+        shed = [json.loads(line) for line in controller.run("b", lambda: iter(["never\n"]))]
+        self.assertEqual([(e["type"], e["data"]["reason"]) for e in shed], [("error", "overloaded")])
+        turn.close()
+        self.assertEqual(controller.snapshot()["active"], 0)
+        self.assertEqual(list(controller.run("b", lambda: iter(["answer\n"]))), ["answer\n"])
+
+    def test_run_times_out_in_queue(self):
+        controller = admission.AdmissionController(max_active=1, max_per_user=1, max_queued=1)
+        running = controller._enqueue("a")
+        with mock.patch.object(admission, "QUEUE_TIMEOUT_SECONDS", 0.05):
+            events = [json.loads(line) for line in controller.run("b", lambda: iter(["never\n"]))]
+        self.assertEqual(events[0]["data"]["queue_position"], 1)
+        self.assertEqual(events[-1]["data"]["reason"], "queue_timeout")
+        self.assertEqual(controller.snapshot()["queued"], 0)
+        controller._leave(running)
+
+
+if __name__ == "__main__":
+    unittest.main()
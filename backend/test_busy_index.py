@@ -0,0 +1,61 @@
+import random
+import datetime
+import unittest
+from busy_index import IntervalIndex
+
+BASE = datetime.datetime(2026, 10, 19, tzinfo=datetime.timezone.utc)
+
+
+def _at(minutes: int) -> datetime.datetime:
+    return BASE + datetime.timedelta(minutes=minutes)
+
+
+def _brute(intervals, start, end):
+    hits = [iv for iv in sorted(intervals, key=lambda iv: (iv[0], iv[1])) if iv[0] < end and iv[1] > start]
+    return sorted((iv[2] for iv in hits), key=str)
+
+
+class IntervalIndexTest(unittest.TestCase):
+    """Overlap queries against a brute-force scan, before and after in-place edits."""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.intervals = []
+        for n in range(300):
+            start = rng.randrange(0, 20000)
+            # Mostly short meetings, a few long blocks that hide behind later starts
+            length = rng.choice([15, 30, 60, 90]) if n % 25 else rng.randrange(600, 5000)
+            self.intervals.append((_at(start), _at(start + length), n))
+        self.index = IntervalIndex(self.intervals)
+        self.queries = [(rng.randrange(-100, 21000), rng.randrange(1, 240)) for _ in range(200)]
+
+    def assertMatchesBrute(self):
+        for start, length in self.queries:
+            got = self.index.overlapping(_at(start), _at(start + length))
+            self.assertEqual(sorted(got, key=str), _brute(self.intervals, _at(start), _at(start + length)))
+
+    def test_overlapping_matches_scan(self):
+        self.assertEqual(len(self.index), len(self.intervals))
+        self.assertMatchesBrute()
+
+    def test_touching_intervals_do_not_overlap(self):
+        index = IntervalIndex([(_at(0), _at(30), "a"), (_at(30), _at(60), "b")])
+        self.assertEqual(index.overlapping(_at(30), _at(45)), ["b"])
+        self.assertEqual(index.overlapping(_at(60), _at(90)), [])
+        self.assertEqual(index.overlapping(_at(10), _at(40)), ["a", "b"])
+
+    def test_insert_and_remove_keep_index_consistent(self):
+        added = [(_at(s), _at(s + 4000), f"long{s}") for s in (50, 9000, 19990)]
+        self.index.insert(added)
+        self.intervals += added
+        self.assertMatchesBrute()
+
+        removed = self.index.remove(lambda payload: isinstance(payload, int) and payload % 3 == 0)
+        self.assertEqual(removed, 100)
+        self.intervals = [iv for iv in self.intervals if not (isinstance(iv[2], int) and iv[2] % 3 == 0)]
+        self.assertMatchesBrute()
+        self.assertEqual(self.index.remove(lambda payload: False), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import datetime
+import unittest
+from dateutil import tz
+import calendar_cache
+
+CHICAGO = tz.gettz("America/Chicago")
+UTC = datetime.timezone.utc
+
+
+def _window(first: datetime.date, days: int):
+    start = datetime.datetime.combine(first, datetime.time(), calendar_cache.CST)
+    return start, start + datetime.timedelta(days=days)
+
+
+def _standup(*recurrence):
+    return {
+        "id": "standup",
+        "summary": "Standup",
+        "start": {"dateTime": "2026-10-19T10:00:00-05:00", "timeZone": "America/Chicago"},
+        "end": {"dateTime": "2026-10-19T10:15:00-05:00", "timeZone": "America/Chicago"},
+        "recurrence": list(recurrence),
+    }
+
+
+class RecurrenceTest(unittest.TestCase):
+    """RRULE/EXDATE expansion and exception handling in calendar_cache._instances."""
+
+    def test_weekly_keeps_local_time_across_dst(self):
+        master = _standup("RRULE:FREQ=WEEKLY;BYDAY=MO")
+        instances = calendar_cache._instances([master], *_window(datetime.date(2026, 10, 19), 21))
+        starts = [calendar_cache.event_start(e) for e in instances]
+        self.assertEqual([s.astimezone(CHICAGO).hour for s in starts], [10, 10, 10])
+        # Nov 1 ends daylight time: the same 10:00 is an hour later in UTC
+        self.assertEqual([s.astimezone(UTC).hour for s in starts], [15, 15, 16])
+        self.assertEqual(instances[0]["id"], "standup_20261019T150000Z")
+        self.assertEqual(instances[0]["recurringEventId"], "standup")
+        self.assertNotIn("recurrence", instances[0])
+        self.assertEqual(calendar_cache.event_end(instances[2]) - starts[2], datetime.timedelta(minutes=15))
+
+    def test_exdate_and_until(self):
+        master = _standup(
+            "RRULE:FREQ=DAILY;UNTIL=20261023",
+            "EXDATE;TZID=America/Chicago:20261021T100000",
+        )
+        instances = calendar_cache._instances([master], *_window(datetime.date(2026, 10, 19), 14))
+        days = [calendar_cache.event_start(e).astimezone(CHICAGO).day for e in instances]
+        self.assertEqual(days, [19, 20, 22, 23])
+
+    def test_exceptions_replace_or_cancel_occurrences(self):
+        master = _standup("RRULE:FREQ=DAILY;COUNT=3")
+        moved = {
+            "id": "standup_20261020T150000Z",
+            "recurringEventId": "standup",
+            "originalStartTime": {"dateTime": "2026-10-20T10:00:00-05:00"},
+            "summary": "Standup (late)",
+            "start": {"dateTime": "2026-10-20T14:00:00-05:00"},
+            "end": {"dateTime": "2026-10-20T14:15:00-05:00"},
+        }
+        cancelled = {
+            "id": "standup_20261021T150000Z",
+            "recurringEventId": "standup",
+            "originalStartTime": {"dateTime": "2026-10-21T15:00:00Z"},
+            "status": "cancelled",
+        }
+        instances = calendar_cache._instances([master, moved, cancelled], *_window(datetime.date(2026, 10, 19), 7))
+        self.assertEqual([e["summary"] for e in instances], ["Standup", "Standup (late)"])
+        self.assertEqual(calendar_cache.event_start(instances[1]).astimezone(CHICAGO).hour, 14)
+
+    def test_all_day_series(self):
+        master = {
+            "id": "trip",
+            "summary": "Conference",
+            "start": {"date": "2026-10-18"},
+            "end": {"date": "2026-10-20"},
+            "recurrence": ["RRULE:FREQ=WEEKLY;COUNT=2"],
+        }
+        # The first occurrence started the day before the window but is still running
+        instances = calendar_cache._instances([master], *_window(datetime.date(2026, 10, 19), 14))
+        self.assertEqual([(e["start"]["date"], e["end"]["date"]) for e in instances],
+                         [("2026-10-18", "2026-10-20"), ("2026-10-25", "2026-10-27")])
+        self.assertEqual(instances[1]["id"], "trip_20261025")
+
+    def test_window_bounds(self):
+        master = _standup("RRULE:FREQ=DAILY")
+        start = datetime.datetime(2026, 10, 20, 10, 10, tzinfo=CHICAGO)
+        # Starts inside [start, end) or still running at start; nothing starting at end
+        end = datetime.datetime(2026, 10, 21, 10, 0, tzinfo=CHICAGO)
+        instances = calendar_cache._instances([master], start, end)
+        self.assertEqual([e["id"] for e in instances], ["standup_20261020T150000Z"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, ChatSession, ChatMessage
+import chat_export
+import chat_storage
+
+
+def _contents(db):
+    sessions = [(s.id, s.title, s.created_at, s.updated_at) for s in db.query(ChatSession).order_by(ChatSession.id)]
+    messages = [
+        (m.id, m.session_id, m.role, m.content, m.tool_call_id, m.tool_calls, m.name, m.timestamp)
+        for m in db.query(ChatMessage).order_by(ChatMessage.id)
+    ]
+    return sessions, messages
+
+
+class RoundTripTest(unittest.TestCase):
+    """Export to NDJSON (optionally gzipped) and import into an empty database."""
+
+    def setUp(self):
+        source = create_engine("sqlite://")
+        Base.metadata.create_all(source)
+        self.source = sessionmaker(bind=source)()
+        for title in ("Trip", "Dentist"):
+            session = chat_storage.create_chat_session(self.source, title)
+            chat_storage.save_message(self.source, session.id, "user", f"plan the {title.lower()} — ok?")
+            chat_storage.save_message(self.source, session.id, "assistant", None, tool_calls=[
+                {"id": "call_1", "type": "function", "function": {"name": "list_events", "arguments": "{}"}}])
+            chat_storage.save_message(self.source, session.id, "tool", "[]", tool_call_id="call_1", name="list_events")
+        target = create_engine("sqlite://")
+        Base.metadata.create_all(target)
+        self.Target = sessionmaker(bind=target)
+        self.target = self.Target()
+        patcher = mock.patch.object(chat_export, "SessionLocal", self.Target)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.source.close()
+        self.target.close()
+
+    def test_preserve_ids_restores_everything(self):
+        lines = list(chat_export.export_lines(self.source))
+        with mock.patch.object(chat_export.memory.INDEX, "rebuild") as rebuild:
+            summary = chat_export.import_lines(lines, preserve_ids=True)
+        self.assertEqual(summary, {"sessions": 2, "messages": 6, "skipped": 0})
+        self.assertEqual(_contents(self.target), _contents(self.source))
+        # Restored ids may be below the recall index watermark
+        rebuild.assert_called_once()
+
+    def test_gzip_chunks_with_new_ids(self):
+        existing = ChatSession(title="Already here")
+        self.target.add(existing)
+        self.target.commit()
+        with mock.patch.object(chat_export, "SessionLocal", sessionmaker(bind=self.source.get_bind())):
+            chunks = list(chat_export.export_chunks(compress=True))
+        self.assertEqual(chunks[0][:2], b"\x1f\x8b")
+
+        importer = chat_export.Importer()
+        with mock.patch.object(chat_export.memory.INDEX, "rebuild") as rebuild:
+            for line in chat_export.iter_lines(chunks):
+                importer.add(json.loads(line))
+            importer.finish()
+        rebuild.assert_not_called()
+
+        sessions, messages = _contents(self.target)
+        source_sessions, source_messages = _contents(self.source)
+        self.assertEqual([s[1] for s in sessions], ["Already here", "Trip", "Dentist"])
+        # Same messages, remapped onto the new session ids
+        new_ids = {old[0]: new[0] for old, new in zip(source_sessions, sessions[1:])}
+        self.assertEqual([m[2:] for m in messages], [m[2:] for m in source_messages])
+        self.assertEqual([m[1] for m in messages], [new_ids[m[1]] for m in source_messages])
+
+    def test_missing_timestamps_get_defaults(self):
+        lines = [
+            json.dumps({"type": "header", "format": chat_export.EXPORT_FORMAT, "version": chat_export.EXPORT_VERSION}),
+            json.dumps({"type": "session", "id": 1, "title": "Old", "created_at": None}),
+            json.dumps({"type": "message", "session_id": 1, "role": "user", "content": "hi", "timestamp": None}),
+            json.dumps({"type": "unknown"}),
+        ]
+        summary = chat_export.import_lines(lines)
+        self.assertEqual(summary["skipped"], 1)
+        session = self.target.query(ChatSession).one()
+        self.assertIsNotNone(session.created_at)
+        self.assertIsNotNone(session.updated_at)
+        self.assertIsNotNone(self.target.query(ChatMessage).one().timestamp)
+
+    def test_rejects_other_formats(self):
+        with self.assertRaises(ValueError):
+            chat_export.import_lines([json.dumps({"type": "header", "format": "other", "version": 1})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+import chat_storage
+
+
+class SessionSyncTest(unittest.TestCase):
+    """The session ETag and the windows used for incremental message sync."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.session = chat_storage.create_chat_session(self.db, "Planning")
+        self.ids = [chat_storage.save_message(self.db, self.session.id, "user", f"message {n}").id for n in range(6)]
+
+    def tearDown(self):
+        self.db.close()
+
+    def _window(self, **kwargs):
+        messages, has_more = chat_storage.get_session_messages_window(self.db, self.session.id, **kwargs)
+        return [m.id for m in messages], has_more
+
+    def test_etag_changes_with_contents_only(self):
+        etag = chat_storage.session_etag(self.db, self.session)
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(chat_storage.session_etag(self.db, self.session), etag)
+
+        chat_storage.save_message(self.db, self.session.id, "assistant", "reply")
+        after_message = chat_storage.session_etag(self.db, self.session)
+        self.assertNotEqual(after_message, etag)
+
+        chat_storage.update_session_title(self.db, self.session.id, "Renamed")
+        self.assertNotEqual(chat_storage.session_etag(self.db, self.session), after_message)
+
+    def test_etag_is_per_session(self):
+        other = chat_storage.create_chat_session(self.db, "Planning")
+        self.assertNotEqual(chat_storage.session_etag(self.db, other), chat_storage.session_etag(self.db, self.session))
+
+    def test_incremental_windows(self):
+        self.assertEqual(self._window(), (self.ids, False))
+        self.assertEqual(self._window(after_id=self.ids[3]), (self.ids[4:], False))
+        self.assertEqual(self._window(after_id=self.ids[-1]), ([], False))
+        # Catching up in pages: oldest unseen first
+        self.assertEqual(self._window(after_id=self.ids[0], limit=2), (self.ids[1:3], True))
+        self.assertEqual(self._window(after_id=self.ids[3], limit=2), (self.ids[4:], False))
+
+    def test_paging_back(self):
+        # Newest first page, then older pages before the cursor, each oldest first
+        self.assertEqual(self._window(limit=4), (self.ids[2:], True))
+        self.assertEqual(self._window(before_id=self.ids[2], limit=4), (self.ids[:2], False))
+        self.assertEqual(self._window(after_id=self.ids[0], before_id=self.ids[4]), (self.ids[1:4], False))
+
+
+if __name__ == "__main__":
+    unittest.main()
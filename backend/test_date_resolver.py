@@ -0,0 +1,76 @@
+import datetime
+import unittest
+import date_resolver
+
+# A Monday
+TODAY = datetime.date(2026, 10, 19)
+
+
+def _resolve(expression):
+    return date_resolver.resolve(expression, TODAY)
+
+
+class ResolveTest(unittest.TestCase):
+
+    def test_relative_days(self):
+        self.assertEqual(_resolve("tomorrow").start, datetime.date(2026, 10, 20))
+        self.assertEqual(_resolve("day before yesterday").start, datetime.date(2026, 10, 17))
+        self.assertEqual(_resolve("in a fortnight").start, datetime.date(2026, 11, 2))
+        self.assertEqual(_resolve("2 weeks ago").start, datetime.date(2026, 10, 5))
+
+    def test_weekdays(self):
+        self.assertEqual(_resolve("monday").start, TODAY)
+        self.assertEqual(_resolve("friday").start, datetime.date(2026, 10, 23))
+        self.assertEqual(_resolve("last friday").start, datetime.date(2026, 10, 16))
+        self.assertEqual(_resolve("friday next week").start, datetime.date(2026, 10, 30))
+        # "next friday" from a Monday is this week's, with the other reading noted
+        resolution = _resolve("next friday")
+        self.assertEqual(resolution.start, datetime.date(2026, 10, 23))
+        self.assertIn("2026-10-30", resolution.note)
+
+    def test_periods(self):
+        week = _resolve("next week")
+        self.assertEqual((week.start, week.end), (datetime.date(2026, 10, 26), datetime.date(2026, 11, 1)))
+        weekend = _resolve("this weekend")
+        self.assertEqual((weekend.start, weekend.end), (datetime.date(2026, 10, 24), datetime.date(2026, 10, 25)))
+        month = _resolve("end of next month")
+        self.assertEqual(month.start, datetime.date(2026, 11, 30))
+        days = _resolve("next 3 days")
+        self.assertEqual((days.start, days.end), (TODAY, datetime.date(2026, 10, 21)))
+
+    def test_absolute_dates_roll_forward(self):
+        self.assertEqual(_resolve("december 24").start, datetime.date(2026, 12, 24))
+        self.assertIsNone(_resolve("december 24").note)
+        self.assertEqual(_resolve("2026-03-01").start, datetime.date(2026, 3, 1))
+
+        resolution = _resolve("the 15th")
+        self.assertEqual(resolution.start, datetime.date(2026, 11, 15))
+        self.assertIn("2026-10-15", resolution.note)
+        self.assertEqual(_resolve("march 3").start, datetime.date(2027, 3, 3))
+        # The next month that has a 31st
+        self.assertEqual(_resolve("the 31st").start, datetime.date(2026, 10, 31))
+        self.assertEqual(date_resolver.resolve("the 31st", datetime.date(2026, 12, 31)).start,
+                         datetime.date(2026, 12, 31))
+        self.assertEqual(date_resolver.resolve("the 31st", datetime.date(2027, 1, 31)).start,
+                         datetime.date(2027, 1, 31))
+        self.assertEqual(date_resolver.resolve("the 30th", datetime.date(2027, 1, 31)).start,
+                         datetime.date(2027, 3, 30))
+
+    def test_times(self):
+        resolution = _resolve("tomorrow at 3")
+        self.assertEqual(resolution.time, datetime.time(15, 0))
+        self.assertIn("15:00", resolution.note)
+        self.assertEqual(_resolve("friday at 3am").time, datetime.time(3, 0))
+        self.assertEqual(_resolve("friday at 9").time, datetime.time(9, 0))
+        self.assertIsNone(_resolve("friday at 9").note)
+        self.assertEqual(_resolve("tomorrow at noon").time, datetime.time(12, 0))
+
+    def test_unrecognized(self):
+        with self.assertRaises(ValueError):
+            _resolve("whenever works")
+        with self.assertRaises(ValueError):
+            _resolve("   ")
+
+
+if __name__ == "__main__":
+    unittest.main()
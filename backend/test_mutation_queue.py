@@ -0,0 +1,57 @@
+import sqlite3
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, PendingMutation
+import event_index
+import mutation_queue
+
+
+class SettleTest(unittest.TestCase):
+    """_settle with stubbed delivery outcomes, including a commit that hits a locked database."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.rows = [
+            PendingMutation(event_id="e1", kind=mutation_queue.CREATE, status=mutation_queue.FLUSHING,
+                            body='{"summary": "Lunch with Ana", "start": {"dateTime": "2026-10-20T12:00:00-06:00"}}'),
+            PendingMutation(event_id="e2", kind=mutation_queue.PATCH, status=mutation_queue.FLUSHING, body="{}"),
+        ]
+        self.db.add_all(self.rows)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        event_index.remove("e1")
+
+    def test_settle_retries_locked_commit(self):
+        outcomes = {"e1": "done", "e2": "retry"}
+        errors = {row.id: None for row in self.rows}
+        locked = OperationalError("COMMIT", {}, sqlite3.OperationalError("database is locked"))
+        real_commit = self.db.commit
+        attempts = []
+
+        def commit():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise locked
+            real_commit()
+
+        with mock.patch.object(mutation_queue, "_outcome", lambda row, error: outcomes[row.event_id]), \
+                mock.patch.object(self.db, "commit", side_effect=commit), \
+                mock.patch("database.time.sleep"):
+            delivered, failed = mutation_queue._settle(self.db, self.rows, errors)
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual((delivered, failed), (1, []))
+        remaining = self.db.query(PendingMutation).all()
+        self.assertEqual([(r.event_id, r.status, r.attempts) for r in remaining], [("e2", mutation_queue.PENDING, 1)])
+        self.assertIn("e1", event_index.match("lunch")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import datetime
+from typing import List, Dict, Any, Optional
+import numpy as np
+import calendar_cache
+import mutation_queue
+
+# Time-usage analytics for the analyze_time skill.
+# Event instances of a (possibly months long) window are loaded into NumPy
+# columns once, and every aggregate is computed on arrays: hourly busy time
+# comes from the integral of the coverage function evaluated on an hour grid
+# (sorted starts/ends + prefix sums), and days, weeks, weekdays and the busy-hour
+# heatmap are reshapes/bincounts of that series. Only a short text summary goes
+# back to the model. Times are CST like the rest of the skills.
+ANALYZE_MAX_DAYS = int(os.getenv("ANALYZE_MAX_DAYS", "366"))
+ANALYZE_TOP_N = int(os.getenv("ANALYZE_TOP_N", "5"))
+CST = datetime.timezone(datetime.timedelta(hours=-6))
+
+GROUPS = ("day", "week", "weekday", "hour", "heatmap", "keyword", "attendee")
+DEFAULT_GROUPS = ("week", "weekday", "hour")
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class EventColumns:
+    """
+    Busy timed event instances as parallel arrays, clipped to [start, end).
+    All-day, free (transparent) and declined events don't count as used time.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], start: datetime.datetime, end: datetime.datetime):
+        timed = [e for e in events if "dateTime" in e["start"]]
+        busy = [e for e in timed if calendar_cache.is_busy(e)]
+        self.all_day = len(events) - len(timed)
+        self.free = len(timed) - len(busy)
+        t0, t1 = start.timestamp(), end.timestamp()
+        n = len(busy)
+        self.starts = np.clip(np.fromiter((calendar_cache.event_start(e).timestamp() for e in busy), float, n), t0, t1)
+        self.ends = np.clip(np.fromiter((calendar_cache.event_end(e).timestamp() for e in busy), float, n), t0, t1)
+        self.hours = (self.ends - self.starts) / 3600
+        self.titles = np.array([(e.get("summary") or "").strip().lower() for e in busy], dtype=str)
+        # One row per (event, attendee) pair, excluding the user themselves
+        pairs = [
+            (i, a["email"].lower())
+            for i, e in enumerate(busy)
+            for a in e.get("attendees", [])
+            if a.get("email") and not a.get("self")
+        ]
+        self.attendee_event = np.fromiter((i for i, _ in pairs), np.int64, len(pairs))
+        self.attendee_email = np.array([email for _, email in pairs], dtype=str)
+
+    def __len__(self):
+        return len(self.hours)
+
+
+def _coverage(points: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """sum(max(0, g - p)) over all points p, for every grid value g."""
+    ordered = np.sort(points)
+    prefix = np.concatenate(([0.0], np.cumsum(ordered)))
+    below = np.searchsorted(ordered, grid, side="right")
+    return below * grid - prefix[below]
+
+
+def hourly_busy(columns: EventColumns, start: datetime.datetime, n_hours: int) -> np.ndarray:
+    """Busy hours within each hour of the window (overlapping events add up)."""
+    grid = start.timestamp() + 3600.0 * np.arange(n_hours + 1)
+    busy_seconds = _coverage(columns.starts, grid) - _coverage(columns.ends, grid)
+    return np.diff(busy_seconds) / 3600
+
+
+def _fmt(hours: float) -> str:
+    return f"{hours:.1f}h"
+
+
+def _top(labels: np.ndarray, hours: np.ndarray, counts: np.ndarray) -> str:
+    order = np.argsort(-hours, kind="stable")[:ANALYZE_TOP_N]
+    return ", ".join(f"{labels[i]} {_fmt(hours[i])} ({counts[i]})" for i in order if hours[i] > 0) or "none"
+
+
+def _grouped(keys: np.ndarray, hours: np.ndarray) -> str:
+    if not len(keys):
+        return "none"
+    labels, inverse = np.unique(keys, return_inverse=True)
+    return _top(labels, np.bincount(inverse, weights=hours), np.bincount(inverse))
+
+
+def summarize(events: List[Dict[str, Any]], start_day: datetime.date, days: int,
+              group_by: Optional[List[str]] = None, keywords: Optional[List[str]] = None) -> str:
+    """Compact text summary of time use over `days` CST days from `start_day`."""
+    groups = [g for g in (group_by or DEFAULT_GROUPS) if g in GROUPS]
+    if keywords and "keyword" not in groups:
+        groups.append("keyword")
+    start = datetime.datetime.combine(start_day, datetime.time(), tzinfo=CST)
+    end = start + datetime.timedelta(days=days)
+    columns = EventColumns(events, start, end)
+
+    per_day = hourly_busy(columns, start, days * 24).reshape(days, 24)
+    day_totals = per_day.sum(axis=1)
+    total = float(day_totals.sum())
+    last_day = start_day + datetime.timedelta(days=days - 1)
+    lines = [
+        f"Time use {start_day} to {last_day} ({days} days): {len(columns)} busy events, {_fmt(total)} "
+        f"(avg {_fmt(total / days)}/day, {_fmt(total * 7 / days)}/week)."
+    ]
+    if columns.all_day or columns.free:
+        lines.append(f"Not counted: {columns.all_day} all-day, {columns.free} free/declined.")
+    if not len(columns):
+        return "\n".join(lines)
+
+    weekday_of_day = (start_day.weekday() + np.arange(days)) % 7
+    for group in groups:
+        if group == "day":
+            busiest = np.argsort(-day_totals, kind="stable")[:ANALYZE_TOP_N]
+            cells = [f"{start_day + datetime.timedelta(days=int(i))} {_fmt(day_totals[i])}" for i in busiest if day_totals[i] > 0]
+            lines.append(f"Busiest days: {', '.join(cells)}; {int(np.count_nonzero(day_totals))} of {days} days had events.")
+        elif group == "week":
+            # Monday-aligned weeks; the first/last may be partial
+            lead = start_day.weekday()
+            padded = np.concatenate((np.zeros(lead), day_totals, np.zeros(-(lead + days) % 7)))
+            weekly = padded.reshape(-1, 7).sum(axis=1)
+            monday = start_day - datetime.timedelta(days=lead)
+            cells = [f"{monday + datetime.timedelta(weeks=i)} {_fmt(h)}" for i, h in enumerate(weekly)]
+            lines.append(f"Per week (from Monday): {', '.join(cells)}; avg {_fmt(float(weekly.mean()))}, max {_fmt(float(weekly.max()))}.")
+        elif group == "weekday":
+            sums = np.bincount(weekday_of_day, weights=day_totals, minlength=7)
+            occurrences = np.bincount(weekday_of_day, minlength=7)
+            averages = np.divide(sums, occurrences, out=np.zeros(7), where=occurrences > 0)
+            cells = [f"{WEEKDAY_NAMES[i]} {_fmt(averages[i])}" for i in range(7)]
+            lines.append(f"Avg per weekday: {', '.join(cells)}; busiest {WEEKDAY_NAMES[int(np.argmax(averages))]}.")
+        elif group == "hour":
+            by_hour = per_day.sum(axis=0)
+            busiest = np.argsort(-by_hour, kind="stable")[:ANALYZE_TOP_N]
+            cells = [f"{i:02d}:00 {_fmt(by_hour[i])}" for i in busiest if by_hour[i] > 0]
+            lines.append(f"Busiest hours (CST): {', '.join(cells)}.")
+        elif group == "heatmap":
+            heat = np.zeros((7, 24))
+            np.add.at(heat, weekday_of_day, per_day)
+            active = np.flatnonzero(heat.sum(axis=0) > 0)
+            if not active.size:
+                continue
+            hours = range(int(active[0]), int(active[-1]) + 1)
+            lines.append(f"Heatmap (busy hours per weekday x hour {hours.start:02d}:00-{hours.stop - 1:02d}:00 CST):")
+            for i in range(7):
+                lines.append(f"{WEEKDAY_NAMES[i]}: " + " ".join(f"{heat[i, h]:.1f}" for h in hours))
+        elif group == "keyword":
+            if keywords:
+                labels = np.array(keywords, dtype=object)
+                masks = [np.char.find(columns.titles, k.strip().lower()) >= 0 for k in keywords]
+                hours = np.array([columns.hours[m].sum() for m in masks])
+                counts = np.array([int(m.sum()) for m in masks])
+                lines.append(f"By keyword: {_top(labels, hours, counts)}.")
+            else:
+                lines.append(f"By title: {_grouped(columns.titles, columns.hours)}.")
+        elif group == "attendee":
+            lines.append(f"By attendee: {_grouped(columns.attendee_email, columns.hours[columns.attendee_event])}.")
+    return "\n".join(lines)
+
+
+def analyze(service, start_date: str, end_date: Optional[str] = None, days: Optional[int] = None,
+            group_by: Optional[List[str]] = None, keywords: Optional[List[str]] = None) -> str:
+    """Fetch the window through the calendar cache (all pages) and summarize it."""
+    start_day = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    if end_date:
+        days = (datetime.datetime.strptime(end_date, "%Y-%m-%d").date() - start_day).days + 1
+    days = days or 7
+    if days < 1:
+        raise ValueError("end_date is before start_date")
+    note = ""
+    if days > ANALYZE_MAX_DAYS:
+        days = ANALYZE_MAX_DAYS
+        note = f"\n(Window truncated to {ANALYZE_MAX_DAYS} days.)"
+    start = datetime.datetime.combine(start_day, datetime.time(), tzinfo=CST)
+    end = start + datetime.timedelta(days=days)
+    events = mutation_queue.overlay(calendar_cache.events_between(service, start, end), start, end)
+    return summarize(events, start_day, days, group_by, keywords) + note
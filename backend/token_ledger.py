@@ -0,0 +1,180 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, NamedTuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal, TokenUsage, retry_on_locked
+import model_router
+
+# Token ledger: prompt/completion tokens of every LLM call, persisted per agent
+# turn and tier next to the chat tables, plus optional budgets on top of it.
+# A session past TOKEN_COMPACT_RATIO of its budget (or whose last turn sent
+# prompts larger than TOKEN_COMPACT_PROMPT_TOKENS) gets its history compacted
+# to the most recent messages; past the budget, new LLM turns are refused.
+# Fast-path and cached answers cost no tokens and are never refused. 0 = no limit.
+TOKEN_BUDGET_PER_SESSION = int(os.getenv("TOKEN_BUDGET_PER_SESSION", "0"))
+TOKEN_BUDGET_PER_USER_DAY = int(os.getenv("TOKEN_BUDGET_PER_USER_DAY", "0"))
+TOKEN_COMPACT_RATIO = float(os.getenv("TOKEN_COMPACT_RATIO", "0.5"))
+TOKEN_COMPACT_PROMPT_TOKENS = int(os.getenv("TOKEN_COMPACT_PROMPT_TOKENS", "0"))
+TOKEN_COMPACT_KEEP_MESSAGES = int(os.getenv("TOKEN_COMPACT_KEEP_MESSAGES", "6"))
+USER_WINDOW = timedelta(days=1)
+
+_TOTAL = func.coalesce(func.sum(TokenUsage.prompt_tokens + TokenUsage.completion_tokens), 0)
+
+
+class Budget(NamedTuple):
+    compact: bool = False
+    refusal: Optional[str] = None
+
+
+@retry_on_locked
+def _insert(db: Session, rows: List[TokenUsage]):
+    db.add_all(rows)
+    db.commit()
+
+
+def record_turn(session_id: Optional[int], turn_id: Optional[str], user: Optional[str],
+                stats: model_router.TierStats):
+    """Persist a finished turn's usage, one row per model tier. Never raises."""
+    rows = [
+        TokenUsage(
+            session_id=session_id, turn_id=turn_id, user=user, tier=tier, model=s["model"],
+            calls=s["calls"], prompt_tokens=s["prompt_tokens"], completion_tokens=s["completion_tokens"],
+            latency_ms=int(s["latency_ms_total"]),
+        )
+        for tier, s in stats.totals().items() if s["calls"]
+    ]
+    if not rows:
+        return
+    db = SessionLocal()
+    try:
+        _insert(db, rows)
+    except Exception as e:
+        print(f"Token ledger write failed: {e}")
+    finally:
+        db.close()
+
+
+def _session_total(db: Session, session_id: int) -> int:
+    return db.query(_TOTAL).filter(TokenUsage.session_id == session_id).scalar()
+
+
+def _user_total(db: Session, user: str) -> int:
+    since = datetime.utcnow() - USER_WINDOW
+    return db.query(_TOTAL).filter(TokenUsage.user == user, TokenUsage.created_at >= since).scalar()
+
+
+def _last_turn_prompt_per_call(db: Session, session_id: int) -> float:
+    last = (
+        db.query(TokenUsage.turn_id)
+        .filter(TokenUsage.session_id == session_id)
+        .order_by(TokenUsage.id.desc())
+        .first()
+    )
+    if not last:
+        return 0.0
+    prompt, calls = (
+        db.query(func.sum(TokenUsage.prompt_tokens), func.sum(TokenUsage.calls))
+        .filter(TokenUsage.session_id == session_id, TokenUsage.turn_id == last.turn_id)
+        .one()
+    )
+    return (prompt or 0) / calls if calls else 0.0
+
+
+def check(session_id: Optional[int], user: Optional[str]) -> Budget:
+    """Budget decision for a new LLM turn."""
+    if not (TOKEN_BUDGET_PER_SESSION or TOKEN_BUDGET_PER_USER_DAY or TOKEN_COMPACT_PROMPT_TOKENS):
+        return Budget()
+    db = SessionLocal()
+    try:
+        if user and TOKEN_BUDGET_PER_USER_DAY:
+            used = _user_total(db, user)
+            if used >= TOKEN_BUDGET_PER_USER_DAY:
+                return Budget(refusal=(
+                    f"Daily token budget used up ({used} of {TOKEN_BUDGET_PER_USER_DAY} tokens in the last 24 hours). "
+                    "Try again later."
+                ))
+        if session_id is None:
+            return Budget()
+        compact = False
+        if TOKEN_BUDGET_PER_SESSION:
+            used = _session_total(db, session_id)
+            if used >= TOKEN_BUDGET_PER_SESSION:
+                return Budget(refusal=(
+                    f"This chat has used its token budget ({used} of {TOKEN_BUDGET_PER_SESSION} tokens). "
+                    "Start a new chat to continue."
+                ))
+            compact = used >= TOKEN_BUDGET_PER_SESSION * TOKEN_COMPACT_RATIO
+        if TOKEN_COMPACT_PROMPT_TOKENS and not compact:
+            compact = _last_turn_prompt_per_call(db, session_id) >= TOKEN_COMPACT_PROMPT_TOKENS
+        return Budget(compact=compact)
+    finally:
+        db.close()
+
+
+def _usage_dict(row) -> Dict[str, Any]:
+    return {
+        "calls": row.calls or 0,
+        "prompt_tokens": row.prompt_tokens or 0,
+        "completion_tokens": row.completion_tokens or 0,
+        "total_tokens": (row.prompt_tokens or 0) + (row.completion_tokens or 0),
+        "latency_ms": row.latency_ms or 0,
+    }
+
+
+_SUMS = (
+    func.sum(TokenUsage.calls).label("calls"),
+    func.sum(TokenUsage.prompt_tokens).label("prompt_tokens"),
+    func.sum(TokenUsage.completion_tokens).label("completion_tokens"),
+    func.sum(TokenUsage.latency_ms).label("latency_ms"),
+)
+
+
+def session_usage(db: Session, session_id: int, turn_limit: int = 50) -> Dict[str, Any]:
+    """Session totals, per-tier totals and the most recent turns (newest first)."""
+    totals = db.query(*_SUMS).filter(TokenUsage.session_id == session_id).one()
+    tiers = (
+        db.query(TokenUsage.tier, TokenUsage.model, *_SUMS)
+        .filter(TokenUsage.session_id == session_id)
+        .group_by(TokenUsage.tier, TokenUsage.model)
+        .all()
+    )
+    turns = (
+        db.query(TokenUsage.turn_id, func.min(TokenUsage.created_at).label("created_at"), *_SUMS)
+        .filter(TokenUsage.session_id == session_id)
+        .group_by(TokenUsage.turn_id)
+        .order_by(func.max(TokenUsage.id).desc())
+        .limit(turn_limit)
+        .all()
+    )
+    result = {
+        "session_id": session_id,
+        **_usage_dict(totals),
+        "tiers": [{"tier": t.tier, "model": t.model, **_usage_dict(t)} for t in tiers],
+        "turns": [{"turn_id": t.turn_id, "created_at": t.created_at.isoformat(), **_usage_dict(t)} for t in turns],
+    }
+    if TOKEN_BUDGET_PER_SESSION:
+        result["budget"] = TOKEN_BUDGET_PER_SESSION
+        result["remaining"] = max(TOKEN_BUDGET_PER_SESSION - result["total_tokens"], 0)
+    return result
+
+
+def user_usage(db: Session, user: str) -> Dict[str, Any]:
+    """A user's usage over the budget window (last 24 hours)."""
+    since = datetime.utcnow() - USER_WINDOW
+    totals = db.query(*_SUMS).filter(TokenUsage.user == user, TokenUsage.created_at >= since).one()
+    result = {"user": user, "window_hours": int(USER_WINDOW.total_seconds() // 3600), **_usage_dict(totals)}
+    if TOKEN_BUDGET_PER_USER_DAY:
+        result["budget"] = TOKEN_BUDGET_PER_USER_DAY
+        result["remaining"] = max(TOKEN_BUDGET_PER_USER_DAY - result["total_tokens"], 0)
+    return result
+
+
+def budget_config() -> Dict[str, Any]:
+    return {
+        "per_session": TOKEN_BUDGET_PER_SESSION,
+        "per_user_day": TOKEN_BUDGET_PER_USER_DAY,
+        "compact_ratio": TOKEN_COMPACT_RATIO,
+        "compact_prompt_tokens": TOKEN_COMPACT_PROMPT_TOKENS,
+        "compact_keep_messages": TOKEN_COMPACT_KEEP_MESSAGES,
+    }
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Generator, AsyncGenerator, Callable, Iterable, Union, Set, Tuple
+from database import SessionLocal, TurnEvent, retry_on_locked
+import process_sync
+import profiling
+
+# Finished turns stay resumable for this long (seconds)
+TURN_RETENTION_SECONDS = int(os.getenv("TURN_RETENTION_SECONDS", "600"))
+# How long a reader waits for the next event before sending a keep-alive
+TURN_KEEPALIVE_SECONDS = float(os.getenv("TURN_KEEPALIVE_SECONDS", "15"))
+# Multi-worker mode: events are also written to turn_events so a client that
+# reconnects through a different worker can resume; that worker polls the table.
+TURN_POLL_SECONDS = float(os.getenv("TURN_POLL_SECONDS", "0.25"))
+TURN_PURGE_INTERVAL_SECONDS = 60
+
+
+class Turn:
+    """
+    A single agent turn running independently of any HTTP connection.
+    Every event the agent yields is buffered with a sequence number so that
+    clients can reconnect and continue from the last event they saw.
+    """
+
+    def __init__(self, turn_id: str):
+        self.turn_id = turn_id
+        self.events: List[str] = []
+        self.done = False
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cond = threading.Condition()
+        # Async readers (event loop, wake-up event); woken from the agent thread
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, wake in list(self._waiters):
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                # That reader's event loop is already closed
+                self._waiters.discard((loop, wake))
+
+    def append(self, line: str):
+        """Tags an NDJSON line from the agent with turn id + sequence number and buffers it."""
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = {"type": "log", "content": line.strip()}
+        with self._cond:
+            event["turn_id"] = self.turn_id
+            event["seq"] = len(self.events) + 1
+            payload = json.dumps(event) + "\n"
+            if process_sync.MULTI_WORKER:
+                _persist(self.turn_id, event["seq"], payload)
+            self.events.append(payload)
+            self._notify()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self.finished_at = time.time()
+            self._notify()
+
+    def read(self, after_seq: int = 0) -> Generator[str, None, None]:
+        """
+        Yields buffered events with seq > after_seq, then follows the live turn
+        until it finishes. Closing this generator never stops the turn itself.
+        """
+        next_index = max(after_seq, 0)
+        while True:
+            with self._cond:
+                if next_index >= len(self.events) and not self.done:
+                    self._cond.wait(timeout=TURN_KEEPALIVE_SECONDS)
+                pending = self.events[next_index:]
+                finished = self.done
+            if pending:
+                next_index += len(pending)
+                for line in pending:
+                    yield line
+            elif finished:
+                return
+            else:
+                # Keep idle mobile connections (and proxies) from timing out
+                yield json.dumps({"type": "keepalive", "turn_id": self.turn_id, "seq": next_index}) + "\n"
+
+    async def aread(self, after_seq: int = 0) -> AsyncGenerator[str, None]:
+        """read() for event-loop callers: waits on an asyncio.Event instead of parking a thread."""
+        wake = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wake)
+        with self._cond:
+            self._waiters.add(waiter)
+        try:
+            next_index = max(after_seq, 0)
+            while True:
+                with self._cond:
+                    pending = self.events[next_index:]
+                    finished = self.done
+                    if not pending and not finished:
+                        wake.clear()
+                if pending:
+                    next_index += len(pending)
+                    for line in pending:
+                        yield line
+                elif finished:
+                    return
+                else:
+                    try:
+                        await asyncio.wait_for(wake.wait(), timeout=TURN_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield json.dumps({"type": "keepalive", "turn_id": self.turn_id, "seq": next_index}) + "\n"
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+    def expired(self, now: float) -> bool:
+        return self.done and self.finished_at is not None and now - self.finished_at > TURN_RETENTION_SECONDS
+
+
+class RemoteTurn:
+    """
+    A turn running in another worker process, followed through turn_events.
+    Offers the same read()/aread() as Turn.
+    """
+
+    def __init__(self, turn_id: str):
+        self.turn_id = turn_id
+
+    def _fetch(self, after_seq: int) -> List[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(TurnEvent.payload).filter(
+                TurnEvent.turn_id == self.turn_id, TurnEvent.seq > after_seq
+            ).order_by(TurnEvent.seq).all()
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    def read(self, after_seq: int = 0) -> Generator[str, None, None]:
+        next_seq = max(after_seq, 0)
+        last_event = last_yield = time.time()
+        while True:
+            pending = self._fetch(next_seq)
+            now = time.time()
+            if pending:
+                last_event = last_yield = now
+                for line in pending:
+                    next_seq += 1
+                    yield line
+                    if json.loads(line).get("type") == "done":
+                        return
+                continue
+            if now - last_event > TURN_RETENTION_SECONDS:
+                # The owning worker died mid-turn; nothing more will arrive
+                return
+            if now - last_yield >= TURN_KEEPALIVE_SECONDS:
+                last_yield = now
+                yield json.dumps({"type": "keepalive", "turn_id": self.turn_id, "seq": next_seq}) + "\n"
+            time.sleep(TURN_POLL_SECONDS)
+
+    async def aread(self, after_seq: int = 0) -> AsyncGenerator[str, None]:
+        """read() for event-loop callers: polls between short DB reads instead of sleeping in a thread."""
+        next_seq = max(after_seq, 0)
+        last_event = last_yield = time.time()
+        while True:
+            pending = await asyncio.to_thread(self._fetch, next_seq)
+            now = time.time()
+            if pending:
+                last_event = last_yield = now
+                for line in pending:
+                    next_seq += 1
+                    yield line
+                    if json.loads(line).get("type") == "done":
+                        return
+                continue
+            if now - last_event > TURN_RETENTION_SECONDS:
+                return
+            if now - last_yield >= TURN_KEEPALIVE_SECONDS:
+                last_yield = now
+                yield json.dumps({"type": "keepalive", "turn_id": self.turn_id, "seq": next_seq}) + "\n"
+            await asyncio.sleep(TURN_POLL_SECONDS)
+
+
+_turns: Dict[str, Turn] = {}
+_turns_lock = threading.Lock()
+_last_shared_purge = 0.0
+
+
+@retry_on_locked
+def _insert_event(db, turn_id: str, seq: int, payload: str):
+    db.add(TurnEvent(turn_id=turn_id, seq=seq, payload=payload))
+    db.commit()
+
+
+def _persist(turn_id: str, seq: int, payload: str):
+    db = SessionLocal()
+    try:
+        _insert_event(db, turn_id, seq, payload)
+    except Exception as e:
+        # Local readers still get the event; only cross-worker resume is affected
+        print(f"Failed to persist turn event {turn_id}#{seq}: {e}")
+    finally:
+        db.close()
+
+
+def _remote_turn(turn_id: str) -> Optional[RemoteTurn]:
+    if not process_sync.MULTI_WORKER:
+        return None
+    db = SessionLocal()
+    try:
+        known = db.query(TurnEvent.seq).filter(TurnEvent.turn_id == turn_id).first()
+    finally:
+        db.close()
+    return RemoteTurn(turn_id) if known else None
+
+
+@retry_on_locked
+def _delete_old_events(db, cutoff: datetime):
+    db.query(TurnEvent).filter(TurnEvent.created_at < cutoff).delete()
+    db.commit()
+
+
+def _purge_expired():
+    global _last_shared_purge
+    now = time.time()
+    with _turns_lock:
+        for turn_id in [t for t, turn in _turns.items() if turn.expired(now)]:
+            del _turns[turn_id]
+        purge_shared = process_sync.MULTI_WORKER and now - _last_shared_purge > TURN_PURGE_INTERVAL_SECONDS
+        if purge_shared:
+            _last_shared_purge = now
+    if purge_shared:
+        # Generous cutoff: a turn's first events are as old as the turn itself
+        cutoff = datetime.utcnow() - timedelta(seconds=2 * TURN_RETENTION_SECONDS)
+        db = SessionLocal()
+        try:
+            _delete_old_events(db, cutoff)
+        finally:
+            db.close()
+
+
+def _run(turn: Turn, events: Iterable[str], profile: Optional[profiling.Profile] = None):
+    with profiling.attach_thread(profile):
+        try:
+            for line in events:
+                turn.append(line)
+        except Exception as e:
+            turn.append(json.dumps({"type": "error", "content": str(e)}))
+        finally:
+            turn.append(json.dumps({"type": "done", "content": "Turn finished"}))
+            turn.finish()
+
+
+def start_turn(run: Callable[[], Iterable[str]], turn_id: Optional[str] = None) -> Union[Turn, RemoteTurn]:
+    """
+    Starts `run()` on a background thread and returns its Turn.
+    If the client supplied a turn_id that is already known (here or, in
+    multi-worker mode, in another worker), the existing turn is returned
+    instead, so a retried POST never re-runs the agent.
+    """
+    _purge_expired()
+    with _turns_lock:
+        if turn_id and turn_id in _turns:
+            return _turns[turn_id]
+    remote = _remote_turn(turn_id) if turn_id else None
+    if remote:
+        return remote
+    with _turns_lock:
+        if turn_id and turn_id in _turns:
+            return _turns[turn_id]
+        turn = Turn(turn_id or uuid.uuid4().hex)
+        _turns[turn.turn_id] = turn
+
+    # A profiled request keeps its profile open until the turn itself finishes
+    profile = profiling.current()
+    if profile:
+        profile.begin()
+    thread = threading.Thread(target=_run, args=(turn, run(), profile), daemon=True, name=f"turn-{turn.turn_id[:8]}")
+    thread.start()
+    return turn
+
+
+def get_turn(turn_id: str) -> Optional[Union[Turn, RemoteTurn]]:
+    """Returns a live or recently finished turn, or None if unknown/expired."""
+    _purge_expired()
+    with _turns_lock:
+        turn = _turns.get(turn_id)
+    return turn or _remote_turn(turn_id)
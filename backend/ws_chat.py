@@ -0,0 +1,237 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from agent import run_agent_stream
+from turns import start_turn
+import memory
+import admission
+import archive
+from database import SessionLocal
+from chat_storage import (
+    create_chat_session, save_message, get_chat_sessions,
+    get_chat_session, delete_chat_session, update_session_title,
+    session_to_dict
+)
+
+router = APIRouter(tags=["chat"])
+
+# Server heartbeat interval; a client silent for WS_IDLE_TIMEOUT seconds is dropped
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "90"))
+# Outgoing frames buffered per connection before producers are paused (backpressure)
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Turns a single connection may have streaming at once
+WS_MAX_ACTIVE_TURNS = int(os.getenv("WS_MAX_ACTIVE_TURNS", "2"))
+
+
+def _with_db(fn, *args, **kwargs):
+    """Runs a chat_storage call with its own DB session (called from a worker thread)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+def _save_and_describe(request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Saves a message and returns its id + the updated session, or None if the session doesn't exist."""
+    db = SessionLocal()
+    try:
+        if not archive.ensure_hot(db, request["session_id"]):
+            return None
+        message = save_message(
+            db,
+            session_id=request["session_id"],
+            role=request["role"],
+            content=request.get("content"),
+            tool_call_id=request.get("tool_call_id"),
+            tool_calls=request.get("tool_calls"),
+            name=request.get("name")
+        )
+        session = get_chat_session(db, request["session_id"])
+        return {
+            "message_id": message.id,
+            "session": session_to_dict(session) if session else None
+        }
+    finally:
+        db.close()
+
+
+def _session_dict(session_id: int, include_messages: bool = False) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        archive.ensure_hot(db, session_id)
+        session = get_chat_session(db, session_id)
+        return session_to_dict(session, include_messages=include_messages) if session else None
+    finally:
+        db.close()
+
+
+class ChatConnection:
+    """
+    One long-lived client connection. Multiplexes chat turns, persistence acks
+    and session updates; all outgoing frames go through a bounded queue so a
+    slow client pauses the producers instead of growing memory.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.turn_tasks: Dict[str, asyncio.Task] = {}
+        self.user = admission.client_key(websocket.headers, websocket.client.host if websocket.client else None)
+
+    async def send(self, frame: Dict[str, Any]):
+        # Blocks while the outbox is full -> natural backpressure on turn readers
+        await self.outbox.put(frame)
+
+    async def writer(self):
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(frame))
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            await self.send({"op": "heartbeat"})
+
+    async def stream_turn(self, request_id: Any, turn, last_seq: int = 0):
+        """Forwards buffered turn events to the socket. The turn keeps running if this is cancelled."""
+        try:
+            async for line in turn.aread(last_seq):
+                event = json.loads(line)
+                if event.get("type") == "keepalive":
+                    continue
+                await self.send({"op": "turn_event", "id": request_id, "event": event})
+        finally:
+            self.turn_tasks.pop(turn.turn_id, None)
+
+    async def handle(self, frame: Dict[str, Any]):
+        op = frame.get("op")
+        request_id = frame.get("id")
+
+        if op == "ping":
+            await self.send({"op": "pong", "id": request_id})
+
+        elif op == "chat":
+            active = [t for t in self.turn_tasks.values() if not t.done()]
+            if len(active) >= WS_MAX_ACTIVE_TURNS:
+                await self.send({"op": "error", "id": request_id, "content": "Too many active turns on this connection"})
+                return
+            messages = frame.get("messages") or []
+            turn_id = frame.get("turn_id") or uuid.uuid4().hex
+            # start_turn may look the turn up in SQLite (multi-worker), so keep it off the event loop
+            turn = await asyncio.to_thread(
+                start_turn,
+                lambda: admission.CONTROLLER.run(
+                    self.user, lambda: run_agent_stream(messages, frame.get("session_id"), turn_id, self.user)
+                ),
+                turn_id
+            )
+            await self.send({"op": "turn_started", "id": request_id, "turn_id": turn.turn_id})
+            if turn.turn_id not in self.turn_tasks:
+                self.turn_tasks[turn.turn_id] = asyncio.create_task(
+                    self.stream_turn(request_id, turn, frame.get("last_seq") or 0)
+                )
+
+        elif op == "save_message":
+            result = await asyncio.to_thread(_save_and_describe, frame)
+            if result is None:
+                await self.send({"op": "error", "id": request_id, "content": "Session not found"})
+                return
+            await self.send({"op": "ack", "id": request_id, "message_id": result["message_id"]})
+            if result["session"]:
+                await self.send({"op": "session_updated", "session": result["session"]})
+
+        elif op == "create_session":
+            session = await asyncio.to_thread(
+                _with_db, lambda db: session_to_dict(create_chat_session(db, title=frame.get("title")))
+            )
+            await self.send({"op": "session", "id": request_id, "session": session})
+
+        elif op == "list_sessions":
+            sessions = await asyncio.to_thread(
+                _with_db, lambda db: [session_to_dict(s) for s in get_chat_sessions(db)]
+                + [archive.archived_session_to_dict(s) for s in archive.get_archived_sessions(db)]
+            )
+            await self.send({"op": "sessions", "id": request_id, "sessions": sessions})
+
+        elif op == "get_session":
+            session = await asyncio.to_thread(_session_dict, frame.get("session_id"), True)
+            if session is None:
+                await self.send({"op": "error", "id": request_id, "content": "Session not found"})
+            else:
+                await self.send({"op": "session", "id": request_id, "session": session})
+
+        elif op == "update_session":
+            session = await asyncio.to_thread(
+                _with_db, lambda db: archive.ensure_hot(db, frame["session_id"])
+                and update_session_title(db, frame["session_id"], frame["title"])
+            )
+            if not session:
+                await self.send({"op": "error", "id": request_id, "content": "Session not found"})
+            else:
+                session = await asyncio.to_thread(_session_dict, frame["session_id"])
+                await self.send({"op": "session_updated", "id": request_id, "session": session})
+
+        elif op == "delete_session":
+            success = await asyncio.to_thread(
+                _with_db, lambda db: delete_chat_session(db, frame["session_id"])
+                or archive.delete_archived_session(db, frame["session_id"])
+            )
+            if success:
+                memory.INDEX.forget_session(frame.get("session_id"))
+                await self.send({"op": "session_deleted", "id": request_id, "session_id": frame.get("session_id")})
+            else:
+                await self.send({"op": "error", "id": request_id, "content": "Session not found"})
+
+        else:
+            await self.send({"op": "error", "id": request_id, "content": f"Unknown op '{op}'"})
+
+    async def reader(self):
+        while True:
+            try:
+                text = await asyncio.wait_for(self.websocket.receive_text(), timeout=WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self.websocket.close(code=1001)
+                return
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                await self.send({"op": "error", "content": "Invalid JSON frame"})
+                continue
+            request_id, op = frame.get("id"), frame.get("op")
+            try:
+                await self.handle(frame)
+            except (KeyError, TypeError) as e:
+                await self.send({"op": "error", "id": request_id, "content": f"Bad request: {e}"})
+            except Exception as e:
+                # One failing frame (DB error, bad value) must not take the connection down
+                print(f"WebSocket frame '{op}' failed: {e}")
+                await self.send({"op": "error", "id": request_id, "content": f"Request failed: {e}"})
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    Persistent chat transport. Frames are JSON objects with an `op` field;
+    responses echo the client's `id` so requests can be pipelined.
+    """
+    await websocket.accept()
+    conn = ChatConnection(websocket)
+    tasks = [
+        asyncio.create_task(conn.writer()),
+        asyncio.create_task(conn.heartbeat()),
+    ]
+    try:
+        await conn.reader()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Turns keep running server-side; the client can resume them by turn_id
+        for task in tasks + list(conn.turn_tasks.values()):
+            task.cancel()
@@ -26,6 +26,9 @@ type ChatSession = {
   message_count?: number;
 };
 
+// How many times a dropped /chat stream is resumed before giving up
+const MAX_RESUME_ATTEMPTS = 5;
+
 type ThinkingState = {
   isActive: boolean;
   message: string;
@@ -260,61 +263,92 @@ function App() {
     });
     addLog('status', 'Sending request to Agent...');
 
+    // The backend runs the turn independently of this connection. If the stream
+    // drops (flaky mobile network), re-POST with the same turn_id and the last
+    // seq we saw to resume without re-running the agent.
+    const turnId = crypto.randomUUID
+      ? crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    let lastSeq = 0;
+    let turnDone = false;
+    let attempt = 0;
+    let currentAnswer = '';
+
     try {
-      const response = await fetch(`${API_BASE_URL}/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ messages: newMessages }),
-      });
+      while (!turnDone) {
+        try {
+          const response = await fetch(`${API_BASE_URL}/chat`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ messages: newMessages, turn_id: turnId, last_seq: lastSeq, session_id: currentSessionId }),
+          });
+
+          if (!response.body) throw new Error("No response body");
+
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop() || '';
+
+            for (const line of lines) {
+              if (!line.trim()) continue;
+              try {
+                const event = JSON.parse(line);
+
+                if (event.type === 'keepalive') continue;
+                if (event.seq) {
+                  if (event.seq <= lastSeq) continue;
+                  lastSeq = event.seq;
+                }
 
-      if (!response.body) throw new Error("No response body");
-
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
-      let buffer = '';
-      let currentAnswer = '';
-
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split('\n');
-        buffer = lines.pop() || '';
-
-        for (const line of lines) {
-          if (!line.trim()) continue;
-          try {
-            const event = JSON.parse(line);
-
-            if (event.type === 'status') {
-              addLog('status', event.content);
-              updateThinkingState(event.content);
-            } else if (event.type === 'log') {
-              addLog('log', event.content, event.data);
-              updateThinkingState(event.content);
-            } else if (event.type === 'history_append') {
-              const msg = event.data;
-              setMessages(prev => [...prev, msg]);
-              await saveMessageToDB(msg);
-            } else if (event.type === 'answer') {
-              currentAnswer = event.content;
-              setMessages(prev => {
-                const last = prev[prev.length - 1];
-                const answerMsg = { role: 'assistant' as const, content: currentAnswer };
-                if (last?.role === 'assistant' && last.content !== null) {
-                  return [...prev.slice(0, -1), answerMsg];
-                } else {
-                  saveMessageToDB(answerMsg);
-                  return [...prev, answerMsg];
+                if (event.type === 'status') {
+                  addLog('status', event.content);
+                  updateThinkingState(event.content);
+                } else if (event.type === 'log') {
+                  addLog('log', event.content, event.data);
+                  updateThinkingState(event.content);
+                } else if (event.type === 'history_append') {
+                  const msg = event.data;
+                  setMessages(prev => [...prev, msg]);
+                  await saveMessageToDB(msg);
+                } else if (event.type === 'answer') {
+                  currentAnswer = event.content;
+                  setMessages(prev => {
+                    const last = prev[prev.length - 1];
+                    const answerMsg = { role: 'assistant' as const, content: currentAnswer };
+                    if (last?.role === 'assistant' && last.content !== null) {
+                      return [...prev.slice(0, -1), answerMsg];
+                    } else {
+                      saveMessageToDB(answerMsg);
+                      return [...prev, answerMsg];
+                    }
+                  });
+                } else if (event.type === 'error') {
+                  addLog('error', event.content);
+                } else if (event.type === 'done') {
+                  turnDone = true;
                 }
-              });
-            } else if (event.type === 'error') {
-              addLog('error', event.content);
+              } catch (e) {
+                console.error("Parse error", e);
+              }
             }
-          } catch (e) {
-            console.error("Parse error", e);
           }
+        } catch (error) {
+          console.warn("Agent stream interrupted", error);
+        }
+
+        if (!turnDone) {
+          attempt += 1;
+          if (attempt > MAX_RESUME_ATTEMPTS) throw new Error("Lost connection to Agent");
+          addLog('status', `Connection lost, resuming turn (attempt ${attempt})...`);
+          await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
         }
       }
 